@@ -1,4 +1,5 @@
 from .access import *
 from .query import *
 from .post import *
+from .stream import *
 from .error import *
@@ -1,27 +1,95 @@
 from flask import Blueprint, request, jsonify
 
-from game_data import player_database, game_database, Deserializable
+from game_data import game_writer, Deserializable
+from .arguments import parse_count_arg, parse_date_arg, parse_limit_arg
+from .cache import cached_json_response
+from .error import *
 
 access_blueprint = Blueprint("/api/access", __name__)
 """/api/access"""
 
+HISTORY_QUERY_ARGS = ("from", "to", "game_type", "order", "limit", "offset", "cursor")
+"""游戏历史的查询参数，均未提供时返回全部游戏"""
+
 
 @access_blueprint.route("/leader_board")
 def get_leader_board():
-    """获取排行榜"""
-    player_database.update()
-    return jsonify(
-        Deserializable.serialize_object(
-            player_database.leader_board, exclude_non_repr=False
+    """获取排行榜，参数可选：{"as_of": ISO 时间（不包含）}
+
+    提供 as_of 时返回该时间之前进行过游戏的玩家当时的排名"""
+    if "as_of" in request.args:
+        try:
+            date = parse_date_arg("as_of")
+        except ValueError:
+            return bad_data_handler()
+        leader_board = game_writer.snapshot.leader_board_as_of(date)
+        return jsonify(
+            Deserializable.serialize_object(leader_board, exclude_non_repr=False)
         )
+    return cached_json_response(
+        "leader_board",
+        lambda snapshot: Deserializable.serialize_object(
+            snapshot.leader_board, exclude_non_repr=False
+        ),
     )
 
 
 @access_blueprint.route("/game_history")
 def get_game_history():
-    """获取所有历史游戏列表"""
-    return jsonify(
-        Deserializable.serialize_object(
-            game_database.game_history, exclude_non_repr=False
+    """获取历史游戏列表（按时间顺序），参数均可选：
+    {"from": ISO 时间（包含）, "to": ISO 时间（不包含）, "game_type": str,
+    "order": "asc" | "desc", "limit": int, "offset": int, "cursor": str}
+
+    limit 默认为 DEFAULT_PAGE_SIZE，最多为 MAX_PAGE_SIZE（不提供任何参数时返回全部游戏）；
+    cursor 为上一页响应头 X-Next-Cursor 中的游戏 ID，从该游戏之后继续；
+    响应头 X-Total-Count 为符合条件的游戏总数"""
+    if not any(arg in request.args for arg in HISTORY_QUERY_ARGS):
+        return cached_json_response(
+            "game_history",
+            lambda snapshot: Deserializable.serialize_object(
+                snapshot.game_history, exclude_non_repr=False
+            ),
         )
-    )
+
+    try:
+        start = parse_date_arg("from")
+        end = parse_date_arg("to")
+        limit = parse_limit_arg()
+        offset = parse_count_arg("offset") or 0
+        descending = request.args.get("order", "asc") == "desc"
+    except ValueError:
+        return bad_data_handler()
+    snapshot = game_writer.snapshot
+    history, lo, hi = snapshot.query_history(request.args.get("game_type"), start, end)
+    total = hi - lo
+
+    # 从 cursor 之后继续
+    cursor = request.args.get("cursor")
+    if cursor is not None:
+        try:
+            index = snapshot.history_index(history, cursor)
+        except KeyError:
+            raise InvalidIdException()
+        if descending:
+            hi = min(hi, index)
+        elif index < len(history) and history[index].game_id == cursor:
+            lo = max(lo, index + 1)
+        else:
+            lo = max(lo, index)
+
+    if descending:
+        hi = max(lo, hi - offset)
+        begin = max(lo, hi - limit)
+        page = history[begin:hi][::-1]
+        has_more = begin > lo
+    else:
+        lo = min(hi, lo + offset)
+        stop = min(hi, lo + limit)
+        page = history[lo:stop]
+        has_more = stop < hi
+
+    response = jsonify(Deserializable.serialize_object(page, exclude_non_repr=False))
+    response.headers["X-Total-Count"] = str(total)
+    if has_more and page:
+        response.headers["X-Next-Cursor"] = page[-1].game_id
+    return response
@@ -0,0 +1,46 @@
+"""读取请求参数"""
+from datetime import datetime
+from typing import Optional
+
+from flask import request
+
+DEFAULT_PAGE_SIZE = 50
+"""分页查询未提供 limit 时每页的数量"""
+
+MAX_PAGE_SIZE = 500
+"""分页查询每页的最大数量，limit 超过时按此数量返回"""
+
+
+def parse_date_arg(name: str) -> Optional[datetime]:
+    """读取 ISO 格式的时间参数（不带时区）"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    date = datetime.fromisoformat(value)
+    if date.tzinfo is not None:
+        raise ValueError(f"时间参数不能带有时区：{value}")
+    return date
+
+
+def parse_count_arg(name: str) -> Optional[int]:
+    """读取非负整数参数"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    count = int(value)
+    if count < 0:
+        raise ValueError(f"参数不能为负数：{value}")
+    return count
+
+
+def parse_limit_arg() -> int:
+    """读取分页查询的 limit 参数，未提供时为 DEFAULT_PAGE_SIZE，最多为 MAX_PAGE_SIZE"""
+    limit = parse_count_arg("limit")
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_flag_arg(name: str) -> bool:
+    """读取布尔参数（1 或 true 为真）"""
+    return request.args.get(name, "").lower() in ("1", "true")
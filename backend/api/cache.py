@@ -0,0 +1,35 @@
+"""按照数据库版本缓存编码后的 JSON 响应"""
+import hashlib
+from typing import Any, Callable, Dict, Tuple
+
+from flask import Response, jsonify, request
+
+from game_data import DataSnapshot, game_writer, update_feed
+
+_cached_responses: Dict[str, Tuple[int, bytes, str]] = {}
+"""每个缓存键对应的 (数据库版本, JSON 字节, ETag)"""
+
+
+def cached_json_response(
+    cache_key: str, build: Callable[[DataSnapshot], Any]
+) -> Response:
+    """返回 build(快照) 结果的 JSON 响应，使用写入线程最新发布的快照
+
+    快照版本不变时直接使用缓存的字节；请求的 If-None-Match 与 ETag 相同时返回 304
+
+    响应头 X-Data-Version 为快照的版本 ID，可以用于订阅之后的变化（/api/stream/updates）"""
+    snapshot = game_writer.snapshot
+    version = snapshot.version
+    cached = _cached_responses.get(cache_key)
+    if cached is None or cached[0] != version:
+        data = jsonify(build(snapshot)).get_data()
+        cached = (version, data, hashlib.sha1(data).hexdigest())
+        _cached_responses[cache_key] = cached
+    _, data, etag = cached
+
+    response = Response(data, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["X-Data-Version"] = update_feed.version_id(version)
+    # 允许浏览器缓存，但每次都需要验证 ETag
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -15,3 +15,7 @@ def no_key_handler():
 
 def bad_data_handler():
     return {"error": "Invalid data sent"}, 400
+
+
+def busy_handler():
+    return {"error": "Server busy"}, 503
@@ -1,9 +1,10 @@
 import json
+import queue
 from pprint import pprint
 
 from flask import Blueprint, request, jsonify
 
-from game_data import game_controller, tenhou_parse_id
+from game_data import upload_jobs
 from .error import *
 
 post_blueprint = Blueprint("/api/post", __name__)
@@ -12,29 +13,32 @@ post_blueprint = Blueprint("/api/post", __name__)
 
 @post_blueprint.route("/tenhou_game", methods=["POST"])
 def upload_tenhou_game():
-    """上传天凤 JSON 文件
+    """上传天凤 JSON 文件（异步录入）
 
     上传格式：{key1: game_json, key2: game_json, ...}
-    返回格式：{key1: "ok", key2: "error_msg", ...}
+    返回格式：{"job_id": str}，通过 /jobs/<job_id> 查询每个 key 的结果
     """
     try:
         payload = json.loads(request.data.decode())
         assert isinstance(payload, dict)
     except (UnicodeDecodeError, json.JSONDecodeError, AssertionError):
         return bad_data_handler()
-    result = {}
-    for key, game_json in payload.items():
-        try:
-            game_obj = json.loads(game_json)
-            external_id = tenhou_parse_id(game_obj)
-            if external_id in game_controller.game_database.external_id_map:
-                result[key] = "游戏数据已存在"
-                continue
-            game_controller.load_from_tenhou_json(json.loads(game_json))
-            with open(f"data/tenhou/upload-{external_id}.json", "w") as f:
-                f.write(game_json)
-            # game_controller.save()
-            result[key] = "上传成功"
-        except (TypeError, KeyError, json.JSONDecodeError):
-            result[key] = "解析失败"
-    return result, 200
+    # 保存到 spool 目录后立即返回，由写入线程在后台录入
+    try:
+        job_id = upload_jobs.submit(request.data)
+    except queue.Full:
+        return busy_handler()
+    return {"job_id": job_id}, 202
+
+
+@post_blueprint.route("/jobs/<job_id>")
+def get_upload_job(job_id: str):
+    """查询上传任务
+
+    返回格式：{"status": "pending"}
+    或 {"status": "done", "result": {key1: "上传成功" | "游戏数据已存在" | "解析失败", ...}}
+    """
+    status = upload_jobs.status(job_id)
+    if status is None:
+        raise InvalidIdException()
+    return status
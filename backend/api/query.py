@@ -1,21 +1,118 @@
+import dataclasses
+
 from flask import Blueprint, request, jsonify
 
-from game_data import player_database, game_database
+from game_data import (
+    game_database,
+    game_writer,
+    Deserializable,
+    PlayerData,
+)
+from game_data.player.rating_series import bucket_indices, lttb_indices
+from .arguments import parse_count_arg, parse_flag_arg, parse_limit_arg
 from .error import *
 
 query_blueprint = Blueprint("/api/query", __name__)
 """/api/query"""
 
 
+def serialize_player_summary(player: PlayerData) -> dict:
+    """玩家信息，不包含游戏记录（游戏记录通过 /player_games 分页获取）"""
+    return {
+        f.name: Deserializable.serialize_object(
+            getattr(player, f.name), exclude_non_repr=False
+        )
+        for f in dataclasses.fields(player)
+        if f.name not in ("game_ids", "game_history", "rating_series")
+    }
+
+
 @query_blueprint.route("/player")
 def query_player():
-    """获取玩家信息，参数：{"player_id": str}"""
+    """获取玩家信息，参数：{"player_id": str, "summary": bool（可选，不包含游戏记录）}
+
+    完整的响应包含所有游戏记录（其中已有游戏 ID，不再重复返回 game_ids）"""
     try:
         player_id = request.args.get("player_id")
-        player = player_database.get_player(player_id)
-        return jsonify(player.serialize(exclude_non_repr=False))
+        player = game_writer.snapshot.players[player_id]
+    except KeyError:
+        raise InvalidIdException()
+    response = serialize_player_summary(player)
+    if not parse_flag_arg("summary"):
+        response["game_history"] = Deserializable.serialize_object(
+            player.game_history, exclude_non_repr=False
+        )
+    return jsonify(response)
+
+
+@query_blueprint.route("/player_games")
+def query_player_games():
+    """分页获取玩家的游戏记录，参数：
+    {"player_id": str, "order": "asc" | "desc", "limit": int, "offset": int}
+
+    limit 默认为 DEFAULT_PAGE_SIZE，最多为 MAX_PAGE_SIZE；
+    响应头 X-Total-Count 为玩家的游戏总数"""
+    try:
+        player = game_writer.snapshot.players[request.args.get("player_id")]
+    except KeyError:
+        raise InvalidIdException()
+    try:
+        limit = parse_limit_arg()
+        offset = parse_count_arg("offset") or 0
+        descending = request.args.get("order", "asc") == "desc"
+    except ValueError:
+        return bad_data_handler()
+
+    history = player.game_history
+    total = len(history)
+    if descending:
+        stop = max(0, total - offset)
+        begin = max(0, stop - limit)
+        page = history[begin:stop][::-1]
+    else:
+        begin = min(total, offset)
+        stop = min(total, begin + limit)
+        page = history[begin:stop]
+
+    response = jsonify(Deserializable.serialize_object(page, exclude_non_repr=False))
+    response.headers["X-Total-Count"] = str(total)
+    return response
+
+
+@query_blueprint.route("/player_rating_series")
+def query_player_rating_series():
+    """获取玩家每盘游戏之后的段位、分数和 R 值（按时间顺序），参数：
+    {"player_id": str, "points": int（可选，最多返回的点数）,
+    "method": "lttb" | "bucket", "value": "pt" | "r"}
+
+    提供 points 时在服务端降采样：lttb 按 value 指定的曲线保留形状（默认），
+    bucket 将游戏平均分段并取每段最后一盘之后的积分；
+    响应头 X-Total-Count 为玩家的游戏总数"""
+    try:
+        series = game_writer.snapshot.players[request.args.get("player_id")].series
     except KeyError:
         raise InvalidIdException()
+    try:
+        n_points = parse_count_arg("points")
+    except ValueError:
+        return bad_data_handler()
+    method = request.args.get("method", "lttb")
+    value = request.args.get("value", "pt")
+    if method not in ("lttb", "bucket") or value not in ("pt", "r"):
+        return bad_data_handler()
+
+    total = len(series)
+    if n_points is None:
+        indices = range(total)
+    elif method == "bucket":
+        indices = bucket_indices(total, n_points)
+    else:
+        ys = series.current_pt if value == "pt" else series.r_value
+        indices = lttb_indices(series.timestamps[:total], ys, n_points)
+
+    response = jsonify(series.sample(indices))
+    response.headers["X-Total-Count"] = str(total)
+    return response
 
 
 @query_blueprint.route("/game")
@@ -23,6 +120,8 @@ def query_game():
     """获取游戏信息，参数：{"game_id": str}"""
     try:
         game_id = request.args.get("game_id")
+        if game_id not in game_writer.snapshot.previews:
+            raise KeyError(game_id)
         game = game_database.get_game(game_id)
         return jsonify(game.serialize(exclude_non_repr=False))
     except KeyError:
@@ -0,0 +1,56 @@
+import time
+
+from flask import Blueprint, Response, request
+
+from game_data import update_feed
+from .error import *
+
+stream_blueprint = Blueprint("/api/stream", __name__)
+"""/api/stream"""
+
+KEEPALIVE_INTERVAL = 15
+"""没有事件时发送注释的间隔（秒），避免连接被代理关闭，并及时发现断开的连接"""
+
+STREAM_DURATION = 600
+"""每个连接的最长时间（秒），之后由客户端自动重新连接（补收断开期间的事件）"""
+
+RETRY_INTERVAL = 3000
+"""客户端断开后重新连接的等待时间（毫秒）"""
+
+
+@stream_blueprint.route("/updates")
+def get_updates():
+    """Server-Sent Events，参数可选：{"version": 已有数据的版本}
+
+    事件 game：{"version": 版本 ID, "game": 游戏摘要, "players": 四名玩家的新快照}，
+    游戏追加在最后，客户端可以直接更新排行榜和游戏历史；
+    事件 refresh：{"version": 版本 ID}，有其他变化（例如重新计算积分），需要重新读取
+
+    事件的 id 为数据版本 ID（与排行榜、游戏历史响应头 X-Data-Version 相同），
+    重新连接时（Last-Event-ID 或 version）先补发之后的事件；
+    版本 ID 来自其他工作进程或重新启动之前时，只发送 refresh 事件"""
+    last_version = request.headers.get("Last-Event-ID") or request.args.get("version")
+    try:
+        if last_version is not None:
+            last_version = update_feed.parse_version_id(last_version)
+    except ValueError:
+        return bad_data_handler()
+    subscription = update_feed.subscribe(last_version)
+    if subscription is None:
+        return busy_handler()
+
+    def stream():
+        # 立即发送响应头
+        yield f"retry: {RETRY_INTERVAL}\n\n".encode()
+        deadline = time.monotonic() + STREAM_DURATION
+        while time.monotonic() < deadline:
+            events = subscription.wait(KEEPALIVE_INTERVAL)
+            yield b"".join(events) if events else b": keep-alive\n\n"
+
+    response = Response(stream(), mimetype="text/event-stream")
+    # 连接断开（包括还没有开始发送）时取消订阅
+    response.call_on_close(lambda: update_feed.unsubscribe(subscription))
+    response.headers["Cache-Control"] = "no-cache"
+    # 禁止 nginx 缓冲，事件立即发送
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,9 @@
+"""性能测试脚本，在 backend 目录下运行，例如：python -m benchmark.serialization
+
+导入 game_data 时会读取当前目录下的数据库和牌谱，因此测试在临时目录中进行"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="wdk_benchmark_"))
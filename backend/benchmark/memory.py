@@ -0,0 +1,83 @@
+"""比较数量最多的几个类使用 __dict__（旧实现）与 __slots__（当前实现）时的内存占用
+
+用法：python -m benchmark.memory [游戏数量]"""
+import gc
+import sys
+import time
+import tracemalloc
+import types
+from contextlib import contextmanager
+
+from game_data.game.round import RoundWin
+from game_data.game.tenhou import RoundFullInfo, TenhouRoundPlayerStatus
+from game_data.game_preview import GamePreview
+from game_data.player_snapshot import PlayerSnapshot
+
+from .synthetic import league
+
+SLOTTED_CLASSES = [
+    PlayerSnapshot,
+    GamePreview,
+    RoundWin,
+    TenhouRoundPlayerStatus,
+    RoundFullInfo,
+]
+"""使用 __slots__ 的类"""
+
+
+def unslotted(cls: type) -> type:
+    """旧实现：字段和方法相同，但使用 __dict__ 保存属性的类"""
+    namespace = {
+        name: value
+        for name, value in cls.__dict__.items()
+        if name not in ("__slots__", "__dict__", "__weakref__")
+        and not isinstance(value, types.MemberDescriptorType)
+    }
+    return type(cls.__name__, cls.__bases__, namespace)
+
+
+@contextmanager
+def legacy_classes():
+    """在 game_data 的所有模块中临时替换为使用 __dict__ 的类"""
+    replacements = {cls: unslotted(cls) for cls in SLOTTED_CLASSES}
+    patched = []
+    for module in list(sys.modules.values()):
+        if not module.__name__.startswith("game_data"):
+            continue
+        for name, value in list(vars(module).items()):
+            if isinstance(value, type) and value in replacements:
+                setattr(module, name, replacements[value])
+                patched.append((module, name, value))
+    try:
+        yield
+    finally:
+        for module, name, value in patched:
+            setattr(module, name, value)
+
+
+def measure(n_games: int) -> int:
+    """生成联赛并返回其占用的内存（字节）"""
+    gc.collect()
+    tracemalloc.start()
+    data = league(n_games)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return size
+
+
+def main(n_games: int):
+    start = time.perf_counter()
+    with legacy_classes():
+        legacy = measure(n_games)
+    current = measure(n_games)
+    print(f"{n_games} 盘游戏（用时 {time.perf_counter() - start:.0f}s）")
+    print(
+        f"内存占用：旧实现 {legacy / 2 ** 20:.1f} MB，当前 {current / 2 ** 20:.1f} MB"
+        f"（减少 {1 - current / legacy:.0%}）"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
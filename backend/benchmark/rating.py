@@ -0,0 +1,69 @@
+"""比较逐盘调用 GameData.update 和 PlayerData.add_game（旧实现）与按列计算（当前实现）
+重新计算全部积分的耗时，并检查两者的结果完全相同
+
+用法：python -m benchmark.rating [游戏数量]"""
+import sys
+import time
+from typing import List
+
+from game_data import GameData, PlayerData
+from game_data.rating import RatingColumns, compute_ratings
+
+from .synthetic import league
+
+def legacy_recompute(games: List[GameData], player_ids: List[str]) -> List[PlayerData]:
+    """旧实现：从新玩家开始，按顺序重新录入每一盘游戏"""
+    players = {
+        player_id: PlayerData.new("", player_id=player_id) for player_id in player_ids
+    }
+    for game in games:
+        game.players = [players[p.player_id].snapshot for p in game.players]
+        game.update()
+        preview = game.preview
+        for p in game.players:
+            players[p.player_id].add_game(preview)
+    return list(players.values())
+
+
+def main(n_games: int):
+    game_database, player_database = league(n_games, rounds=False)
+    games = list(game_database.all_game_data.values())
+    player_ids = list(player_database.all_player_data)
+
+    start = time.perf_counter()
+    columns = RatingColumns.from_games(games, player_ids)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    result = compute_ratings(columns)
+    compute_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    players = legacy_recompute(games, player_ids)
+    legacy = time.perf_counter() - start
+
+    state = result.state
+    same = (
+        result.pt_delta.tolist() == [game.pt_delta for game in games]
+        and result.r_delta.tolist() == [game.r_delta for game in games]
+        and all(
+            (p.current_dan, p.current_pt, p.highest_dan, p.highest_dan_pt, p.r_value)
+            == (
+                state.current_dan[i],
+                state.current_pt[i],
+                state.highest_dan[i],
+                state.highest_dan_pt[i],
+                state.r_value[i],
+            )
+            and p.order_count == state.order_count[i].tolist()
+            for i, p in enumerate(players)
+        )
+    )
+    print(f"{n_games} 盘游戏，结果{'相同' if same else '不同'}")
+    print(
+        f"旧实现 {legacy:.2f}s，当前 {load_time + compute_time:.2f}s"
+        f"（读取 {load_time:.2f}s，计算 {compute_time:.2f}s）"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,135 @@
+"""比较逐字段反射（旧实现）与预生成函数（当前实现）读取、保存 game.db 的耗时
+
+用法：python -m benchmark.serialization [游戏数量]"""
+import dataclasses
+import gzip
+import json
+import sys
+import time
+from datetime import date, datetime
+from typing import Any, Union, get_args, get_origin, get_type_hints
+
+from game_data import Deserializable
+from game_data.game import BaseRound, GameDatabase, TenhouRound
+
+from .synthetic import league
+
+
+def legacy_deserialize_object(ty: type, obj: Any) -> Any:
+    """旧实现：每个对象都重新分析类型"""
+    if get_origin(ty) is Union:
+        if obj is None:
+            return None
+        return legacy_deserialize_object(get_args(ty)[0], obj)
+    if get_origin(ty) is list:
+        return [legacy_deserialize_object(get_args(ty)[0], item) for item in obj]
+    if get_origin(ty) is tuple:
+        return [
+            legacy_deserialize_object(t, item) for (t, item) in zip(get_args(ty), obj)
+        ]
+    if get_origin(ty) is dict:
+        key_type, value_type = get_args(ty)
+        return {
+            legacy_deserialize_object(key_type, key): legacy_deserialize_object(
+                value_type, value
+            )
+            for key, value in obj.items()
+        }
+    if issubclass(ty, Deserializable):
+        return legacy_deserialize(ty, obj)
+    if issubclass(ty, datetime):
+        return datetime.fromisoformat(obj)
+    return ty(obj)
+
+
+def legacy_deserialize(cls: type, obj: dict) -> Any:
+    """旧实现：每个对象都调用 get_type_hints 和 dataclasses.fields"""
+    if cls is BaseRound:
+        cls = TenhouRound
+    kwargs = {}
+    type_hints = get_type_hints(cls)
+    for field in dataclasses.fields(cls):
+        if not field.repr:
+            continue
+        name = field.name
+        if name not in obj:
+            continue
+        if obj[name] is None:
+            kwargs[name] = None
+            continue
+        kwargs[name] = legacy_deserialize_object(type_hints[name], obj[name])
+    return cls(**kwargs)
+
+
+def legacy_serialize(obj: Any, exclude_non_repr: bool = True) -> Any:
+    """旧实现：按照对象的实际类型逐个判断"""
+    if isinstance(obj, Deserializable):
+        return {
+            field.name: legacy_serialize(getattr(obj, field.name), exclude_non_repr)
+            for field in dataclasses.fields(obj)
+            if not exclude_non_repr or field.repr
+        }
+    if isinstance(obj, (list, tuple)):
+        return [legacy_serialize(item, exclude_non_repr) for item in obj]
+    if isinstance(obj, dict):
+        return {
+            legacy_serialize(key, exclude_non_repr): legacy_serialize(
+                value, exclude_non_repr
+            )
+            for key, value in obj.items()
+        }
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return obj
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def legacy_save(database: GameDatabase, path: str):
+    """旧实现：反射序列化，并用 json.dump 逐段写入 gzip"""
+    with gzip.open(path, "wt") as file:
+        json.dump(legacy_serialize(database), file)
+
+
+def legacy_load(path: str) -> GameDatabase:
+    """旧实现：读取 JSON 后反射构建对象"""
+    with gzip.open(path, "rt") as file:
+        return legacy_deserialize(GameDatabase, json.load(file))
+
+
+def main(n_games: int):
+    game_database, _ = league(n_games)
+    legacy_path, path = "legacy.db", "game.db"
+
+    # 两种实现的结果应当完全一致
+    assert legacy_serialize(game_database) == game_database.serialize()
+
+    _, legacy_save_time = timed(legacy_save, game_database, legacy_path)
+    _, save_time = timed(game_database.write_compressed_data, path)
+    legacy_db, legacy_load_time = timed(legacy_load, legacy_path)
+    loaded_db, load_time = timed(GameDatabase.read_compressed_file, path)
+    assert legacy_db.serialize() == loaded_db.serialize()
+
+    _, legacy_serialize_time = timed(legacy_serialize, game_database)
+    _, serialize_time = timed(game_database.serialize)
+    with gzip.open(path, "rt") as file:
+        raw = json.load(file)
+    _, legacy_deserialize_time = timed(legacy_deserialize, GameDatabase, raw)
+    _, deserialize_time = timed(GameDatabase.deserialize, raw)
+
+    print(f"{n_games} 盘游戏，game.db 未压缩 {len(json.dumps(raw)) / 2 ** 20:.1f} MB")
+    for name, legacy, current in [
+        ("保存 game.db", legacy_save_time, save_time),
+        ("  其中序列化", legacy_serialize_time, serialize_time),
+        ("读取 game.db", legacy_load_time, load_time),
+        ("  其中构建对象", legacy_deserialize_time, deserialize_time),
+    ]:
+        print(f"{name}：旧实现 {legacy:.2f}s，当前 {current:.2f}s（{legacy / current:.1f}x）")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,152 @@
+"""生成用于性能测试的随机牌谱和数据库"""
+from __future__ import annotations
+
+import contextlib
+import io
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+from game_data import GameData, PlayerData
+from game_data.game import (
+    MAJSOUL_GAME_EAST4,
+    MAJSOUL_GAME_SOUTH4,
+    GameDatabase,
+    TenhouRound,
+)
+from game_data.player import PlayerDatabase
+
+_YAKU = ["Riichi(1飜)", "Dora(2飜)"]
+_YAKUMAN = ["Four Concealed Triplets(役満)"]
+
+
+def _wall(rng: random.Random) -> List[int]:
+    """天凤格式的 136 张牌（每种花色各一张赤五）"""
+    wall = [s * 10 + v for s in (1, 2, 3) for v in range(1, 10) for _ in range(4)]
+    wall += [40 + v for v in range(1, 8) for _ in range(4)]
+    for s in (1, 2, 3):
+        wall.remove(s * 10 + 5)
+        wall.append(50 + s)
+    rng.shuffle(wall)
+    return wall
+
+
+def tenhou_round(rng: random.Random, round_number: int, points: List[int]) -> list:
+    """生成一局天凤格式的牌局（只有摸切、手切和立直，没有副露）"""
+    dealer = round_number % 4
+    wall = _wall(rng)
+    hands = [[wall.pop() for _ in range(13)] for _ in range(4)]
+    current_hands = [hand.copy() for hand in hands]
+    draws = [[] for _ in range(4)]
+    discards = [[] for _ in range(4)]
+    riichi = [False] * 4
+    turns = rng.randint(20, 60)
+    ending = rng.choice(["tsumo", "ron", "draw", "draw"])
+    current = last = dealer
+    for turn in range(turns):
+        tile = wall.pop()
+        draws[current].append(tile)
+        current_hands[current].append(tile)
+        if turn == turns - 1 and ending == "tsumo":
+            break
+        if riichi[current] or rng.random() < 0.5:
+            discard, code = tile, 60
+        else:
+            discard = code = rng.choice(current_hands[current])
+        current_hands[current].remove(discard)
+        if not riichi[current] and rng.random() < 0.03:
+            riichi[current] = True
+            code = f"r{discard}"
+        discards[current].append(code)
+        last = current
+        current = (current + 1) % 4
+    yaku = _YAKUMAN if rng.random() < 0.02 else _YAKU
+    if ending == "tsumo":
+        delta = [-1000] * 4
+        delta[current] = 3000
+        result = ["和了", delta, [current, current, current, "30符3飜", *yaku]]
+    elif ending == "ron":
+        winner = (last + rng.randint(1, 3)) % 4
+        delta = [0] * 4
+        delta[winner], delta[last] = 3900, -3900
+        result = ["和了", delta, [winner, last, winner, "40符2飜", *yaku]]
+    else:
+        delta = [1500, 1500, -1500, -1500]
+        rng.shuffle(delta)
+        result = ["流局", delta]
+    log = [[round_number, 0, 0], list(points), [wall.pop()], [wall.pop()]]
+    for p in range(4):
+        log += [hands[p], draws[p], discards[p]]
+    log.append(result)
+    return log
+
+
+def tenhou_game(rng: random.Random, index: int, names: List[str], date: datetime):
+    """生成一盘天凤格式的游戏"""
+    points = [25000] * 4
+    log = []
+    for round_number in range(rng.randint(4, 8)):
+        round_log = tenhou_round(rng, round_number, points)
+        log.append(round_log)
+        points = [a + b for a, b in zip(points, round_log[-1][1])]
+    score = []
+    for p in points:
+        score += [p, round((p - 25000) / 1000, 1)]
+    return {
+        "ref": f"synthetic-{index}",
+        "title": ["WDK", date.strftime("%m/%d/%Y, %I:%M:%S %p")],
+        "name": names,
+        "rule": {"disp": rng.choice(["Friendly South", "友人戦東喰赤"])},
+        "sc": score,
+        "log": log,
+    }
+
+
+def tenhou_games(n_games: int, n_players: int = 40, seed: int = 0) -> List[dict]:
+    """按时间顺序生成多盘天凤格式的游戏"""
+    rng = random.Random(seed)
+    names = [f"synthetic-{i}" for i in range(n_players)]
+    start = datetime(2023, 1, 1)
+    return [
+        tenhou_game(rng, i, rng.sample(names, 4), start + timedelta(hours=i))
+        for i in range(n_games)
+    ]
+
+
+def league(
+    n_games: int, n_players: int = 40, seed: int = 0, rounds: bool = True
+) -> tuple[GameDatabase, PlayerDatabase]:
+    """直接构建包含 n_games 盘游戏的数据库（不经过 GameDataController）
+
+    rounds 为 False 时只记录点数，不生成牌局"""
+    rng = random.Random(seed)
+    players = [PlayerData.new(f"玩家{i}") for i in range(n_players)]
+    games = {}
+    start = datetime(2023, 1, 1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(n_games):
+            seated = rng.sample(players, 4)
+            if rounds:
+                obj = tenhou_game(rng, i, [], start)
+                points = obj["sc"][::2]
+                round_data = [TenhouRound.from_json(r) for r in obj["log"]]
+            else:
+                points = [rng.randint(-50, 600) * 100 for _ in range(3)]
+                points.append(100000 - sum(points))
+                round_data = []
+            game = GameData(
+                players=[p.snapshot for p in seated],
+                player_points=points,
+                rounds=round_data,
+                game_date=start + timedelta(hours=i),
+                external_id=f"synthetic-{i}",
+                game_type=rng.choice([MAJSOUL_GAME_SOUTH4, MAJSOUL_GAME_EAST4]),
+            )
+            games[game.game_id] = game
+            preview = game.preview
+            for p in seated:
+                p.add_game(preview)
+    game_database = GameDatabase("game.db", games)
+    player_database = PlayerDatabase("player.db", {p.player_id: p for p in players})
+    player_database.link_history(game_database.previews)
+    return game_database, player_database
@@ -2,6 +2,10 @@ from .game import *
 from .io import *
 from .player import *
 from .controller import *
+from .updates import *
+from .writer import *
+from .upload_jobs import *
+from .watcher import *
 
 __all__ = [
     # IO
@@ -15,4 +19,10 @@ __all__ = [
     "PlayerSnapshot",
     # Controller
     "game_controller",
+    # Writer
+    "game_writer",
+    "DataSnapshot",
+    "update_feed",
+    "upload_jobs",
+    "raw_file_watcher",
 ]
@@ -1,48 +1,17 @@
-import json
-import os
 import sys
-from dataclasses import dataclass
-from datetime import datetime
-from pprint import pprint
-from typing import Callable
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
 
+from .game_preview import GamePreview
 from .io import Deserializable
-from .player import PlayerDatabase, player_database
+from .player import PlayerData, PlayerDatabase, player_database
 from .game import *
-
-
-def paipu_parse_id(obj) -> str:
-    """从雀魂牌谱中解析外部 ID"""
-    return obj["gamedata"]["uuid"]
-
-
-def tenhou_parse_id(obj) -> str:
-    """从天凤牌谱中解析外部 ID"""
-    return obj["ref"]
-
-
-def offline_parse_id(obj) -> str:
-    """从线下 JSON 中生成游戏 ID"""
-    return f"{obj['game_date']} {':'.join(obj['player_ids'])}"
-
-
-def paipu_parse_timestamp(obj) -> datetime:
-    """从雀魂牌谱中解析时间戳"""
-    return datetime.fromtimestamp(obj["gamedata"]["starttime"])
-
-
-def tenhou_parse_timestamp(obj) -> datetime:
-    """从天凤牌谱中解析时间戳"""
-    # 不同保存方式可能采用不同的时间戳格式
-    try:
-        return datetime.strptime(obj["title"][1], r"%m/%d/%Y, %I:%M:%S %p")
-    except ValueError:
-        return datetime.strptime(obj["title"][1], r"%Y/%m/%d %H:%M:%S")
-
-
-def offline_parse_timestamp(obj) -> datetime:
-    """从线下 JSON 中解析时间戳"""
-    return datetime.fromisoformat(obj["game_date"])
+from .ingest import *
+from .manifest import raw_file_manifest
+from .rating import RatingCheckpoints
+from .sqlite_database import change_feed
+from .updates import UPDATE_LIMIT, GameUpdate
 
 
 @dataclass
@@ -53,217 +22,368 @@ class GameDataController(Deserializable):
 
     player_database: PlayerDatabase
 
-    def apply_game(self, game: GameData):
-        """将游戏保存，并更新玩家数据"""
+    bulk_games: Optional[List[GameData]] = field(init=False, repr=False, default=None)
+    """批量录入期间添加的游戏（不在批量录入中则为 None）"""
 
-        game.print_log()
+    version: int = field(init=False, repr=False, default=0)
+    """数据版本，每添加一盘游戏加一（用于缓存响应）"""
 
-        self.game_database.add_game(game)
+    checkpoints: RatingCheckpoints = field(init=False, repr=False)
+    """积分检查点，读取数据库时由保存的结果建立，缓存变量"""
 
-        for player in game.players:
-            self.player_database.get_player(player.player_id).add_game(game.preview)
+    replay_index: Optional[int] = field(init=False, repr=False, default=None)
+    """需要从这一盘游戏（按时间顺序）开始重新计算积分，批量录入结束时处理"""
 
-        self.game_database.update()
-        self.player_database.update()
+    updates: Optional[List[GameUpdate]] = field(
+        init=False, repr=False, default_factory=list
+    )
+    """上次取出之后追加到最后的游戏；有其他变化（例如重新计算积分）时为 None"""
 
-    def load_from_paipu_json(self, game_obj: dict):
-        """从 JSON 对象中读取并保存游戏
+    def __post_init__(self):
+        # 玩家数据库先于游戏数据库读取，在这里将玩家的游戏记录指向唯一的游戏摘要
+        self.player_database.link_history(self.game_database.previews)
+        self.build_checkpoints()
 
-        使用 https://github.com/zyr17/MajsoulPaipuAnalyzer 生成的牌谱"""
-        # 检查是否已经存在相同的游戏
-        external_game_id = paipu_parse_id(game_obj)
-        if external_game_id in self.game_database.external_id_map:
+    def apply_game(self, game: GameData):
+        """将游戏保存，并更新玩家数据
+
+        游戏早于已有的最后一盘游戏时，按时间插入玩家的游戏记录，
+        并从之前最近的检查点开始重新计算积分"""
+        preview = self.game_database.add_game(game)
+        history = self.game_database.game_history
+        players = [self.player_database.get_player(p.player_id) for p in game.players]
+        if history[-1] is preview:
+            for player in players:
+                player.add_game(preview)
+            self.player_database.update_players(players)
+            if self.replay_index is None:
+                self.checkpoints.record(
+                    len(history), self.player_database.all_player_data.values()
+                )
+            self.version += 1
+            self.add_update(preview, players)
+        else:
+            for player in players:
+                index = player.insert_history(preview)
+                self.player_database.mark_history_changed(player, index)
+            self.replay_from(self.game_database.history_index(history, game.game_id))
+            self.version += 1
+
+        if self.bulk_games is None:
+            game.print_log()
+        else:
+            self.bulk_games.append(game)
+
+    def add_update(self, preview: GamePreview, players: List[PlayerData]) -> None:
+        """记录追加的游戏及其玩家的新快照，过多时改为记录有其他变化"""
+        if self.updates is None:
             return
+        if len(self.updates) >= UPDATE_LIMIT:
+            self.updates = None
+            return
+        snapshots = [player.snapshot for player in players]
+        self.updates.append((self.version, preview, snapshots))
+
+    def take_updates(self) -> Optional[List[GameUpdate]]:
+        """取出上次取出之后追加的游戏（有其他变化时为 None）"""
+        updates, self.updates = self.updates, []
+        return updates
+
+    def remove_game(self, game_id: str) -> GameData:
+        """删除游戏，并从之前最近的检查点开始重新计算积分"""
+        history = self.game_database.game_history
+        index = self.game_database.history_index(history, game_id)
+        game = self.game_database.remove_game(game_id)
+        for snapshot in game.players:
+            player = self.player_database.get_player(snapshot.player_id)
+            index_in_player = player.remove_history(game_id)
+            self.player_database.mark_history_changed(player, index_in_player)
+        self.version += 1
+        self.replay_from(index)
+        return game
 
-        # 读取玩家列表，如果不存在则创建新雀魂玩家
+    def correct_game(self, game: GameData):
+        """用新的数据替换 game_id 相同的已有游戏（可以修改日期），并重新计算积分"""
+        with self.bulk_ingest():
+            self.remove_game(game.game_id)
+            self.apply_game(game)
+
+    def replay_from(self, index: int):
+        """第 index 盘（按时间顺序）及之后的游戏发生了变化，需要重新计算积分
+
+        批量录入期间只记录位置，结束时统一计算"""
+        if self.replay_index is not None:
+            index = min(index, self.replay_index)
+        self.replay_index = index
+        if self.bulk_games is None:
+            self.replay()
+
+    def replay(self):
+        """从 replay_index 之前最近的检查点开始，按时间顺序重新计算积分"""
+        start = self.checkpoints.restart_index(self.replay_index)
+        self.replay_index = None
+        games = [
+            self.game_database.all_game_data[preview.game_id]
+            for preview in self.game_database.game_history[start:]
+        ]
+        players = list(self.player_database.all_player_data.values())
+        changed_games, changed_players = self.checkpoints.replay(games, start, players)
+        # 积分有变化的玩家在下次使用时重新生成积分序列
+        affected = {player.player_id for player in changed_players}
+        for game_id in changed_games:
+            for snapshot in self.game_database.all_game_data[game_id].players:
+                affected.add(snapshot.player_id)
+        self.player_database.mark_series_changed(affected)
+        self.game_database.mark_changed(changed_games)
+        self.player_database.mark_changed(changed_players)
+        self.player_database.update_players(changed_players)
+        self.updates = None
+        self.version += 1
+
+    def recompute_ratings(self):
+        """按时间顺序重新计算所有游戏的积分和所有玩家的数据，并重新建立检查点
+
+        同时修正旧版本中没有按时间顺序计算积分的游戏（启动时只由保存的结果建立检查点，
+        不会修改这些游戏）；修改的游戏和玩家在下次保存时写入"""
+        for player in self.player_database.all_player_data.values():
+            history = sorted(player.game_history, key=lambda game: game.date)
+            if history != player.game_history:
+                player.game_history = history
+                player.game_ids = [game.game_id for game in history]
+                self.player_database.mark_history_changed(player, 0)
+        self.checkpoints = RatingCheckpoints.new()
+        self.replay_index = 0
+        self.replay()
+
+    def build_checkpoints(self):
+        """由保存的每盘游戏的结果建立检查点（不重新计算积分，也不修改任何游戏），
+        之后修改历史游戏时只需从最近的检查点开始计算"""
+        self.checkpoints = RatingCheckpoints.new()
+        self.checkpoints.fill(
+            self.game_database.game_history,
+            list(self.player_database.all_player_data.values()),
+        )
+
+    @contextmanager
+    def bulk_ingest(self):
+        """批量录入游戏：期间不输出日志，结束时统一输出
+
+        可以嵌套使用，只在最外层结束时处理"""
+        if self.bulk_games is not None:
+            yield
+            return
+        self.bulk_games = []
+        try:
+            yield
+        finally:
+            games, self.bulk_games = self.bulk_games, None
+            if self.replay_index is not None:
+                self.replay()
+            for game in games:
+                game.print_log()
+
+    @contextmanager
+    def exclusive(self):
+        """修改数据前调用：多进程共用 SQLite 数据库时持有文件锁，
+        并先读取其他进程保存的变化（修改的数据需要在结束前保存）"""
+        if change_feed is None:
+            yield
+            return
+        with change_feed.locked(exclusive=True):
+            self.catch_up()
+            yield
+
+    def poll_changes(self) -> bool:
+        """读取其他进程保存的变化（空闲时定期调用），返回是否有变化
+
+        使用日志存储时只支持单进程，总是返回 False"""
+        if change_feed is None:
+            return False
+        with change_feed.locked(exclusive=False):
+            return self.catch_up()
+
+    def catch_up(self) -> bool:
+        """读取其他进程保存的变化，只替换有变化的游戏和玩家，返回是否有变化
+
+        需要持有 change_feed 的文件锁"""
+        changes = change_feed.read_changes()
+        if changes is None:
+            self.reload()
+            return True
+        game_ids, player_ids = changes
+        if not game_ids and not player_ids:
+            return False
+        # 最早有变化的游戏（替换前后的位置）之后的检查点失效
+        history = self.game_database.game_history
+        first_changed = len(history)
+        for game_id in game_ids:
+            if game_id in self.game_database.all_game_data:
+                index = self.game_database.history_index(history, game_id)
+                first_changed = min(first_changed, index)
+        games = self.game_database.storage.load_games_by_id(game_ids)
+        players = self.player_database.storage.load_players_by_id(player_ids)
+        # 这些游戏的摘要会被替换，其中的玩家需要重新链接游戏记录
+        affected = set(player_ids)
+        for game_id in game_ids:
+            old_game = self.game_database.all_game_data.get(game_id)
+            for game in (old_game, games.get(game_id)):
+                if game is not None:
+                    affected.update(snapshot.player_id for snapshot in game.players)
+        self.game_database.replace_games(game_ids, games)
+        history = self.game_database.game_history
+        for game_id in games:
+            index = self.game_database.history_index(history, game_id)
+            first_changed = min(first_changed, index)
+        self.checkpoints.invalidate(first_changed)
+        # 新玩家按写入顺序添加（名次相同时先创建的玩家在前）
+        self.player_database.replace_players(
+            {
+                player_id: players[player_id]
+                for player_id in player_ids
+                if player_id in players
+            }
+        )
+        for player_id in affected:
+            player = self.player_database.all_player_data.get(player_id)
+            if player is not None:
+                player.link_history(self.game_database.previews)
+                player.rating_series = None
+        self.player_database.update()
+        # 由其他进程保存的结果补充失效的检查点
+        if self.checkpoints.missing(len(self.game_database.game_history)):
+            self.checkpoints.fill(
+                self.game_database.game_history,
+                list(self.player_database.all_player_data.values()),
+            )
+        self.updates = None
+        self.version += 1
+        return True
+
+    def reload(self):
+        """重新读取整个数据库（落后其他进程太多、变化记录已被清理时）"""
+        print("重新读取数据库", file=sys.stderr)
+        self.game_database.all_game_data = self.game_database.storage.load_games()
+        self.game_database.unsaved_game_ids = []
+        self.game_database.deleted_game_ids = []
+        self.game_database.clear_detail_cache()
+        self.game_database.update()
+        self.player_database.all_player_data = (
+            self.player_database.storage.load_players()
+        )
+        self.player_database.mark_saved()
+        self.player_database.link_history(self.game_database.previews)
+        self.build_checkpoints()
+        self.updates = None
+        self.version += 1
+
+    def save(self):
+        """将新增的游戏和玩家变化写入文件"""
+        self.game_database.save()
+        self.player_database.save()
+
+    def find_players(self, payload: GamePayload) -> List[PlayerData]:
+        """读取玩家列表，如果不存在则创建新玩家"""
         players = []
-        for ext_player_data in game_obj["gamedata"]["playerdata"]:
-            external_player_id = ext_player_data["id"]
-            if external_player_id in self.player_database.external_id_map:
-                players.append(self.player_database.external_id_map[external_player_id])
-            else:
-                players.append(
-                    self.player_database.create_player(
-                        player_name=f"雀魂玩家-{ext_player_data['name']}",
-                        external_ids=[external_player_id],
+        for key in payload.player_keys:
+            match payload.source:
+                case "paipu":
+                    external_player_id, external_player_name = key
+                    player = self.player_database.external_id_map.get(
+                        external_player_id
                     )
-                )
+                    if player is None:
+                        player = self.player_database.create_player(
+                            player_name=f"雀魂玩家-{external_player_name}",
+                            external_ids=[external_player_id],
+                        )
+                case "tenhou":
+                    player = self.player_database.external_name_map.get(key)
+                    if player is None:
+                        player = self.player_database.create_player(
+                            player_name=f"雀魂玩家-{key}",
+                            external_names=[key],
+                        )
+                case _:
+                    player = self.player_database.all_player_data.get(key)
+                    if player is None:
+                        player = self.player_database.create_player(
+                            player_name=f"线下玩家-{key}",
+                            player_id=key,
+                        )
+            players.append(player)
+        return players
+
+    def apply_payloads(self, payloads: List[GamePayload]) -> None:
+        """按顺序录入解析完成的牌谱，跳过数据类型错误的牌谱"""
+        with self.bulk_ingest():
+            for payload in payloads:
+                try:
+                    self.apply_payload(payload)
+                except (TypeError, KeyError) as e:
+                    print(
+                        f"加载牌谱{repr(payload.external_id)}失败：数据类型错误",
+                        file=sys.stderr,
+                    )
+                    print(e)
 
-        # 读取轮数
-        round_count = game_obj["gamedata"]["roomdata"]["round"]
-        match round_count:
-            case 8:
-                game_type = MAJSOUL_GAME_SOUTH4
-            case 4:
-                game_type = MAJSOUL_GAME_EAST4
-            case _:
-                raise ValueError(f"雀魂牌谱轮数无法解析：{round_count}")
-
-        # 创建游戏
+    def apply_payload(self, payload: GamePayload) -> GameData:
+        """根据解析结果创建并保存游戏；如果已经存在相同的游戏，则返回已有的游戏"""
+        if payload.external_id in self.game_database.external_id_map:
+            return self.game_database.external_id_map[payload.external_id]
+
+        players = self.find_players(payload)
         game = GameData(
             players=[p.snapshot for p in players],
-            player_points=[
-                int(x) for x in game_obj["record"][-1]["action"][-1][1:].split("|")
-            ],
-            game_date=paipu_parse_timestamp(game_obj),
-            external_id=external_game_id,
-            game_type=game_type,
+            player_points=payload.player_points,
+            rounds=payload.rounds,
+            game_date=payload.game_date,
+            external_id=payload.external_id,
+            game_type=GameType.Enum[payload.game_type],
+            yakuman_count=payload.yakuman_count,
         )
-
-        # 保存游戏
         self.apply_game(game)
+        return game
+
+    def load_from_paipu_json(self, game_obj: dict) -> GameData:
+        """从 JSON 对象中读取并保存游戏
+
+        使用 https://github.com/zyr17/MajsoulPaipuAnalyzer 生成的牌谱"""
+        # 检查是否已经存在相同的游戏
+        external_game_id = paipu_parse_id(game_obj)
+        if external_game_id in self.game_database.external_id_map:
+            return self.game_database.external_id_map[external_game_id]
+        return self.apply_payload(parse_paipu_json(game_obj))
 
     def load_from_tenhou_json(self, game_obj: dict) -> GameData:
         """从 JSON 对象（天凤格式）中读取并保存游戏"""
         # 检查是否已经存在相同的游戏
-        external_game_id = game_obj["ref"]
+        external_game_id = tenhou_parse_id(game_obj)
         if external_game_id in self.game_database.external_id_map:
             return self.game_database.external_id_map[external_game_id]
+        return self.apply_payload(parse_tenhou_json(game_obj))
 
-        # 读取玩家列表，如果不存在则创建新雀魂玩家
-        players = []
-        for external_player_name in game_obj["name"]:
-            if external_player_name in self.player_database.external_name_map:
-                players.append(
-                    self.player_database.external_name_map[external_player_name]
-                )
-            else:
-                players.append(
-                    self.player_database.create_player(
-                        player_name=f"雀魂玩家-{external_player_name}",
-                        external_names=[external_player_name],
-                    )
-                )
-
-        # 读取轮数
-        game_type_str = game_obj["rule"]["disp"]
-        match game_type_str:
-            case "Friendly South" | "友人戦南喰赤":
-                game_type = MAJSOUL_GAME_SOUTH4
-            case "Friendly East" | "友人戦東喰赤":
-                game_type = MAJSOUL_GAME_EAST4
-            case _:
-                raise ValueError(f"天凤牌谱游戏类型无法解析：{game_type_str}")
-
-        # 创建游戏
-        game = GameData(
-            players=[p.snapshot for p in players],
-            player_points=game_obj["sc"][::2],
-            rounds=[TenhouRound.from_json(r) for r in game_obj["log"]],
-            game_date=tenhou_parse_timestamp(game_obj),
-            external_id=external_game_id,
-            game_type=game_type,
-        )
-
-        # 保存游戏
-        self.apply_game(game)
-        return game
-
-    def load_from_offline_json(self, game_obj: dict):
+    def load_from_offline_json(self, game_obj: dict) -> GameData:
         """从 JSON 对象读取并保存线下游戏"""
         # 检查是否已经存在相同的游戏
         external_game_id = offline_parse_id(game_obj)
         if external_game_id in self.game_database.external_id_map:
-            return
-
-        # 读取玩家列表，如果不存在则创建新雀魂玩家
-        players = []
-        for player_id in game_obj["player_ids"]:
-            if player_id in self.player_database.all_player_data:
-                players.append(self.player_database.get_player(player_id))
-            else:
-                players.append(
-                    self.player_database.create_player(
-                        player_name=f"线下玩家-{player_id}",
-                        player_id=player_id,
-                    )
-                )
-
-        # 创建游戏
-        game = GameData(
-            players=[p.snapshot for p in players],
-            player_points=game_obj["player_points"],
-            game_date=offline_parse_timestamp(game_obj),
-            external_id=external_game_id,
-            game_type=GameType.Enum.get(game_obj["game_type"], OFFLINE_GAME_DEFAULT),
-            yakuman_count=game_obj.get("yakuman_count"),
-        )
-
-        # 保存游戏
-        self.apply_game(game)
+            return self.game_database.external_id_map[external_game_id]
+        return self.apply_payload(parse_offline_json(game_obj))
 
 
 game_controller = GameDataController(game_database, player_database)
 
 # 读取牌谱
-# 先加载文件并记录游戏时间，然后按照时间进行排序再处理
-game_json_objs = []
-new_game_ids = set()
-
-
-def load_from_directory(
-    directory: str,
-    loader: Callable[[dict], None],
-    timestamp_parser: Callable[[dict], datetime],
-    id_parser: Callable[[dict], str],
-):
-    try:
-        for file in os.listdir(directory):
-            path = os.path.join(directory, file)
-            try:
-                data = json.load(open(path))
-                timestamp = timestamp_parser(data)
-                external_id = id_parser(data)
-                # 去重
-                if (
-                    external_id in new_game_ids
-                    or external_id in game_database.external_id_map
-                ):
-                    continue
-                new_game_ids.add(external_id)
-                game_json_objs.append(
-                    (
-                        timestamp,
-                        external_id,
-                        loader,
-                        data,
-                    )
-                )
-            except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
-                print(f"加载牌谱：无法读取 {path}", file=sys.stderr)
-                print(e)
-                continue
-    except FileNotFoundError:
-        print(f"无牌谱目录 {directory}", file=sys.stderr)
-
-
-# 读取天凤牌谱
-load_from_directory(
-    "data/tenhou",
-    game_controller.load_from_tenhou_json,
-    tenhou_parse_timestamp,
-    tenhou_parse_id,
-)
-# 读取雀魂牌谱
-load_from_directory(
-    "data/paipu",
-    game_controller.load_from_paipu_json,
-    paipu_parse_timestamp,
-    paipu_parse_id,
-)
-# 读取线下牌谱
-load_from_directory(
-    "data/offline",
-    game_controller.load_from_offline_json,
-    offline_parse_timestamp,
-    offline_parse_id,
+# 跳过清单中没有变化的文件，（并行）解析其余的牌谱，然后按照时间顺序计算积分
+raw_files = raw_file_manifest.changed_files(
+    list_raw_files(), game_database.external_id_map
 )
-# 排序并处理
-for _, external_id, func, data in sorted(game_json_objs, key=lambda x: x[0]):
-    if external_id == "230819-b4bdb485-ca84-4a9e-922d-152be2f18639":
-        pass
-    try:
-        func(data)
-    except (TypeError, KeyError) as e:
-        print(f"加载牌谱{repr(external_id)}失败：数据类型错误", file=sys.stderr)
-        print(e)
+payloads, raw_file_ids = parse_raw_files(raw_files, game_database.external_id_map)
+# 多个进程同时启动时只有一个进程录入，其余进程读取它保存的游戏
+with game_controller.exclusive():
+    game_controller.apply_payloads(payloads)
+
+    # 保存新读取的牌谱（只追加新增的记录）
+    game_controller.save()
+    raw_file_manifest.update(raw_file_ids, game_database.external_id_map)
+    raw_file_manifest.save()
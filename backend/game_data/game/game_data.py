@@ -9,6 +9,7 @@ from typing import List, Optional, Tuple, TextIO, Dict, ClassVar
 import uuid
 
 from ..game_preview import GamePreview
+from ..game_type import GameType
 from ..io import Deserializable
 
 from ..player.player_data import PlayerSnapshot
@@ -29,31 +30,6 @@ R_DELTA = [30, 10, -10, -30]
 """不同顺位的 R 值得分"""
 
 
-@dataclass
-class GameType(Deserializable):
-    """游戏类型"""
-
-    Enum: ClassVar[Dict[str, GameType]] = {}
-    """利用 name 反向查找对应的对象"""
-
-    name: str
-    """游戏类型显示名称"""
-
-    pt_multiplier: float = field(default=1)
-    """点数的乘数系数"""
-
-    r_multiplier: float = field(default=1)
-    """r 点的乘数系数"""
-
-    uma: Optional[List[int]] = field(default=None)
-    """马点计算方式，例如 [10000, 20000, 30000, 40000]（如果不按马点计算则为 None）"""
-
-    def __post_init__(self):
-        """将创建过的对象自动保存到 Enum 中"""
-        if self.name not in GameType.Enum:
-            GameType.Enum[self.name] = self
-
-
 MAJSOUL_GAME_SOUTH4 = GameType(name="雀魂牌局-四人南")
 MAJSOUL_GAME_EAST4 = GameType(name="雀魂牌局-四人东", pt_multiplier=2 / 3)
 MAJSOUL_GAME_DEFAULT = MAJSOUL_GAME_SOUTH4
@@ -185,6 +161,20 @@ class GameData(Deserializable):
             # R 值计算结果进位至第三位小数
             self.r_delta[seat] = round(r * self.game_type.r_multiplier, 3)
 
+    def strip_detail(self):
+        """清除所有牌局细节（已单独存储时使用）"""
+        for round_ in self.rounds:
+            round_.strip_detail()
+
+    @property
+    def has_detail(self) -> bool:
+        """是否含有牌局细节"""
+        return any(round_.has_detail for round_ in self.rounds)
+
+    def with_detail(self) -> GameData:
+        """返回计算出所有牌局细节的副本（用于查看单盘游戏）"""
+        return dataclasses.replace(self, rounds=[r.with_detail() for r in self.rounds])
+
     def print_log(self, out: TextIO = sys.stdout):
         print(
             f"{self.game_type.name} {self.game_id}\n",
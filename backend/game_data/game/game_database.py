@@ -1,16 +1,69 @@
 from __future__ import annotations
 
+import bisect
+import dataclasses
 import os
 import sys
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass, field
-from typing import Dict, List, Set
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 from ..io import *
+from ..sqlite_database import SQLITE_PATH, STORAGE_ENGINE
 from .game_data import GameData
+from .game_storage import GameStorage, JournalGameStorage, SqliteGameStorage
 from ..game_preview import GamePreview
 
 _DEFAULT_DATABASE_PATH = "game.db"
 
+DETAIL_CACHE_SIZE = 64
+"""缓存的包含牌局细节的游戏数量"""
+
+
+def _date(preview: GamePreview) -> datetime:
+    return preview.date
+
+
+def history_range(
+    history: Sequence[GamePreview],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Tuple[int, int]:
+    """按时间排列的记录中，时间在 [start, end) 之间的范围 [lo, hi)"""
+    lo, hi = 0, len(history)
+    if start is not None:
+        lo = bisect.bisect_left(history, start, key=_date)
+    if end is not None:
+        hi = bisect.bisect_left(history, end, key=_date)
+    return lo, max(lo, hi)
+
+
+def history_position(
+    history: Sequence[GamePreview], date: datetime, game_id: str
+) -> int:
+    """游戏在按时间排列的记录中的位置（不在其中时为按时间应插入的位置）"""
+    i = bisect.bisect_left(history, date, key=_date)
+    while i < len(history) and history[i].date == date:
+        if history[i].game_id == game_id:
+            break
+        i += 1
+    return i
+
+
+def insert_history(
+    history: List[GamePreview], preview: GamePreview
+) -> List[GamePreview]:
+    """按时间插入游戏（同一时间的插入在最后），返回插入后的记录
+
+    只有插入在末尾时原地修改，否则返回新的列表（已发布的快照引用原列表的前缀）"""
+    index = bisect.bisect_right(history, preview.date, key=_date)
+    if index < len(history):
+        return history[:index] + [preview] + history[index:]
+    history.append(preview)
+    return history
+
 
 @dataclass
 class GameDatabase(Deserializable):
@@ -22,24 +75,67 @@ class GameDatabase(Deserializable):
     all_game_data: Dict[str, GameData]
     """所有游戏记录"""
 
+    previews: Dict[str, GamePreview] = field(init=False, repr=False)
+    """每盘游戏唯一的摘要，游戏记录和玩家记录都引用这些对象，缓存变量"""
+
     game_history: List[GamePreview] = field(init=False, repr=False)
-    """按时间顺序排列的游戏记录，缓存变量"""
+    """按时间顺序排列的游戏记录，缓存变量
+
+    只在末尾原地追加，其他修改替换为新的列表（已发布的快照引用其前缀，见 ListPrefix）"""
+
+    game_history_by_type: Dict[str, List[GamePreview]] = field(init=False, repr=False)
+    """按游戏类型名称分组、按时间顺序排列的游戏记录（同 game_history 只在末尾追加），缓存变量"""
 
     external_id_map: Dict[str, GameData] = field(init=False, repr=False)
     """外部链接作为索引，为防止重复添加"""
 
+    storage: Optional[GameStorage] = field(default=None, repr=False)
+    """存储引擎，默认为 gzip 快照 + 追加日志"""
+
+    unsaved_game_ids: List[str] = field(init=False, repr=False)
+    """尚未保存的游戏"""
+
+    deleted_game_ids: List[str] = field(init=False, repr=False)
+    """已删除、尚未从存储中删除的游戏"""
+
+    detail_cache: OrderedDict[str, GameData] = field(init=False, repr=False)
+    """最近查看的包含牌局细节的游戏（最近使用的在最后），缓存变量"""
+
+    detail_lock: threading.Lock = field(init=False, repr=False)
+    """保护 detail_cache：读取请求的线程和写入线程都会修改它"""
+
+    detail_generation: int = field(init=False, repr=False, default=0)
+    """detail_cache 每次被清除（或删除游戏）时加一，模拟期间变化则不缓存结果"""
+
     def __post_init__(self):
+        if self.storage is None:
+            self.storage = JournalGameStorage(self.database_path)
+        self.unsaved_game_ids = []
+        self.deleted_game_ids = []
+        self.detail_cache = OrderedDict()
+        self.detail_lock = threading.Lock()
         self.update()
 
+    @classmethod
+    def load(cls, path: str) -> GameDatabase:
+        """使用配置的存储引擎读取数据库"""
+        if STORAGE_ENGINE == "sqlite":
+            storage = SqliteGameStorage(SQLITE_PATH)
+        else:
+            storage = JournalGameStorage(path)
+        return cls(path, storage.load_games(), storage=storage)
+
     def update(self) -> None:
         """更新所有缓存变量"""
-        self.game_history = [
-            game.preview
-            for game in sorted(
-                self.all_game_data.values(),
-                key=lambda game: game.game_date or game.upload_time,
+        self.previews = {
+            game_id: game.preview for game_id, game in self.all_game_data.items()
+        }
+        self.game_history = sorted(self.previews.values(), key=_date)
+        self.game_history_by_type = {}
+        for preview in self.game_history:
+            self.game_history_by_type.setdefault(preview.game_type.name, []).append(
+                preview
             )
-        ]
         self.external_id_map = {
             game.external_id: game
             for game in self.all_game_data.values()
@@ -47,22 +143,162 @@ class GameDatabase(Deserializable):
         }
 
     def save(self):
-        """保存到文件"""
-        self.write_compressed_data(self.database_path)
+        """保存新增或有变化的游戏，并删除已删除的游戏"""
+        deleted = [i for i in self.deleted_game_ids if i not in self.all_game_data]
+        if deleted:
+            self.storage.delete_games(self, deleted)
+        self.storage.save_games(self, self.unsaved_game_ids)
+        self.unsaved_game_ids = []
+        self.deleted_game_ids = []
+
+    def mark_changed(self, game_ids: Iterable[str]) -> None:
+        """记录已有的游戏发生了变化（例如重新计算积分），下次保存时写入"""
+        unsaved = set(self.unsaved_game_ids)
+        self.unsaved_game_ids.extend(
+            game_id for game_id in game_ids if game_id not in unsaved
+        )
+        self.clear_detail_cache()
+
+    def clear_detail_cache(self) -> None:
+        """清除缓存的牌局细节（积分等数据变化后）"""
+        with self.detail_lock:
+            self.detail_cache.clear()
+            self.detail_generation += 1
+
+    def add_game(self, game_data: GameData) -> GamePreview:
+        """添加新游戏，只更新与之相关的缓存（按时间插入 game_history）
 
-    def add_game(self, game_data: GameData):
-        """添加新游戏，并更新玩家分数（默认放在最后）"""
+        返回该游戏唯一的摘要"""
         game_id = game_data.game_id
         assert game_id not in self.all_game_data
         self.all_game_data[game_id] = game_data
-        self.update()
+        self.unsaved_game_ids.append(game_id)
+        preview = self.previews[game_id] = game_data.preview
+        self.game_history = insert_history(self.game_history, preview)
+        game_type = preview.game_type.name
+        self.game_history_by_type[game_type] = insert_history(
+            self.game_history_by_type.get(game_type, []), preview
+        )
+        if game_data.external_id is not None:
+            self.external_id_map[game_data.external_id] = game_data
+        return preview
+
+    def remove_game(self, game_id: str) -> GameData:
+        """删除游戏，只更新与之相关的缓存
+
+        返回删除的游戏（使用相同的 game_id 重新添加即为修改游戏）"""
+        game_data = self.all_game_data[game_id]
+        preview = self.previews[game_id]
+        index = self.history_index(self.game_history, game_id)
+        self.game_history = self.game_history[:index] + self.game_history[index + 1 :]
+        history = self.game_history_by_type[preview.game_type.name]
+        index = self.history_index(history, game_id)
+        self.game_history_by_type[preview.game_type.name] = (
+            history[:index] + history[index + 1 :]
+        )
+        del self.all_game_data[game_id]
+        del self.previews[game_id]
+        if self.external_id_map.get(game_data.external_id) is game_data:
+            del self.external_id_map[game_data.external_id]
+        if game_id in self.unsaved_game_ids:
+            self.unsaved_game_ids.remove(game_id)
+        self.deleted_game_ids.append(game_id)
+        with self.detail_lock:
+            self.detail_cache.pop(game_id, None)
+            self.detail_generation += 1
+        return game_data
+
+    def replace_games(self, game_ids: Iterable[str], games: Dict[str, GameData]):
+        """用其他进程保存的数据替换内存中的游戏（不需要再次保存）
+
+        game_ids 中不在 games 里的游戏已被删除"""
+        # 原位置替换会修改记录，先复制（已发布的快照引用原来的列表）
+        self.game_history = self.game_history.copy()
+        self.game_history_by_type = {
+            game_type: history.copy()
+            for game_type, history in self.game_history_by_type.items()
+        }
+        for game_id in game_ids:
+            if self._replace_in_place(games.get(game_id)):
+                continue
+            if game_id in self.all_game_data:
+                self.remove_game(game_id)
+                self.deleted_game_ids.pop()
+            if game_id in games:
+                self.add_game(games[game_id])
+                self.unsaved_game_ids.pop()
+        self.clear_detail_cache()
+
+    def _replace_in_place(self, game_data: Optional[GameData]) -> bool:
+        """时间和类型都没有变化时，在 game_history 的原位置替换摘要
+        （保持与同一时间的其他游戏的相对顺序），返回是否替换
+
+        会原地修改记录，只由 replace_games 在复制记录之后调用"""
+        if game_data is None or game_data.game_id not in self.all_game_data:
+            return False
+        game_id = game_data.game_id
+        old = self.previews[game_id]
+        preview = game_data.preview
+        if old.date != preview.date or old.game_type.name != preview.game_type.name:
+            return False
+        for history in (
+            self.game_history,
+            self.game_history_by_type[old.game_type.name],
+        ):
+            history[self.history_index(history, game_id)] = preview
+        old_game = self.all_game_data[game_id]
+        if self.external_id_map.get(old_game.external_id) is old_game:
+            del self.external_id_map[old_game.external_id]
+        if game_data.external_id is not None:
+            self.external_id_map[game_data.external_id] = game_data
+        self.all_game_data[game_id] = game_data
+        self.previews[game_id] = preview
+        return True
+
+    def query_history(
+        self,
+        game_type: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Tuple[List[GamePreview], int, int]:
+        """按照游戏类型和时间范围（包含 start，不包含 end）查询游戏记录
+
+        返回按时间排列的记录，以及符合条件的范围 [lo, hi)"""
+        if game_type is None:
+            history = self.game_history
+        else:
+            history = self.game_history_by_type.get(game_type, [])
+        return history, *history_range(history, start, end)
+
+    def history_index(self, history: List[GamePreview], game_id: str) -> int:
+        """游戏在按时间排列的记录中的位置（不在其中时为按时间应插入的位置）"""
+        return history_position(history, self.all_game_data[game_id].date, game_id)
 
     def get_game(self, game_id: str) -> GameData:
-        return self.all_game_data[game_id]
+        """返回包含牌局细节的完整游戏
+
+        牌局细节在第一次查看时读取并模拟，最近查看的 DETAIL_CACHE_SIZE 盘游戏会被缓存；
+        可以在读取请求的线程中调用，读取和模拟时不持有锁"""
+        with self.detail_lock:
+            try:
+                self.detail_cache.move_to_end(game_id)
+                return self.detail_cache[game_id]
+            except KeyError:
+                generation = self.detail_generation
+        game = self.all_game_data[game_id]
+        # 积分相关的数据以内存中的为准，只从存储中读取牌局
+        detail = self.storage.load_game_detail(game_id)
+        if detail is not None:
+            game = dataclasses.replace(game, rounds=detail.rounds)
+        game = game.with_detail()
+        with self.detail_lock:
+            # 模拟期间游戏被修改时不缓存旧的结果
+            if generation == self.detail_generation:
+                self.detail_cache[game_id] = game
+                if len(self.detail_cache) > DETAIL_CACHE_SIZE:
+                    self.detail_cache.popitem(last=False)
+        return game
 
 
-try:
-    game_database = GameDatabase.read_compressed_file(_DEFAULT_DATABASE_PATH)
-    """全局游戏记录管理"""
-except FileNotFoundError:
-    game_database = GameDatabase(_DEFAULT_DATABASE_PATH, {})
+game_database = GameDatabase.load(_DEFAULT_DATABASE_PATH)
+"""全局游戏记录管理"""
@@ -0,0 +1,247 @@
+"""游戏数据库的存储引擎"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from ..io import Deserializable
+from ..journal import JOURNAL_SUFFIX, Journal
+from ..sqlite_database import SqliteConnection, chunks, record_changes
+from .game_data import GameData
+
+if TYPE_CHECKING:
+    from .game_database import GameDatabase
+
+DETAIL_SUFFIX = ".detail"
+"""牌局细节目录的后缀（与快照文件放在同一目录）"""
+
+
+class GameStorage(ABC):
+    """存储引擎的共同接口"""
+
+    @abstractmethod
+    def load_games(self) -> Dict[str, GameData]:
+        """读取所有游戏（可以不包含牌局细节）"""
+
+    @abstractmethod
+    def load_games_by_id(self, game_ids: Iterable[str]) -> Dict[str, GameData]:
+        """读取指定的游戏（不包含牌局细节），不存在的游戏不在结果中"""
+
+    @abstractmethod
+    def save_games(self, database: GameDatabase, game_ids: List[str]) -> None:
+        """保存新增或有变化的游戏"""
+
+    @abstractmethod
+    def delete_games(self, database: GameDatabase, game_ids: List[str]) -> None:
+        """删除游戏"""
+
+    def load_game_detail(self, game_id: str) -> Optional[GameData]:
+        """读取包含牌局细节的完整游戏；如果内存中的游戏已经完整，则返回 None"""
+        return None
+
+
+@dataclass
+class JournalGameStorage(GameStorage):
+    """gzip 快照 + 追加日志，内存中只保留计算积分所需的数据
+
+    每盘游戏的完整数据（包括牌局细节）单独保存在细节目录中，查询时读取"""
+
+    path: str
+    """快照文件地址"""
+
+    journal: Journal = field(init=False)
+    """快照之后新增的游戏记录"""
+
+    detail_path: str = field(init=False)
+    """牌局细节目录，每盘游戏一个文件"""
+
+    compact_pending: bool = field(init=False, default=False)
+    """读取的游戏中含有牌局细节（旧格式），下次保存时移入细节目录并重新生成快照"""
+
+    def __post_init__(self):
+        self.journal = Journal(self.path + JOURNAL_SUFFIX)
+        self.detail_path = self.path + DETAIL_SUFFIX
+
+    def load_games(self) -> Dict[str, GameData]:
+        """读取快照，并重放日志中的游戏记录"""
+        try:
+            with gzip.open(self.path, "rt") as file:
+                games = Deserializable.deserialize_object(
+                    Dict[str, GameData], json.load(file)["all_game_data"]
+                )
+        except FileNotFoundError:
+            games = {}
+        for record in self.journal.read():
+            if "deleted_game_id" in record:
+                games.pop(record["deleted_game_id"], None)
+                continue
+            game = GameData.deserialize(record)
+            games[game.game_id] = game
+        self.compact_pending = any(game.has_detail for game in games.values())
+        return games
+
+    def load_games_by_id(self, game_ids: Iterable[str]) -> Dict[str, GameData]:
+        """读取快照和日志后只保留指定的游戏（只支持单进程，不需要按 ID 读取）"""
+        games = self.load_games()
+        return {game_id: games[game_id] for game_id in game_ids if game_id in games}
+
+    def save_games(self, database: GameDatabase, game_ids: List[str]) -> None:
+        """将新增游戏的细节写入细节目录、其余数据追加到日志，日志过长时合并为新的快照"""
+        games = [database.all_game_data[game_id] for game_id in game_ids]
+        self.save_detail(games)
+        self.journal.append(game.serialize() for game in games)
+        if self.journal.should_compact or self.compact_pending:
+            self.compact(database)
+
+    def delete_games(self, database: GameDatabase, game_ids: List[str]) -> None:
+        """在日志中记录删除的游戏，并删除其牌局细节"""
+        self.journal.append({"deleted_game_id": game_id} for game_id in game_ids)
+        for game_id in game_ids:
+            try:
+                os.remove(self.detail_file(game_id))
+            except FileNotFoundError:
+                pass
+
+    def detail_file(self, game_id: str) -> str:
+        """保存一盘游戏完整数据的文件地址"""
+        return os.path.join(self.detail_path, f"{game_id}.gz")
+
+    def save_detail(self, games: Iterable[GameData]) -> None:
+        """将含有牌局细节的游戏完整写入细节目录，之后内存中只保留不含细节的版本"""
+        for game in games:
+            if not game.has_detail:
+                continue
+            os.makedirs(self.detail_path, exist_ok=True)
+            game.write_compressed_data(self.detail_file(game.game_id))
+            game.strip_detail()
+
+    def compact(self, database: GameDatabase) -> None:
+        """将所有游戏写入新的快照，并清空日志"""
+        self.save_detail(database.all_game_data.values())
+        self.compact_pending = False
+        database.write_compressed_data(self.path)
+        self.journal.clear()
+
+    def load_game_detail(self, game_id: str) -> Optional[GameData]:
+        """从细节目录读取完整的游戏"""
+        try:
+            return GameData.read_compressed_file(self.detail_file(game_id))
+        except FileNotFoundError:
+            return None
+
+
+@dataclass
+class SqliteGameStorage(GameStorage):
+    """SQLite 存储，内存中只保留计算积分所需的数据，牌局细节在查询时读取"""
+
+    path: str
+    """SQLite 数据库文件地址"""
+
+    connection: SqliteConnection = field(init=False)
+
+    def __post_init__(self):
+        self.connection = SqliteConnection.open(self.path)
+
+    def load_games(self) -> Dict[str, GameData]:
+        """读取所有游戏（不包含牌局细节）"""
+        with self.connection.transaction() as db:
+            rows = db.execute("SELECT data FROM games").fetchall()
+        return self.games_from_rows(rows)
+
+    def load_games_by_id(self, game_ids: Iterable[str]) -> Dict[str, GameData]:
+        rows = []
+        with self.connection.transaction() as db:
+            for chunk in chunks(game_ids):
+                rows += db.execute(
+                    f"SELECT data FROM games WHERE game_id IN "
+                    f"({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+        return self.games_from_rows(rows)
+
+    @staticmethod
+    def games_from_rows(rows: List[Tuple[str]]) -> Dict[str, GameData]:
+        games = {}
+        for (data,) in rows:
+            game = GameData.deserialize(json.loads(data))
+            games[game.game_id] = game
+        return games
+
+    def save_games(self, database: GameDatabase, game_ids: List[str]) -> None:
+        """写入新增或有变化的游戏，之后内存中只保留不含细节的版本"""
+        with self.connection.transaction() as db:
+            for game_id in game_ids:
+                game = database.all_game_data[game_id]
+                obj = game.serialize()
+                # 已经保存过的游戏（内存中不含细节）只更新积分相关的数据
+                if game.has_detail:
+                    db.execute("DELETE FROM rounds WHERE game_id = ?", (game_id,))
+                    db.executemany(
+                        "INSERT INTO rounds VALUES (?, ?, ?)",
+                        (
+                            (game_id, i, json.dumps(round_obj, ensure_ascii=False))
+                            for i, round_obj in enumerate(obj["rounds"])
+                        ),
+                    )
+                    game.strip_detail()
+                    obj["rounds"] = Deserializable.serialize_object(game.rounds)
+                db.execute(
+                    "INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        game_id,
+                        game.external_id,
+                        game.date.isoformat(),
+                        game.game_type.name,
+                        json.dumps(game.preview.serialize(), ensure_ascii=False),
+                        json.dumps(obj, ensure_ascii=False),
+                    ),
+                )
+                # 保留 history_index：重新计算积分时玩家的游戏记录不一定会重新保存
+                db.executemany(
+                    "INSERT INTO game_results VALUES (?, ?, ?, ?, ?, ?, NULL) "
+                    "ON CONFLICT (game_id, seat) DO UPDATE SET "
+                    "player_id = excluded.player_id, "
+                    "player_points = excluded.player_points, "
+                    "pt_delta = excluded.pt_delta, r_delta = excluded.r_delta",
+                    (
+                        (
+                            game_id,
+                            seat,
+                            game.players[seat].player_id,
+                            game.player_points[seat],
+                            game.pt_delta[seat],
+                            game.r_delta[seat],
+                        )
+                        for seat in range(4)
+                    ),
+                )
+            record_changes(db, "game", game_ids)
+
+    def delete_games(self, database: GameDatabase, game_ids: List[str]) -> None:
+        """删除游戏及其牌局和结果"""
+        rows = [(game_id,) for game_id in game_ids]
+        with self.connection.transaction() as db:
+            db.executemany("DELETE FROM rounds WHERE game_id = ?", rows)
+            db.executemany("DELETE FROM game_results WHERE game_id = ?", rows)
+            db.executemany("DELETE FROM games WHERE game_id = ?", rows)
+            record_changes(db, "game", game_ids)
+
+    def load_game_detail(self, game_id: str) -> Optional[GameData]:
+        """合并 games 和 rounds 中的数据，读取完整的游戏"""
+        with self.connection.transaction() as db:
+            row = db.execute(
+                "SELECT data FROM games WHERE game_id = ?", (game_id,)
+            ).fetchone()
+            rounds = db.execute(
+                "SELECT data FROM rounds WHERE game_id = ? ORDER BY round_index",
+                (game_id,),
+            ).fetchall()
+        if row is None:
+            return None
+        obj = json.loads(row[0])
+        obj["rounds"] = [json.loads(data) for (data,) in rounds]
+        return GameData.deserialize(obj)
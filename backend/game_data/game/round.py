@@ -2,10 +2,11 @@
 
 from __future__ import annotations
 
+import dataclasses
 import sys
 from dataclasses import dataclass, field
 from enum import auto, IntEnum, StrEnum
-from typing import List, Optional, Tuple
+from typing import ClassVar, List, Optional, Tuple
 
 from .names import YAKU_NAMES
 from game_data.io import Deserializable
@@ -93,7 +94,7 @@ class RoundEnding(StrEnum):
             return RoundEnding.NULL
 
 
-@dataclass
+@dataclass(slots=True)
 class RoundWin(Deserializable):
     """一个玩家的和牌（一局可能包含多个）
 
@@ -154,6 +155,9 @@ class RoundWin(Deserializable):
 class BaseRound(Deserializable):
     """一局游戏的结果（无论采用何种方式录入的共同接口）"""
 
+    DETAIL_FIELDS: ClassVar[Tuple[str, ...]] = ("final_hands",)
+    """计算积分不需要的牌局细节，可以单独存储"""
+
     ending: RoundEnding
 
     prevailing_wind: Wind
@@ -181,11 +185,39 @@ class BaseRound(Deserializable):
     ] = field(default=None)
     """结束时每家的牌"""
 
+    @classmethod
+    def deserialize(cls, obj: dict) -> BaseRound:
+        """目前所有保存的牌局均由天凤 JSON 录入，按照 TenhouRound 读取"""
+        if cls is BaseRound:
+            return TenhouRound.deserialize(obj)
+        return super().deserialize(obj)
+
+    def strip_detail(self):
+        """清除牌局细节，只保留计算积分所需的数据"""
+        for name in self.DETAIL_FIELDS:
+            setattr(self, name, None)
+
+    @property
+    def has_detail(self) -> bool:
+        """是否含有牌局细节"""
+        return any(getattr(self, name) is not None for name in self.DETAIL_FIELDS)
+
+    def with_detail(self) -> BaseRound:
+        """返回包含牌局细节的版本（需要时由子类计算）"""
+        return self
+
 
 @dataclass
 class TenhouRound(BaseRound):
     """一局游戏的结果（通过天凤 JSON 录入）"""
 
+    DETAIL_FIELDS: ClassVar[Tuple[str, ...]] = (
+        "final_hands",
+        "riichi_status",
+        "full_info",
+        "log",
+    )
+
     wins: List[RoundWin] = field(default_factory=list)
     """和牌情况（可能包括 0-3 个），流局满贯时应为 4 番 40 符"""
 
@@ -194,6 +226,27 @@ class TenhouRound(BaseRound):
 
     full_info: Optional[RoundFullInfo] = field(default=None)
 
+    log: Optional[list] = field(default=None)
+    """天凤 JSON 中这一局的原始数据，final_hands、riichi_status 和 full_info
+    由此在查看时模拟得出（之前录入的牌局没有此项，直接保存了模拟结果）"""
+
+    def with_detail(self) -> TenhouRound:
+        """返回模拟出牌局细节的副本；已有细节或没有原始数据时返回自身"""
+        if self.log is None or self.full_info is not None:
+            return self
+        try:
+            full_info, final_status = RoundFullInfo.simulate(self.log)
+        except (AssertionError, RoundSimulationFailure) as e:
+            print(f"未能加载牌局 {e}", file=sys.stderr)
+            return dataclasses.replace(self, log=None)
+        return dataclasses.replace(
+            self,
+            final_hands=[(*status, full_info.agari) for status in final_status],
+            riichi_status=full_info.riichi_status,
+            full_info=full_info,
+            log=None,
+        )
+
     @classmethod
     def from_json(cls, obj: list) -> TenhouRound:
         """从 JSON 数据中读取"""
@@ -255,18 +308,7 @@ class TenhouRound(BaseRound):
         else:
             print(f"未实现的结局：{state}")
 
-        try:
-            full_info = RoundFullInfo.from_json(obj)
-            final_hands = [
-                (*player.status, full_info.agari)
-                for player in full_info.player_final_status
-            ]
-            riichi_status = full_info.riichi_status
-        except (AssertionError, RoundSimulationFailure) as e:
-            print(f"未能加载牌局 {e}", file=sys.stderr)
-            final_hands = None
-            riichi_status = None
-            full_info = None
+        # 牌局细节在查看时才模拟（见 with_detail）
         return TenhouRound(
             ending=ending,
             prevailing_wind=wind,
@@ -275,10 +317,8 @@ class TenhouRound(BaseRound):
             kyoutaku=kyoutaku,
             initial_points=initial_points,
             result_points=result_points,
-            final_hands=final_hands,
-            riichi_status=riichi_status,
             wins=wins,
-            full_info=full_info,
+            log=obj,
         )
 
 
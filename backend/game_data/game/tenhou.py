@@ -4,6 +4,7 @@ from __future__ import annotations
 import re
 from dataclasses import dataclass, field
 from enum import Enum, auto
+from itertools import compress
 from typing import List, Optional, Union, Tuple
 
 from ..io import Deserializable
@@ -14,6 +15,21 @@ TILE_ORDER = {
     for i, s in enumerate("mpsz")
     for j, v in enumerate("1234056789")
 }
+"""麻将牌的整数编码，按照编码排序即为理牌顺序"""
+
+TILE_COUNT = len(TILE_ORDER)
+"""编码的数量；副露中横置（吃碰杠来源）的牌编码为原编码加上此值"""
+
+TILE_NAMES = [*TILE_ORDER, *(t.upper() for t in TILE_ORDER)]
+"""每个编码对应的字符串，横置的牌为大写"""
+
+TENHOU_TILE_CODES = [
+    TILE_ORDER[f"{v % 10}{'mpsz'[v // 10 - 1]}" if v < 50 else f"0{'mps'[v - 51]}"]
+    for v in range(54)
+]
+"""天凤的数字对应的编码"""
+
+_TILE_CODES = range(TILE_COUNT)
 
 
 class RoundSimulationFailure(Exception):
@@ -25,33 +41,41 @@ def sorted_tiles(tiles: List[str]) -> List[str]:
     return sorted(tiles, key=lambda t: TILE_ORDER[t])
 
 
-def parse_tenhou_tile(value: int) -> str:
-    """从天凤的数字中解析麻将牌"""
-    if value < 50:
-        return f"{value % 10}{'mpsz'[value // 10 - 1]}"
-    return f"0{'mps'[value - 51]}"
+def tile_names(codes: List[int]) -> List[str]:
+    """将编码转换为字符串"""
+    return [TILE_NAMES[c] for c in codes]
+
+
+def parse_tenhou_tile(value: int) -> int:
+    """从天凤的数字中解析麻将牌，返回编码"""
+    return TENHOU_TILE_CODES[value]
 
 
-def parse_tenhou_meld(string: str) -> Tuple[List[str], str, int]:
-    """从例如 p313131 的字符串中解析，返回副露、所吃碰杠的牌、吃碰杠的来源"""
+def parse_tenhou_meld(string: str) -> Tuple[List[int], Optional[int], Optional[int]]:
+    """从例如 p313131 的字符串中解析，返回副露、所吃碰杠的牌、吃碰杠的来源（均为编码）"""
     index = None
     draw = None
     i = 0
     meld = []
     while i < len(string):
         if "0" <= string[i] <= "9":
-            tile = parse_tenhou_tile(int(string[i : i + 2]))
+            tile = TENHOU_TILE_CODES[int(string[i : i + 2])]
             meld.append(tile)
-            if draw == "":
+            if index is not None and draw is None:
                 draw = tile
             i += 2
         else:
             index = i // 2
             i += 1
-            draw = ""
     return meld, draw, index
 
 
+def _plain_tile(code: int) -> int:
+    """不区分横置和赤宝牌的编码"""
+    code %= TILE_COUNT
+    return code + 1 if code % 10 == 4 else code
+
+
 class MeldType(Enum):
     """副露类型"""
 
@@ -65,7 +89,7 @@ class MeldType(Enum):
     """暗杠"""
 
 
-@dataclass
+@dataclass(slots=True)
 class TenhouRoundPlayerStatus(Deserializable):
     """一个玩家相关的牌"""
 
@@ -84,72 +108,123 @@ class TenhouRoundPlayerStatus(Deserializable):
     river: List[str] = field(default_factory=list)
     """牌河，包括被吃碰杠的牌"""
 
-    def _remove_from_hand(self, tile: str):
+    @property
+    def status(self) -> Tuple[List[str], List[List[str]]]:
+        """返回：暗牌、明牌"""
+        return sorted_tiles(self.hand), [
+            sorted_tiles([m.lower() for m in meld]) for meld in self.meld
+        ]
+
+
+@dataclass(slots=True)
+class TenhouPlayerSimulation:
+    """模拟牌局时一个玩家相关的牌，全部使用整数编码，结束后转换为 TenhouRoundPlayerStatus
+
+    手牌记录为每种编码的数量（赤宝牌单独计数），摸牌、切牌都只需修改一个计数，
+    按照编码顺序展开即为理好的手牌"""
+
+    dealer: int
+    """庄家座次"""
+
+    seat: int
+    """本家座次"""
+
+    hand_counts: List[int]
+    """手中每种编码的牌的数量（长度为 TILE_COUNT）"""
+
+    meld: List[List[int]] = field(default_factory=list)
+    """副露面子、刻子以及暗杠"""
+
+    river: List[int] = field(default_factory=list)
+    """牌河，包括被吃碰杠的牌"""
+
+    @staticmethod
+    def deal(dealer: int, seat: int, tiles: List[int]) -> TenhouPlayerSimulation:
+        """根据配牌创建"""
+        hand_counts = [0] * TILE_COUNT
+        for t in tiles:
+            hand_counts[t] += 1
+        return TenhouPlayerSimulation(dealer, seat, hand_counts)
+
+    def _remove_from_hand(self, tile: int):
         """从手牌中移除"""
-        try:
-            self.hand.remove(tile)
-        except ValueError:
+        if not self.hand_counts[tile]:
             raise RoundSimulationFailure
+        self.hand_counts[tile] -= 1
 
-    def discard(self, tile: str):
+    def discard(self, tile: int):
         """模拟切牌"""
         self._remove_from_hand(tile)
         self.river.append(tile)
 
-    def draw_and_discard(self, draw: str, discard: str):
-        """模拟摸牌和切牌"""
-        self.hand.append(draw)
-        self.discard(discard)
+    def draw_and_discard(self, draw: int, discard: int):
+        """模拟摸牌和切牌（每巡都会调用，直接修改计数）"""
+        hand_counts = self.hand_counts
+        hand_counts[draw] += 1
+        if not hand_counts[discard]:
+            raise RoundSimulationFailure
+        hand_counts[discard] -= 1
+        self.river.append(discard)
 
-    def ankan(self, draw: str, tiles: List[str]):
+    def ankan(self, draw: int, tiles: List[int]):
         """模拟暗杠"""
-        self.hand.append(draw)
+        self.hand_counts[draw] += 1
         for t in tiles:
             self._remove_from_hand(t)
         self.meld.append(tiles)
 
-    def chakan(self, draw: str):
+    def chakan(self, draw: int):
         """模拟加杠"""
         # 寻找对应的碰牌，并在横牌的前面插入
+        tile = _plain_tile(draw)
         for m in self.meld:
-            if m[0].lower().replace("0", "5") == draw.lower().replace("0", "5"):
+            if _plain_tile(m[0]) == tile:
                 for i in range(3):
-                    if m[i][1] in "MPSZ":
-                        m.insert(i, draw.upper())
+                    if m[i] >= TILE_COUNT:
+                        m.insert(i, draw + TILE_COUNT)
                         break
                 break
 
-    def daiminkan(self, draw: str, tiles: List[str], distance: int):
+    def daiminkan(self, draw: int, tiles: List[int], distance: int):
         """模拟大明杠"""
-        self.hand.append(draw)
-        for t in tiles:
-            self._remove_from_hand(t)
-        meld = tiles.copy()
-        meld[distance] = meld[distance].upper()
-        self.meld.append(meld)
+        self.pon(draw, tiles, distance)
 
-    def chi(self, draw: str, tiles: List[str]):
+    def chi(self, draw: int, tiles: List[int]):
         """模拟吃"""
         self.pon(draw, tiles, 0)
 
-    def pon(self, draw: str, tiles: List[str], distance: int):
+    def pon(self, draw: int, tiles: List[int], distance: int):
         """模拟碰"""
-        self.hand.append(draw)
+        self.hand_counts[draw] += 1
         for t in tiles:
             self._remove_from_hand(t)
         meld = tiles.copy()
-        meld[distance] = meld[distance].upper()
+        meld[distance] += TILE_COUNT
         self.meld.append(meld)
 
     @property
     def status(self) -> Tuple[List[str], List[List[str]]]:
         """返回：暗牌、明牌"""
-        return sorted_tiles(self.hand), [
-            sorted_tiles([m.lower() for m in meld]) for meld in self.meld
+        hand = []
+        # 按照编码顺序展开数量不为 0 的牌
+        for code in compress(_TILE_CODES, self.hand_counts):
+            hand += [TILE_NAMES[code]] * self.hand_counts[code]
+        return hand, [
+            tile_names(sorted(t % TILE_COUNT for t in meld)) for meld in self.meld
         ]
 
+    def to_status(self, hand: List[str]) -> TenhouRoundPlayerStatus:
+        """转换为使用字符串保存的状态，hand 为 status 中（已排序）的暗牌"""
+        return TenhouRoundPlayerStatus(
+            dealer=self.dealer,
+            seat=self.seat,
+            hand=hand,
+            meld=[tile_names(m) for m in self.meld],
+            river=tile_names(self.river),
+        )
+
 
-@dataclass
+@dataclass(slots=True)
 class RoundFullInfo(Deserializable):
     """牌局完整信息"""
 
@@ -188,15 +263,21 @@ class RoundFullInfo(Deserializable):
 
     @staticmethod
     def from_json(obj) -> RoundFullInfo:
+        return RoundFullInfo.simulate(obj)[0]
+
+    @staticmethod
+    def simulate(
+        obj,
+    ) -> Tuple[RoundFullInfo, List[Tuple[List[str], List[List[str]]]]]:
+        """模拟牌局，返回牌局信息和每个玩家最后的暗牌、明牌"""
+        codes = TENHOU_TILE_CODES
         round_number, honba, kyoutaku = obj[0]
         wind = round_number // 4
         dealer = round_number % 4
         initial_points = obj[1]
-        dora = [parse_tenhou_tile(v) for v in obj[2]]
-        uradora = [parse_tenhou_tile(v) for v in obj[3]]
-        initial_hands = [[parse_tenhou_tile(v) for v in l] for l in obj[4:16:3]]
+        initial_hands = [[codes[v] for v in l] for l in obj[4:16:3]]
         players = [
-            TenhouRoundPlayerStatus(dealer, i, initial_hands[i]) for i in range(4)
+            TenhouPlayerSimulation.deal(dealer, i, initial_hands[i]) for i in range(4)
         ]
         # 立直状态
         riichi_status = [False] * 4
@@ -215,7 +296,7 @@ class RoundFullInfo(Deserializable):
         # 如果接下来 3 要碰 1，则加入 (1, 3)
         order_jumps = []
         # 和牌（最后一张打出的牌，或最后一个自摸的牌）注：不判断是否和牌
-        agari: Optional[str] = None
+        agari: Optional[int] = None
 
         # 检查第一轮有没有人吃碰杠准备
         for p in range(4):
@@ -228,13 +309,13 @@ class RoundFullInfo(Deserializable):
             last_discard_riichi_player = -1
             if indices[current] == len(discards[current]):
                 # 自摸
-                agari = parse_tenhou_tile(draw)
+                agari = codes[draw]
                 break
             discard = discards[current][indices[current]]
             indices[current] += 1
             # 暗杠：特殊处理
             if isinstance(discard, str) and "a" in discard:
-                draw_tile = parse_tenhou_tile(draw)
+                draw_tile = codes[draw]
                 players[current].ankan(
                     draw_tile,
                     parse_tenhou_meld(discard)[0],
@@ -243,7 +324,7 @@ class RoundFullInfo(Deserializable):
                 continue
             # 加杠：特殊处理
             if isinstance(discard, str) and "k" in discard:
-                draw_tile = parse_tenhou_tile(draw)
+                draw_tile = codes[draw]
                 players[current].chakan(draw_tile)
                 agari = draw_tile
                 continue
@@ -260,7 +341,7 @@ class RoundFullInfo(Deserializable):
                 if "m" in draw:
                     players[current].daiminkan(draw_tile, meld, distance)
                     continue
-                discard_tile = parse_tenhou_tile(discard)
+                discard_tile = codes[discard]
                 agari = discard_tile
                 if "c" in draw:
                     players[current].chi(draw_tile, meld)
@@ -271,13 +352,13 @@ class RoundFullInfo(Deserializable):
                 else:
                     raise RoundSimulationFailure()
             else:
-                draw_tile = parse_tenhou_tile(draw)
+                draw_tile = codes[draw]
                 if discard == 60:
                     # 摸切
                     discard_tile = draw_tile
                 else:
                     # 手切
-                    discard_tile = parse_tenhou_tile(discard)
+                    discard_tile = codes[discard]
                 agari = discard_tile
                 players[current].draw_and_discard(draw_tile, discard_tile)
             # 检查此家打出的牌有没有被吃碰杠
@@ -299,16 +380,20 @@ class RoundFullInfo(Deserializable):
         if last_discard_riichi_player != -1:
             riichi_status[last_discard_riichi_player] = False
 
-        return RoundFullInfo(
+        final_status = [p.status for p in players]
+        full_info = RoundFullInfo(
             wind=wind,
             dealer=dealer,
             honba=honba,
             riichi_status=riichi_status,
             kyoutaku=kyoutaku,
             initial_points=initial_points,
-            initial_hands=initial_hands,
-            dora=dora,
-            uradora=uradora,
-            agari=agari,
-            player_final_status=players,
+            initial_hands=[tile_names(h) for h in initial_hands],
+            dora=[TILE_NAMES[codes[v]] for v in obj[2]],
+            uradora=[TILE_NAMES[codes[v]] for v in obj[3]],
+            agari=None if agari is None else TILE_NAMES[agari],
+            player_final_status=[
+                p.to_status(hand) for p, (hand, _) in zip(players, final_status)
+            ],
         )
+        return full_info, final_status
@@ -2,11 +2,12 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import List, Optional
 
+from .game_type import GameType
 from .player_snapshot import PlayerSnapshot
 from .io import Deserializable
 
 
-@dataclass
+@dataclass(slots=True)
 class GamePreview(Deserializable):
     """简略的游戏摘要"""
 
@@ -31,5 +32,5 @@ class GamePreview(Deserializable):
     r_delta: List[float]
     """玩家获得的 R 分数"""
 
-    game_type: str
+    game_type: GameType
     """游戏的类型（雀魂或手动录入）"""
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import ClassVar, Dict, List, Optional
+
+from .io import Deserializable
+
+
+@dataclass
+class GameType(Deserializable):
+    """游戏类型"""
+
+    Enum: ClassVar[Dict[str, GameType]] = {}
+    """利用 name 反向查找对应的对象"""
+
+    name: str
+    """游戏类型显示名称"""
+
+    pt_multiplier: float = field(default=1)
+    """点数的乘数系数"""
+
+    r_multiplier: float = field(default=1)
+    """r 点的乘数系数"""
+
+    uma: Optional[List[int]] = field(default=None)
+    """马点计算方式，例如 [10000, 20000, 30000, 40000]（如果不按马点计算则为 None）"""
+
+    def __post_init__(self):
+        """将创建过的对象自动保存到 Enum 中"""
+        if self.name not in GameType.Enum:
+            GameType.Enum[self.name] = self
@@ -0,0 +1,281 @@
+"""读取并解析牌谱文件
+
+解析（读取 JSON、模拟牌局）与玩家当时的状态无关，可以在多个子进程中并行进行；
+积分计算依赖之前的所有游戏，需要在主进程中按照时间顺序处理"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime
+from multiprocessing.connection import Connection, wait
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+from .game import GameType, BaseRound, TenhouRound
+from .game import MAJSOUL_GAME_SOUTH4, MAJSOUL_GAME_EAST4, OFFLINE_GAME_DEFAULT
+
+RAW_DIRECTORIES: Dict[str, str] = {
+    "tenhou": "data/tenhou",
+    "paipu": "data/paipu",
+    "offline": "data/offline",
+}
+"""牌谱来源及其目录（按照读取顺序）"""
+
+PARALLEL_THRESHOLD = 32
+"""文件数量达到此值时使用多进程解析"""
+
+PARALLEL_PROCESSES = int(os.getenv("WDK_INGEST_PROCESSES", 0)) or os.cpu_count() or 1
+"""解析牌谱的进程数量"""
+
+
+def paipu_parse_id(obj) -> str:
+    """从雀魂牌谱中解析外部 ID"""
+    return obj["gamedata"]["uuid"]
+
+
+def tenhou_parse_id(obj) -> str:
+    """从天凤牌谱中解析外部 ID"""
+    return obj["ref"]
+
+
+def offline_parse_id(obj) -> str:
+    """从线下 JSON 中生成游戏 ID"""
+    return f"{obj['game_date']} {':'.join(obj['player_ids'])}"
+
+
+def paipu_parse_timestamp(obj) -> datetime:
+    """从雀魂牌谱中解析时间戳"""
+    return datetime.fromtimestamp(obj["gamedata"]["starttime"])
+
+
+def tenhou_parse_timestamp(obj) -> datetime:
+    """从天凤牌谱中解析时间戳"""
+    # 不同保存方式可能采用不同的时间戳格式
+    try:
+        return datetime.strptime(obj["title"][1], r"%m/%d/%Y, %I:%M:%S %p")
+    except ValueError:
+        return datetime.strptime(obj["title"][1], r"%Y/%m/%d %H:%M:%S")
+
+
+def offline_parse_timestamp(obj) -> datetime:
+    """从线下 JSON 中解析时间戳"""
+    return datetime.fromisoformat(obj["game_date"])
+
+
+@dataclass
+class GamePayload:
+    """解析完成、等待录入的游戏：包含除玩家当时状态以外创建 GameData 所需的全部数据"""
+
+    source: str
+    """牌谱来源（RAW_DIRECTORIES 中的 key）"""
+
+    external_id: str
+    """外部 ID"""
+
+    game_date: datetime
+    """游戏时间"""
+
+    game_type: str
+    """游戏类型名称（GameType.Enum 中的 key）"""
+
+    player_keys: List[Any]
+    """用于查找玩家的信息：天凤用户名、雀魂 (ID, 用户名) 或线下玩家 ID"""
+
+    player_points: List[int]
+    """玩家最终点数"""
+
+    rounds: List[BaseRound] = field(default_factory=list)
+    """每局的详细信息"""
+
+    yakuman_count: Optional[List[int]] = None
+    """玩家役满数量"""
+
+
+def parse_paipu_json(game_obj: dict) -> GamePayload:
+    """解析雀魂牌谱
+
+    使用 https://github.com/zyr17/MajsoulPaipuAnalyzer 生成的牌谱"""
+    round_count = game_obj["gamedata"]["roomdata"]["round"]
+    match round_count:
+        case 8:
+            game_type = MAJSOUL_GAME_SOUTH4
+        case 4:
+            game_type = MAJSOUL_GAME_EAST4
+        case _:
+            raise ValueError(f"雀魂牌谱轮数无法解析：{round_count}")
+
+    return GamePayload(
+        source="paipu",
+        external_id=paipu_parse_id(game_obj),
+        game_date=paipu_parse_timestamp(game_obj),
+        game_type=game_type.name,
+        player_keys=[(p["id"], p["name"]) for p in game_obj["gamedata"]["playerdata"]],
+        player_points=[
+            int(x) for x in game_obj["record"][-1]["action"][-1][1:].split("|")
+        ],
+    )
+
+
+def parse_tenhou_json(game_obj: dict) -> GamePayload:
+    """解析天凤格式的牌谱（包括模拟每一局）"""
+    game_type_str = game_obj["rule"]["disp"]
+    match game_type_str:
+        case "Friendly South" | "友人戦南喰赤":
+            game_type = MAJSOUL_GAME_SOUTH4
+        case "Friendly East" | "友人戦東喰赤":
+            game_type = MAJSOUL_GAME_EAST4
+        case _:
+            raise ValueError(f"天凤牌谱游戏类型无法解析：{game_type_str}")
+
+    return GamePayload(
+        source="tenhou",
+        external_id=tenhou_parse_id(game_obj),
+        game_date=tenhou_parse_timestamp(game_obj),
+        game_type=game_type.name,
+        player_keys=list(game_obj["name"]),
+        player_points=game_obj["sc"][::2],
+        rounds=[TenhouRound.from_json(r) for r in game_obj["log"]],
+    )
+
+
+def parse_offline_json(game_obj: dict) -> GamePayload:
+    """解析线下游戏 JSON"""
+    return GamePayload(
+        source="offline",
+        external_id=offline_parse_id(game_obj),
+        game_date=offline_parse_timestamp(game_obj),
+        game_type=GameType.Enum.get(game_obj["game_type"], OFFLINE_GAME_DEFAULT).name,
+        player_keys=game_obj["player_ids"],
+        player_points=game_obj["player_points"],
+        yakuman_count=game_obj.get("yakuman_count"),
+    )
+
+
+PARSERS = {
+    "tenhou": (tenhou_parse_id, parse_tenhou_json),
+    "paipu": (paipu_parse_id, parse_paipu_json),
+    "offline": (offline_parse_id, parse_offline_json),
+}
+"""每种来源的 ID 解析函数和牌谱解析函数"""
+
+_known_external_ids: Collection[str] = ()
+"""已经录入的外部 ID（子进程通过 fork 继承）"""
+
+
+def list_raw_files() -> List[Tuple[str, str]]:
+    """列出所有牌谱文件及其来源"""
+    files = []
+    for source, directory in RAW_DIRECTORIES.items():
+        try:
+            files += [
+                (os.path.join(directory, f), source) for f in os.listdir(directory)
+            ]
+        except FileNotFoundError:
+            print(f"无牌谱目录 {directory}", file=sys.stderr)
+    return files
+
+
+ParseResult = Tuple[Optional[str], Optional[GamePayload], Optional[str]]
+"""解析一个文件的结果：外部 ID、解析结果和错误信息"""
+
+
+def parse_raw_file(path: str, source: str) -> ParseResult:
+    """读取并解析一个牌谱文件
+
+    已经录入的游戏只解析 ID，不解析牌谱（解析结果为 None）"""
+    id_parser, parser = PARSERS[source]
+    try:
+        with open(path) as file:
+            data = json.load(file)
+        external_id = id_parser(data)
+        if external_id in _known_external_ids:
+            return external_id, None, None
+        return external_id, parser(data), None
+    except (KeyError, TypeError, ValueError, IndexError) as e:
+        return None, None, str(e)
+
+
+def _parse_in_child(files: List[Tuple[str, str]], connection: Connection):
+    """子进程：解析一组文件，并将结果发送给主进程"""
+    connection.send([parse_raw_file(path, source) for path, source in files])
+    connection.close()
+
+
+def _parse_in_parallel(
+    files: List[Tuple[str, str]], processes: int
+) -> List[ParseResult]:
+    """将文件交错分配给多个 fork 出的子进程解析，按原顺序返回结果
+
+    启动时的解析发生在 game_data 包导入期间，后台线程无法获取导入锁，
+    因此不使用 multiprocessing.Pool（其任务分发线程需要序列化函数），
+    而是由子进程直接继承任务，主线程接收结果"""
+    context = multiprocessing.get_context("fork")
+    results: List[Any] = [None] * len(files)
+    pending = {}
+    for i in range(processes):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_parse_in_child, args=(files[i::processes], sender), daemon=True
+        )
+        process.start()
+        sender.close()
+        pending[receiver] = (i, process)
+    while pending:
+        for receiver in wait(list(pending)):
+            i, process = pending.pop(receiver)
+            try:
+                results[i::processes] = receiver.recv()
+            except EOFError:
+                # 子进程异常退出，在主进程中重新解析
+                process.join()
+                print(f"解析牌谱的子进程异常退出：{process.exitcode}", file=sys.stderr)
+                results[i::processes] = [
+                    parse_raw_file(path, source) for path, source in files[i::processes]
+                ]
+            receiver.close()
+            process.join()
+    return results
+
+
+def parse_raw_files(
+    files: List[Tuple[str, str]],
+    known_external_ids: Collection[str],
+    processes: int = PARALLEL_PROCESSES,
+) -> Tuple[List[GamePayload], Dict[str, Optional[str]]]:
+    """解析牌谱文件，跳过已经录入和重复的游戏，按照游戏时间排序
+
+    同时返回每个文件的外部 ID（无法读取的文件为 None）
+
+    文件较多时使用 processes 个进程解析（需要支持 fork）"""
+    global _known_external_ids
+    _known_external_ids = known_external_ids
+    try:
+        processes = min(processes, len(files))
+        if (
+            len(files) >= PARALLEL_THRESHOLD
+            and processes > 1
+            and "fork" in multiprocessing.get_all_start_methods()
+        ):
+            results = _parse_in_parallel(files, processes)
+        else:
+            results = [parse_raw_file(path, source) for path, source in files]
+    finally:
+        _known_external_ids = ()
+
+    payloads = []
+    new_game_ids = set()
+    file_ids = {}
+    for (path, _), (external_id, payload, error) in zip(files, results):
+        file_ids[path] = external_id
+        if error is not None:
+            print(f"加载牌谱：无法读取 {path}", file=sys.stderr)
+            print(error)
+            continue
+        # 去重
+        if payload is None or payload.external_id in new_game_ids:
+            continue
+        new_game_ids.add(payload.external_id)
+        payloads.append(payload)
+    return sorted(payloads, key=lambda p: p.game_date), file_ids
@@ -2,11 +2,20 @@ from __future__ import annotations
 
 import dataclasses
 import gzip
+import itertools
 import json
+import os
+from collections.abc import Sequence
 from dataclasses import dataclass
 from datetime import date, datetime
 from typing import (
     Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
     Type,
     TypeVar,
     Union,
@@ -17,59 +26,192 @@ from typing import (
 
 T = TypeVar("T", bound="Deserializable")
 
+_TYPE_DECODERS: Dict[Any, Callable[[Any], Any]] = {}
+"""每个类型对应的读取函数，缓存变量"""
+
+_CLASS_DECODERS: Dict[type, Callable[[dict], Any]] = {}
+"""每个 dataclass 生成的读取函数，缓存变量"""
+
+_CLASS_ENCODERS: Dict[Tuple[type, bool], Callable[[Any], dict]] = {}
+"""每个 dataclass 生成的序列化函数（分别对应 exclude_non_repr），缓存变量"""
+
+
+class ListPrefix(Sequence):
+    """列表前若干项的只读视图（创建时的长度），不复制列表
+
+    原列表之后只能在末尾追加，其他修改需要先复制列表再修改，视图的内容才不会变化"""
+
+    __slots__ = ("items", "length")
+
+    def __init__(self, items: List[Any]):
+        self.items = items
+        self.length = len(items)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step == 1:
+                return self.items[start:stop]
+            return [self.items[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("list index out of range")
+        return self.items[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        return itertools.islice(self.items, self.length)
+
+
+def _type_decoder(ty: Any) -> Callable[[Any], Any]:
+    """返回将 JSON 对象转化为指定类型的函数（只在第一次使用时分析类型）"""
+    try:
+        return _TYPE_DECODERS[ty]
+    except KeyError:
+        pass
+    origin = get_origin(ty)
+    if origin is Union:
+        # 应为 Optional
+        assert get_args(ty)[1] is type(None)
+        inner = _type_decoder(get_args(ty)[0])
+        decoder = lambda obj: None if obj is None else inner(obj)
+    elif origin is list:
+        inner = _type_decoder(get_args(ty)[0])
+        decoder = lambda obj: [inner(item) for item in obj]
+    elif origin is tuple:
+        inners = [_type_decoder(t) for t in get_args(ty)]
+        decoder = lambda obj: [d(item) for (d, item) in zip(inners, obj)]
+    elif origin is dict:
+        key_decoder, value_decoder = map(_type_decoder, get_args(ty))
+        decoder = lambda obj: {
+            key_decoder(key): value_decoder(value) for key, value in obj.items()
+        }
+    elif issubclass(ty, Deserializable):
+        # 通过 deserialize 读取，以便子类重载
+        decoder = ty.deserialize
+    elif issubclass(ty, datetime):
+        decoder = datetime.fromisoformat
+    else:
+        decoder = ty
+    _TYPE_DECODERS[ty] = decoder
+    return decoder
+
+
+def _type_encoder(ty: Any, exclude_non_repr: bool) -> Optional[Callable[[Any], Any]]:
+    """返回将指定类型转化为 JSON 对象的函数，不需要转化的类型返回 None"""
+    origin = get_origin(ty)
+    if origin is Union:
+        inner = _type_encoder(get_args(ty)[0], exclude_non_repr)
+        if inner is None:
+            return None
+        return lambda obj: None if obj is None else inner(obj)
+    if origin is list:
+        inner = _type_encoder(get_args(ty)[0], exclude_non_repr)
+        if inner is None:
+            return list
+        return lambda obj: [inner(item) for item in obj]
+    if origin is tuple:
+        inners = [
+            _type_encoder(t, exclude_non_repr) or (lambda item: item)
+            for t in get_args(ty)
+        ]
+        return lambda obj: [e(item) for (e, item) in zip(inners, obj)]
+    if origin is dict:
+        key_encoder, value_encoder = (
+            _type_encoder(t, exclude_non_repr) or (lambda item: item)
+            for t in get_args(ty)
+        )
+        return lambda obj: {
+            key_encoder(key): value_encoder(value) for key, value in obj.items()
+        }
+    if origin is None and isinstance(ty, type):
+        if issubclass(ty, Deserializable):
+            # 实际的对象可能是子类，按照对象本身的类型序列化
+            return lambda obj: _class_encoder(type(obj), exclude_non_repr)(obj)
+        if issubclass(ty, (datetime, date)):
+            return lambda obj: obj.isoformat()
+        if issubclass(ty, (str, int, float, bool)):
+            return None
+        if ty is list or ty is dict:
+            # 未标注元素类型的容器只用于保存原样的 JSON 数据（例如天凤牌谱），直接保留
+            return None
+    # 未标注具体类型，则按照实际的对象转化
+    return lambda obj: Deserializable.serialize_object(
+        obj, exclude_non_repr=exclude_non_repr
+    )
+
+
+def _class_decoder(cls: Type[T]) -> Callable[[dict], T]:
+    """为 dataclass 生成读取函数：只读取 repr 为 True 的字段，None 直接保留"""
+    try:
+        return _CLASS_DECODERS[cls]
+    except KeyError:
+        pass
+    type_hints = get_type_hints(cls)
+    namespace = {"cls": cls}
+    lines = ["def decode(obj):", "    kwargs = {}"]
+    for i, field in enumerate(dataclasses.fields(cls)):
+        if not field.repr:
+            continue
+        namespace[f"decode_{i}"] = _type_decoder(type_hints[field.name])
+        lines += [
+            f"    if {field.name!r} in obj:",
+            f"        value = obj[{field.name!r}]",
+            f"        kwargs[{field.name!r}] = "
+            f"None if value is None else decode_{i}(value)",
+        ]
+    lines.append("    return cls(**kwargs)")
+    exec("\n".join(lines), namespace)
+    decoder = _CLASS_DECODERS[cls] = namespace["decode"]
+    return decoder
+
+
+def _class_encoder(cls: type, exclude_non_repr: bool) -> Callable[[Any], dict]:
+    """为 dataclass 生成序列化函数，基础类型的字段直接复制"""
+    try:
+        return _CLASS_ENCODERS[cls, exclude_non_repr]
+    except KeyError:
+        pass
+    type_hints = get_type_hints(cls)
+    namespace = {}
+    items = []
+    for i, field in enumerate(dataclasses.fields(cls)):
+        if exclude_non_repr and not field.repr:
+            continue
+        encoder = _type_encoder(type_hints[field.name], exclude_non_repr)
+        if encoder is None:
+            items.append(f"{field.name!r}: self.{field.name}")
+        else:
+            namespace[f"encode_{i}"] = encoder
+            items.append(f"{field.name!r}: encode_{i}(self.{field.name})")
+    exec(f"def encode(self):\n    return {{{', '.join(items)}}}", namespace)
+    encoder = _CLASS_ENCODERS[cls, exclude_non_repr] = namespace["encode"]
+    return encoder
+
 
 @dataclass
 class Deserializable:
-    """实现递归的从 JSON 对象构建（仅针对 dataclass 及基础类型）"""
+    """实现递归的从 JSON 对象构建（仅针对 dataclass 及基础类型）
+
+    每个类第一次读取或序列化时，根据字段类型生成专用的函数并缓存
+
+    数量很多的子类使用 @dataclass(slots=True) 节省内存，因此基类不能带有 __dict__；
+    带 slots 的类由 dataclass 重新创建，其方法中不能使用无参数的 super()"""
+
+    __slots__ = ()
 
     @staticmethod
     def deserialize_object(ty: type, obj: Any) -> Any:
         """读取对象并转化为指定的类型"""
-        if get_origin(ty) is Union:
-            # 应为 Optional
-            assert get_args(ty)[1] is type(None)
-            if obj is None:
-                return None
-            ty = get_args(ty)[0]
-            return Deserializable.deserialize_object(ty, obj)
-        if get_origin(ty) is list:
-            ty = get_args(ty)[0]
-            return [Deserializable.deserialize_object(ty, item) for item in obj]
-        if get_origin(ty) is tuple:
-            return [
-                Deserializable.deserialize_object(t, item)
-                for (t, item) in zip(get_origin(ty), obj)
-            ]
-        if get_origin(ty) is dict:
-            key_type, value_type = get_args(ty)
-            return {
-                Deserializable.deserialize_object(
-                    key_type, key
-                ): Deserializable.deserialize_object(value_type, value)
-                for key, value in obj.items()
-            }
-        if issubclass(ty, Deserializable):
-            return ty.deserialize(obj)
-        if issubclass(ty, datetime):
-            return datetime.fromisoformat(obj)
-        return ty(obj)
+        return _type_decoder(ty)(obj)
 
     @classmethod
     def deserialize(cls: Type[T], obj: dict) -> T:
         """读取对象并转化为当前类型"""
-        kwargs = {}
-        type_hints = get_type_hints(cls)
-        for field in dataclasses.fields(cls):
-            if not field.repr:
-                continue
-            name = field.name
-            if name not in obj:
-                continue
-            if obj[name] is None:
-                kwargs[name] = None
-                continue
-            kwargs[name] = cls.deserialize_object(type_hints[name], obj[name])
-        return cls(**kwargs)
+        return _class_decoder(cls)(obj)
 
     @classmethod
     def read_compressed_file(cls: Type[T], path: str) -> T:
@@ -83,7 +225,7 @@ class Deserializable:
         """递归地转化为可以 JSON 序列化的字典对象"""
         if isinstance(obj, Deserializable):
             return obj.serialize(exclude_non_repr=exclude_non_repr)
-        if isinstance(obj, (list, tuple)):
+        if isinstance(obj, (list, tuple, ListPrefix)):
             return [
                 Deserializable.serialize_object(item, exclude_non_repr=exclude_non_repr)
                 for item in obj
@@ -108,16 +250,15 @@ class Deserializable:
         （保存数据时应为 True，向前端发送数据时应为 False）
 
         date 和 datetime 会转换为 isoformat 字符串"""
-        result = {}
-        for field in dataclasses.fields(self):
-            if exclude_non_repr and not field.repr:
-                continue
-            result[field.name] = self.serialize_object(
-                getattr(self, field.name), exclude_non_repr=exclude_non_repr
-            )
-        return result
+        return _class_encoder(type(self), exclude_non_repr)(self)
 
     def write_compressed_data(self, path: str) -> None:
-        """将当前对象压缩保存于指定文件"""
-        with gzip.open(path, "wt") as file:
-            json.dump(self.serialize(), file)
+        """将当前对象压缩保存于指定文件
+
+        先写入临时文件再替换，避免写入中断时损坏原有文件"""
+        temp_path = f"{path}.tmp"
+        # 一次写入整个字符串，比 json.dump 逐段写入 gzip 快得多
+        # 压缩等级 6 比默认的 9 快数倍，文件只大不到 10%
+        with gzip.open(temp_path, "wt", compresslevel=6) as file:
+            file.write(json.dumps(self.serialize()))
+        os.replace(temp_path, path)
@@ -0,0 +1,73 @@
+"""追加写入的日志，用于增量保存数据库"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List
+
+JOURNAL_SUFFIX = ".journal"
+"""日志文件的后缀（与快照文件放在同一目录）"""
+
+COMPACT_THRESHOLD = 500
+"""日志中的记录数达到此数量时，合并为新的快照"""
+
+
+@dataclass
+class Journal:
+    """每行一个 JSON 记录的追加日志文件"""
+
+    path: str
+    """日志文件地址"""
+
+    length: int = field(default=0)
+    """日志中已有的记录数"""
+
+    def read(self) -> List[Any]:
+        """读取所有记录
+
+        如果最后一行因写入中断而不完整，则将其从文件中截去"""
+        records = []
+        valid_size = 0
+        try:
+            with open(self.path, "rb") as file:
+                for line in file:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError
+                        records.append(json.loads(line))
+                    except ValueError:
+                        print(f"日志 {self.path} 末尾不完整，已忽略", file=sys.stderr)
+                        break
+                    valid_size += len(line)
+            if valid_size != os.path.getsize(self.path):
+                os.truncate(self.path, valid_size)
+        except FileNotFoundError:
+            pass
+        self.length = len(records)
+        return records
+
+    def append(self, records: Iterable[Any]) -> None:
+        """在日志末尾追加记录，并确保写入磁盘"""
+        lines = [json.dumps(record, ensure_ascii=False) + "\n" for record in records]
+        if not lines:
+            return
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("".join(lines))
+            file.flush()
+            os.fsync(file.fileno())
+        self.length += len(lines)
+
+    def clear(self) -> None:
+        """清空日志（其中的记录应已合并入快照）"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.length = 0
+
+    @property
+    def should_compact(self) -> bool:
+        """记录数过多，应当合并为新的快照"""
+        return self.length >= COMPACT_THRESHOLD
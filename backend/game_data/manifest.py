@@ -0,0 +1,115 @@
+"""记录已经读取过的牌谱文件，启动时跳过没有变化的文件"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import Collection, Dict, List, Optional, Tuple
+
+from .io import Deserializable
+
+_DEFAULT_MANIFEST_PATH = "manifest.db"
+
+
+@dataclass
+class RawFileRecord(Deserializable):
+    """牌谱文件上次读取时的状态"""
+
+    size: int
+    """文件大小"""
+
+    mtime_ns: int
+    """修改时间（纳秒）"""
+
+    external_id: Optional[str] = None
+    """游戏的外部 ID，无法读取时为 None"""
+
+    ingested: bool = False
+    """游戏是否已经录入数据库"""
+
+
+@dataclass
+class RawFileManifest(Deserializable):
+    """牌谱文件清单，按照文件地址、大小和修改时间判断文件是否需要重新读取"""
+
+    manifest_path: str
+    """存储文件地址"""
+
+    records: Dict[str, RawFileRecord]
+    """每个牌谱文件上次读取时的状态"""
+
+    pending: Dict[str, os.stat_result] = field(
+        init=False, repr=False, default_factory=dict
+    )
+    """需要读取的文件在读取前的状态"""
+
+    @classmethod
+    def load(cls, path: str) -> RawFileManifest:
+        """读取清单，文件不存在时返回空清单"""
+        try:
+            manifest = cls.read_compressed_file(path)
+            manifest.manifest_path = path
+            return manifest
+        except FileNotFoundError:
+            return cls(path, {})
+
+    def changed_files(
+        self, files: List[Tuple[str, str]], known_external_ids: Collection[str]
+    ) -> List[Tuple[str, str]]:
+        """筛选出需要读取的文件：新增、有变化或者游戏不在数据库中的文件
+
+        同时删除已经不存在的文件的记录"""
+        changed = []
+        records = {}
+        self.pending = {}
+        for path, source in files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            record = self.records.get(path)
+            if (
+                record is not None
+                and record.ingested
+                and record.size == stat.st_size
+                and record.mtime_ns == stat.st_mtime_ns
+                and record.external_id in known_external_ids
+            ):
+                records[path] = record
+                continue
+            self.pending[path] = stat
+            changed.append((path, source))
+        self.records = records
+        return changed
+
+    def unchanged_record(
+        self, path: str, stat: os.stat_result
+    ) -> Optional[RawFileRecord]:
+        """文件在上次读取后没有变化时返回其记录，否则返回 None"""
+        record = self.records.get(path)
+        if (
+            record is not None
+            and record.size == stat.st_size
+            and record.mtime_ns == stat.st_mtime_ns
+        ):
+            return record
+        return None
+
+    def update(
+        self, file_ids: Dict[str, Optional[str]], known_external_ids: Collection[str]
+    ) -> None:
+        """记录读取过的文件，以及其中的游戏是否已经录入"""
+        for path, external_id in file_ids.items():
+            stat = self.pending.pop(path, None) or os.stat(path)
+            self.records[path] = RawFileRecord(
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                external_id=external_id,
+                ingested=external_id in known_external_ids,
+            )
+
+    def save(self) -> None:
+        """保存清单"""
+        self.write_compressed_data(self.manifest_path)
+
+
+raw_file_manifest = RawFileManifest.load(_DEFAULT_MANIFEST_PATH)
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
+import bisect
+import copy
 import uuid
 import dataclasses
+from datetime import datetime
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, List, Optional
 
 from ..player_snapshot import PlayerSnapshot
 from ..game_preview import GamePreview
-from ..io import Deserializable
+from ..io import Deserializable, ListPrefix
+from .rating_series import RatingSeries
 
 
 N_DAN = 10
@@ -26,6 +30,10 @@ NEW_PLAYER_R = 1500
 """新玩家的初始 R 值"""
 
 
+def _date(game: GamePreview) -> datetime:
+    return game.date
+
+
 @dataclass
 class PlayerData(Deserializable):
     """一个玩家的累积数据"""
@@ -42,8 +50,8 @@ class PlayerData(Deserializable):
     external_names: List[str]
     """玩家外部游戏名称"""
 
-    game_history: List[GamePreview]
-    """玩家历史所有游戏"""
+    game_ids: List[str]
+    """玩家历史所有游戏的 ID"""
 
     current_dan: int
     """当前的段位（0 表示一段）"""
@@ -65,6 +73,13 @@ class PlayerData(Deserializable):
     titles: List[str] = field(default_factory=list)
     """玩家称号"""
 
+    game_history: List[GamePreview] = field(
+        init=False, repr=False, default_factory=list
+    )
+    """玩家历史所有游戏（引用 GameDatabase 中唯一的游戏摘要），缓存变量
+
+    与 game_ids 一样只在末尾原地追加，其他修改替换为新的列表（见 view）"""
+
     threshold_pt: int = field(init=False, repr=False)
     """升段所需的分数，缓存变量"""
 
@@ -74,6 +89,9 @@ class PlayerData(Deserializable):
     order_count: List[int] = field(init=False, repr=False)
     """获得相应顺位的次数"""
 
+    rating_series: Optional[RatingSeries] = field(init=False, repr=False, default=None)
+    """每盘游戏之后的积分，第一次使用时根据游戏记录生成（之前为 None），缓存变量"""
+
     @staticmethod
     def new(
         player_name: str,
@@ -87,7 +105,7 @@ class PlayerData(Deserializable):
             player_name=player_name,
             external_ids=external_ids or [],
             external_names=external_names or [],
-            game_history=[],
+            game_ids=[],
             current_dan=0,
             highest_dan=0,
             current_pt=NEW_PLAYER_PT,
@@ -95,6 +113,19 @@ class PlayerData(Deserializable):
             r_value=NEW_PLAYER_R,
         )
 
+    @classmethod
+    def deserialize(cls, obj: dict) -> PlayerData:
+        """读取玩家数据（旧格式保存的是完整的游戏摘要，只保留其 ID）"""
+        if "game_ids" not in obj and "game_history" in obj:
+            obj = dict(obj, game_ids=[game["game_id"] for game in obj["game_history"]])
+        return super().deserialize(obj)
+
+    def serialize(self, exclude_non_repr: bool = True) -> dict:
+        """序列化玩家数据（积分序列只在内存中使用，不包含在内）"""
+        obj = super().serialize(exclude_non_repr)
+        obj.pop("rating_series", None)
+        return obj
+
     def __post_init__(self):
         self.update()
 
@@ -137,6 +168,7 @@ class PlayerData(Deserializable):
         self.order_count = [0, 0, 0, 0]
         for game in self.game_history:
             self.update_stats_from_game(game)
+        self.rating_series = None
 
     def reset(self):
         """清除所有游戏记录和分数（仅用于全部重新计算分数！）"""
@@ -144,23 +176,118 @@ class PlayerData(Deserializable):
         self.highest_dan_pt = NEW_PLAYER_PT
         self.current_dan = 0
         self.highest_dan = 0
+        self.game_ids = []
         self.game_history = []
 
     def add_game(self, game: GamePreview):
         """添加一盘游戏，并更新分值"""
         seat = game.players.index(self)
+        self.game_ids.append(game.game_id)
         self.game_history.append(game)
         self.current_pt += game.pt_delta[seat]
         self.r_value += game.r_delta[seat]
 
         self.update_dan()
         self.update_stats_from_game(game)
+        if self.rating_series is not None:
+            self.rating_series.append(
+                game.date,
+                self.current_dan,
+                self.current_pt,
+                self.r_value,
+                game.ordered_player_ids.index(self.player_id),
+            )
+
+    def insert_history(self, game: GamePreview) -> int:
+        """按时间顺序将游戏插入记录（不更新分数，之后需要重新计算积分）
+
+        返回 game_ids 中第一个变化的位置"""
+        index = bisect.bisect_right(self.game_history, game.date, key=_date)
+        complete = len(self.game_ids) == len(self.game_history)
+        self.game_history = (
+            self.game_history[:index] + [game] + self.game_history[index:]
+        )
+        self.rating_series = None
+        return self._relink_ids(index if complete else 0)
+
+    def remove_history(self, game_id: str) -> int:
+        """从记录中删除游戏（不更新分数，之后需要重新计算积分）
+
+        返回 game_ids 中第一个变化的位置"""
+        index = next(
+            i for i, game in enumerate(self.game_history) if game.game_id == game_id
+        )
+        complete = len(self.game_ids) == len(self.game_history)
+        self.game_history = self.game_history[:index] + self.game_history[index + 1 :]
+        self.rating_series = None
+        return self._relink_ids(index if complete else 0)
+
+    def _relink_ids(self, index: int) -> int:
+        """根据 game_history 重新生成 game_ids，返回 index
+
+        原来的 game_ids 中不在游戏数据库中的游戏会被删除，这时调用者应当传入 0"""
+        self.game_ids = [game.game_id for game in self.game_history]
+        return index
+
+    def link_history(self, previews: Dict[str, GamePreview]) -> None:
+        """根据 game_ids 引用游戏摘要，并重新统计（缺失的游戏不计入统计）"""
+        self.game_history = [
+            previews[game_id] for game_id in self.game_ids if game_id in previews
+        ]
+        self.update()
+
+    def view(self) -> PlayerData:
+        """只读的副本，供其他线程读取，之后修改玩家数据不会影响副本
+
+        不调用 __post_init__；游戏记录只在末尾追加，只记录其长度而不复制，
+        游戏摘要和积分序列与玩家共享"""
+        view = copy.copy(self)
+        view.external_ids = list(self.external_ids)
+        view.external_names = list(self.external_names)
+        view.titles = list(self.titles)
+        view.game_ids = ListPrefix(self.game_ids)
+        view.game_history = ListPrefix(self.game_history)
+        view.order_count = list(self.order_count)
+        return view
+
+    @property
+    def series(self) -> RatingSeries:
+        """每盘游戏之后的积分（按时间顺序）"""
+        if self.rating_series is None:
+            self.rating_series = RatingSeries.from_history(self)
+        return self.rating_series
+
+    def snapshot_as_of(
+        self, date: datetime, series: Optional[RatingSeries] = None
+    ) -> Optional[PlayerSnapshot]:
+        """date 之前（不包含）最后一盘游戏之后的快照，之前没有进行过游戏则返回 None
+
+        series 为 None 时使用玩家当前的积分序列"""
+        if series is None:
+            series = self.series
+        n_games = series.count_before(date)
+        if n_games == 0:
+            return None
+        current_dan = series.current_dan[n_games - 1]
+        return PlayerSnapshot(
+            player_id=self.player_id,
+            player_name=self.player_name,
+            current_dan=current_dan,
+            current_pt=series.current_pt[n_games - 1],
+            threshold_pt=DAN_THRESHOLD[current_dan],
+            r_value=series.r_value[n_games - 1],
+            game_count=n_games,
+            order_count=series.order_count(n_games),
+        )
 
     @property
     def snapshot(self) -> PlayerSnapshot:
         """返回部分玩家数据在当前瞬间的复制，用于记录在游戏中"""
         fields = dataclasses.fields(PlayerSnapshot)
-        return PlayerSnapshot(**{f.name: getattr(self, f.name) for f in fields})
+        snapshot = PlayerSnapshot(**{f.name: getattr(self, f.name) for f in fields})
+        # 之后的游戏会原地修改顺位次数，快照需要自己的列表
+        snapshot.order_count = list(self.order_count)
+        return snapshot
 
     def __str__(self) -> str:
         return f'"{self.player_name}"({self.current_dan} {self.current_pt}/{self.threshold_pt})'
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import bisect
 import json
 import sys
 from dataclasses import dataclass, field
+from datetime import datetime
 import dataclasses
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from ..io import Deserializable
+from ..sqlite_database import SQLITE_PATH, STORAGE_ENGINE
+from ..game_preview import GamePreview
+from ..player_snapshot import PlayerSnapshot
 from .player_data import PlayerData
+from .player_storage import JournalPlayerStorage, PlayerStorage, SqlitePlayerStorage
 
 _DEFAULT_DATABASE_PATH = "player.db"
 _PRESET_PLAYER_PATH = "data/users.json"
@@ -29,40 +35,177 @@ class PlayerDatabase(Deserializable):
     external_name_map: Dict[str, PlayerData] = field(init=False, repr=False)
     """利用外部用户名作为索引，缓存变量"""
 
-    leader_board: list = field(init=False, repr=False)
-    """按照名次排序的玩家记录，缓存变量"""
+    ranking: List[Tuple] = field(init=False, repr=False)
+    """按照名次排序的 (-段位, -分数, -R 值, 创建顺序, 玩家 ID)，缓存变量"""
+
+    ranking_entries: Dict[str, Tuple] = field(init=False, repr=False)
+    """每个玩家当前在 ranking 中的记录，缓存变量"""
+
+    player_order: Dict[str, int] = field(init=False, repr=False)
+    """玩家的创建顺序（名次相同时先创建的玩家在前），缓存变量"""
+
+    snapshots: Dict[str, PlayerSnapshot] = field(init=False, repr=False)
+    """排行榜中每个玩家的快照，玩家数据变化时删除，缓存变量"""
+
+    cached_leader_board: Optional[List[PlayerSnapshot]] = field(init=False, repr=False)
+    """排行榜，玩家数据变化时删除，缓存变量"""
+
+    storage: Optional[PlayerStorage] = field(default=None, repr=False)
+    """存储引擎，默认为 gzip 快照 + 追加日志"""
+
+    saved_history_length: Dict[str, int] = field(init=False, repr=False)
+    """每个玩家已保存的游戏记录数量（之后的记录需要保存），用于判断哪些玩家需要保存"""
+
+    changed_players: Set[str] = field(init=False, repr=False)
+    """游戏记录之外的数据有变化（例如重新计算积分）、需要保存的玩家"""
+
+    views: Dict[str, PlayerData] = field(init=False, repr=False)
+    """每个玩家发布给读取线程的副本，玩家数据变化时删除，缓存变量"""
 
     def __post_init__(self):
+        if self.storage is None:
+            self.storage = JournalPlayerStorage(self.database_path)
+        self.mark_saved()
         self.update()
 
+    @classmethod
+    def load(cls, path: str) -> PlayerDatabase:
+        """使用配置的存储引擎读取数据库"""
+        if STORAGE_ENGINE == "sqlite":
+            storage = SqlitePlayerStorage(SQLITE_PATH)
+        else:
+            storage = JournalPlayerStorage(path)
+        return cls(path, storage.load_players(), storage=storage)
+
+    def mark_saved(self):
+        """记录当前所有玩家均已保存"""
+        self.saved_history_length = {
+            player_id: len(player.game_ids)
+            for player_id, player in self.all_player_data.items()
+        }
+        self.changed_players = set()
+
+    def mark_changed(self, players: Iterable[PlayerData]) -> None:
+        """记录玩家的数据发生了变化（例如重新计算积分），下次保存时写入"""
+        self.changed_players.update(player.player_id for player in players)
+
+    def mark_history_changed(self, player: PlayerData, index: int) -> None:
+        """记录玩家第 index 盘及之后的游戏记录发生了变化（插入或删除了历史游戏）"""
+        player_id = player.player_id
+        saved = self.saved_history_length.get(player_id, 0)
+        self.saved_history_length[player_id] = min(saved, index)
+        self.changed_players.add(player_id)
+        self.views.pop(player_id, None)
+
+    def mark_series_changed(self, player_ids: Iterable[str]) -> None:
+        """记录玩家的游戏摘要被重新计算（积分本身可能不变），积分序列需要重新生成"""
+        for player_id in player_ids:
+            self.all_player_data[player_id].rating_series = None
+            self.views.pop(player_id, None)
+
     def save(self):
-        """保存到文件"""
-        self.write_compressed_data(self.database_path)
+        """保存有变化的玩家"""
+        changes = []
+        for player_id, player in self.all_player_data.items():
+            saved = self.saved_history_length.get(player_id)
+            if saved != len(player.game_ids) or player_id in self.changed_players:
+                changes.append((player, min(saved or 0, len(player.game_ids))))
+        self.storage.save_players(self, changes)
+        self.mark_saved()
 
     def create_player(self, *args, **kwargs) -> PlayerData:
         """创建新玩家并保存至 PlayerDatabase"""
         player = PlayerData.new(*args, **kwargs)
+        assert player.player_id not in self.all_player_data
         self.all_player_data[player.player_id] = player
-        self.update()
+        self.player_order[player.player_id] = len(self.player_order)
+        for external_id in player.external_ids:
+            self.external_id_map[external_id] = player
+        for external_name in player.external_names:
+            self.external_name_map[external_name] = player
+        self.update_players([player])
         return player
 
+    def replace_players(self, players: Dict[str, PlayerData]):
+        """用其他进程保存的数据替换（或添加）玩家（不需要再次保存），
+        调用者需要之后重新链接游戏记录并调用 update"""
+        for player_id, player in players.items():
+            self.all_player_data[player_id] = player
+            self.saved_history_length[player_id] = len(player.game_ids)
+            self.changed_players.discard(player_id)
+
     def get_player(self, player_id: str) -> PlayerData:
         return self.all_player_data[player_id]
 
+    def link_history(self, previews: Dict[str, GamePreview]) -> None:
+        """将所有玩家的游戏记录指向游戏数据库中唯一的游戏摘要"""
+        for player in self.all_player_data.values():
+            player.link_history(previews)
+            missing = len(player.game_ids) - len(player.game_history)
+            if missing:
+                print(f"玩家 {player} 有 {missing} 盘游戏不在游戏数据库中", file=sys.stderr)
+        self.update()
+
+    def ranking_entry(self, player: PlayerData) -> Tuple:
+        """玩家在 ranking 中的记录（按照段位、分数、R 值从高到低排序）"""
+        return (
+            -player.current_dan,
+            -player.current_pt,
+            -player.r_value,
+            self.player_order[player.player_id],
+            player.player_id,
+        )
+
+    def update_players(self, players: Iterable[PlayerData]):
+        """玩家数据变化后，只更新这些玩家在排行榜中的位置和快照"""
+        for player in players:
+            player_id = player.player_id
+            old_entry = self.ranking_entries.get(player_id)
+            if old_entry is not None:
+                del self.ranking[bisect.bisect_left(self.ranking, old_entry)]
+            entry = self.ranking_entry(player)
+            bisect.insort(self.ranking, entry)
+            self.ranking_entries[player_id] = entry
+            self.snapshots.pop(player_id, None)
+            self.views.pop(player_id, None)
+        self.cached_leader_board = None
+
+    @property
+    def leader_board(self) -> List[PlayerSnapshot]:
+        """按照名次排序的玩家快照（只在玩家数据变化后重新生成）"""
+        if self.cached_leader_board is None:
+            leader_board = []
+            for entry in self.ranking:
+                player_id = entry[-1]
+                if player_id not in self.snapshots:
+                    self.snapshots[player_id] = self.all_player_data[player_id].snapshot
+                leader_board.append(self.snapshots[player_id])
+            self.cached_leader_board = leader_board
+        return self.cached_leader_board
+
+    def player_views(self) -> Dict[str, PlayerData]:
+        """所有玩家的只读副本（按创建顺序），只复制上次之后有变化的玩家"""
+        views = {}
+        for player_id, player in self.all_player_data.items():
+            view = self.views.get(player_id)
+            if view is None:
+                view = self.views[player_id] = player.view()
+            views[player_id] = view
+        return views
+
     def update(self):
         """根据当前 all_player_data 更新其他变量"""
-        self.leader_board = [
-            player.snapshot
-            for player in sorted(
-                self.all_player_data.values(),
-                key=lambda player_data: (
-                    player_data.current_dan,
-                    player_data.current_pt,
-                    player_data.r_value,
-                ),
-                reverse=True,
-            )
-        ]
+        self.player_order = {
+            player_id: i for i, player_id in enumerate(self.all_player_data)
+        }
+        self.ranking_entries = {
+            player.player_id: self.ranking_entry(player)
+            for player in self.all_player_data.values()
+        }
+        self.ranking = sorted(self.ranking_entries.values())
+        self.snapshots = {}
+        self.views = {}
+        self.cached_leader_board = None
         self.external_id_map = {
             external_id: player
             for player in self.all_player_data.values()
@@ -75,11 +218,32 @@ class PlayerDatabase(Deserializable):
         }
 
 
-try:
-    player_database = PlayerDatabase.read_compressed_file(_DEFAULT_DATABASE_PATH)
-    """全局游戏记录管理"""
-except FileNotFoundError:
-    player_database = PlayerDatabase(_DEFAULT_DATABASE_PATH, {})
+def leader_board_as_of(
+    players: Iterable[PlayerData], date: datetime
+) -> List[PlayerSnapshot]:
+    """date 之前（不包含）进行过游戏的玩家当时的快照，按照当时的名次排序
+
+    players 按创建顺序排列（名次相同时先创建的玩家在前）；
+    使用每个玩家的积分序列二分查找，不需要重新计算积分"""
+    entries = []
+    for order, player in enumerate(players):
+        snapshot = player.snapshot_as_of(date)
+        if snapshot is not None:
+            entries.append(
+                (
+                    -snapshot.current_dan,
+                    -snapshot.current_pt,
+                    -snapshot.r_value,
+                    order,
+                    snapshot,
+                )
+            )
+    entries.sort(key=lambda entry: entry[:4])
+    return [entry[-1] for entry in entries]
+
+
+player_database = PlayerDatabase.load(_DEFAULT_DATABASE_PATH)
+"""全局游戏记录管理"""
 
 # 读取预存玩家列表
 try:
@@ -90,4 +254,5 @@ try:
 except FileNotFoundError:
     print(f"未找到预设玩家列表 {_PRESET_PLAYER_PATH}", file=sys.stderr)
     for i in range(8):
-        player_database.create_player(f"玩家{chr(i + ord('A'))}", player_id=hex(i))
+        if hex(i) not in player_database.all_player_data:
+            player_database.create_player(f"玩家{chr(i + ord('A'))}", player_id=hex(i))
@@ -0,0 +1,216 @@
+"""玩家数据库的存储引擎"""
+from __future__ import annotations
+
+import gzip
+import json
+import sqlite3
+import sys
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
+
+from ..io import Deserializable
+from ..journal import JOURNAL_SUFFIX, Journal
+from ..sqlite_database import SqliteConnection, chunks, record_changes
+from .player_data import PlayerData
+
+if TYPE_CHECKING:
+    from .player_database import PlayerDatabase
+
+
+class PlayerStorage(ABC):
+    """存储引擎的共同接口"""
+
+    @abstractmethod
+    def load_players(self) -> Dict[str, PlayerData]:
+        """读取所有玩家"""
+
+    @abstractmethod
+    def load_players_by_id(self, player_ids: Iterable[str]) -> Dict[str, PlayerData]:
+        """读取指定的玩家，不存在的玩家不在结果中"""
+
+    @abstractmethod
+    def save_players(
+        self, database: PlayerDatabase, changes: List[Tuple[PlayerData, int]]
+    ) -> None:
+        """保存有变化的玩家，以及每个玩家上次保存时的游戏记录数量"""
+
+
+@dataclass
+class JournalPlayerStorage(PlayerStorage):
+    """gzip 快照 + 追加日志
+
+    每条日志记录只包含玩家上次保存之后新增的游戏，以及这些游戏在记录中的位置"""
+
+    path: str
+    """快照文件地址"""
+
+    journal: Journal = field(init=False)
+    """快照之后玩家数据的变化"""
+
+    def __post_init__(self):
+        self.journal = Journal(self.path + JOURNAL_SUFFIX)
+
+    def load_players(self) -> Dict[str, PlayerData]:
+        """读取快照，并重放日志中的玩家记录"""
+        try:
+            with gzip.open(self.path, "rt") as file:
+                players = Deserializable.deserialize_object(
+                    Dict[str, PlayerData], json.load(file)["all_player_data"]
+                )
+        except FileNotFoundError:
+            players = {}
+        for record in self.journal.read():
+            self.apply_record(players, record)
+        return players
+
+    def load_players_by_id(self, player_ids: Iterable[str]) -> Dict[str, PlayerData]:
+        """读取快照和日志后只保留指定的玩家（只支持单进程，不需要按 ID 读取）"""
+        players = self.load_players()
+        return {
+            player_id: players[player_id]
+            for player_id in player_ids
+            if player_id in players
+        }
+
+    @staticmethod
+    def apply_record(players: Dict[str, PlayerData], record: dict):
+        """重放一条日志记录（重复重放同一条记录不影响结果）"""
+        player = PlayerData.deserialize(record["player"])
+        offset = record["history_offset"]
+        if player.player_id in players:
+            previous = players[player.player_id].game_ids
+            assert len(previous) >= offset
+            player.game_ids = previous[:offset] + player.game_ids
+        else:
+            assert offset == 0
+        players[player.player_id] = player
+
+    def save_players(
+        self, database: PlayerDatabase, changes: List[Tuple[PlayerData, int]]
+    ) -> None:
+        """将有变化的玩家追加到日志，日志过长时合并为新的快照"""
+        records = []
+        for player, offset in changes:
+            obj = player.serialize()
+            obj["game_ids"] = obj["game_ids"][offset:]
+            records.append({"player": obj, "history_offset": offset})
+        self.journal.append(records)
+        if self.journal.should_compact:
+            self.compact(database)
+
+    def compact(self, database: PlayerDatabase) -> None:
+        """将所有玩家写入新的快照，并清空日志"""
+        database.write_compressed_data(self.path)
+        self.journal.clear()
+
+
+@dataclass
+class SqlitePlayerStorage(PlayerStorage):
+    """SQLite 存储，玩家的游戏 ID 由 game_results 表（按 player_id 索引）得出
+
+    游戏需要先于玩家保存"""
+
+    path: str
+    """SQLite 数据库文件地址"""
+
+    connection: SqliteConnection = field(init=False)
+
+    def __post_init__(self):
+        self.connection = SqliteConnection.open(self.path)
+
+    def load_players(self) -> Dict[str, PlayerData]:
+        """读取所有玩家，并按照保存顺序恢复每个玩家的游戏 ID"""
+        with self.connection.transaction() as db:
+            self.repair_history_index(db)
+            rows = db.execute("SELECT data FROM players").fetchall()
+            history_rows = db.execute(
+                "SELECT player_id, game_id FROM game_results "
+                "WHERE history_index IS NOT NULL ORDER BY player_id, history_index"
+            ).fetchall()
+        return self.players_from_rows(rows, history_rows)
+
+    def load_players_by_id(self, player_ids: Iterable[str]) -> Dict[str, PlayerData]:
+        rows = []
+        history_rows = []
+        with self.connection.transaction() as db:
+            for chunk in chunks(player_ids):
+                placeholders = ", ".join("?" * len(chunk))
+                rows += db.execute(
+                    f"SELECT data FROM players WHERE player_id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                history_rows += db.execute(
+                    "SELECT player_id, game_id FROM game_results "
+                    f"WHERE player_id IN ({placeholders}) "
+                    "AND history_index IS NOT NULL ORDER BY player_id, history_index",
+                    chunk,
+                ).fetchall()
+        return self.players_from_rows(rows, history_rows)
+
+    @staticmethod
+    def repair_history_index(db: sqlite3.Connection) -> None:
+        """旧版本重新计算积分后保存游戏时会清空 history_index（这些游戏会从玩家记录中
+        消失），按游戏时间重新计算受影响的玩家的所有 history_index"""
+        player_ids = [
+            player_id
+            for (player_id,) in db.execute(
+                "SELECT DISTINCT player_id FROM game_results "
+                "WHERE history_index IS NULL"
+            )
+        ]
+        if not player_ids:
+            return
+        print(f"修复 {len(player_ids)} 个玩家的游戏记录顺序", file=sys.stderr)
+        for chunk in chunks(player_ids):
+            placeholders = ", ".join("?" * len(chunk))
+            db.execute(
+                "UPDATE game_results SET history_index = ordered.history_index "
+                "FROM (SELECT game_id, seat, ROW_NUMBER() OVER ("
+                "PARTITION BY player_id ORDER BY game_date, games.rowid) - 1 "
+                "AS history_index FROM game_results JOIN games USING (game_id) "
+                f"WHERE player_id IN ({placeholders})) AS ordered "
+                "WHERE game_results.game_id = ordered.game_id "
+                "AND game_results.seat = ordered.seat",
+                chunk,
+            )
+        record_changes(db, "player", player_ids)
+
+    @staticmethod
+    def players_from_rows(
+        rows: List[Tuple[str]], history_rows: List[Tuple[str, str]]
+    ) -> Dict[str, PlayerData]:
+        """由 players 中的数据和 game_results 中按顺序排列的游戏 ID 生成玩家"""
+        histories = defaultdict(list)
+        for player_id, game_id in history_rows:
+            histories[player_id].append(game_id)
+        players = {}
+        for (data,) in rows:
+            obj = json.loads(data)
+            obj["game_ids"] = []
+            player = PlayerData.deserialize(obj)
+            player.game_ids = histories[player.player_id]
+            players[player.player_id] = player
+        return players
+
+    def save_players(
+        self, database: PlayerDatabase, changes: List[Tuple[PlayerData, int]]
+    ) -> None:
+        """写入有变化的玩家（不包含游戏 ID），并记录新增游戏在玩家记录中的位置"""
+        rows = []
+        history_rows = []
+        for player, offset in changes:
+            obj = player.serialize()
+            del obj["game_ids"]
+            rows.append((player.player_id, json.dumps(obj, ensure_ascii=False)))
+            for i in range(offset, len(player.game_ids)):
+                history_rows.append((i, player.game_ids[i], player.player_id))
+        with self.connection.transaction() as db:
+            db.executemany("INSERT OR REPLACE INTO players VALUES (?, ?)", rows)
+            db.executemany(
+                "UPDATE game_results SET history_index = ? "
+                "WHERE game_id = ? AND player_id = ?",
+                history_rows,
+            )
+            record_changes(db, "player", (player.player_id for player, _ in changes))
@@ -0,0 +1,142 @@
+"""玩家积分随时间的变化，使用 array 紧凑存储"""
+from __future__ import annotations
+
+import bisect
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Sequence
+
+if TYPE_CHECKING:
+    from .player_data import PlayerData
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def timestamp(date: datetime) -> float:
+    """不带时区的时间转换为 1970-01-01 起的秒数（不受本地时区和夏令时影响）"""
+    return (date - _EPOCH).total_seconds()
+
+
+def from_timestamp(value: float) -> datetime:
+    """timestamp 的逆变换"""
+    return _EPOCH + timedelta(seconds=value)
+
+
+def bucket_indices(length: int, n_points: int) -> List[int]:
+    """将数据按数量平均分为 n_points 段，取每段的最后一个点"""
+    if n_points >= length:
+        return list(range(length))
+    return [(i + 1) * length // n_points - 1 for i in range(n_points)]
+
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], n_points: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets 降采样：保留首尾两点，中间每段选取与前一个
+    选中点和下一段平均点构成的三角形面积最大的点，能保留曲线的形状"""
+    length = len(xs)
+    if n_points >= length:
+        return list(range(length))
+    if n_points <= 2:
+        return [0, length - 1][:n_points]
+
+    indices = [0]
+    size = (length - 2) / (n_points - 2)
+    a = 0
+    for i in range(n_points - 2):
+        begin = int(i * size) + 1
+        end = int((i + 1) * size) + 1
+        next_end = min(int((i + 2) * size) + 1, length)
+        if next_end - end > 0:
+            avg_x = sum(xs[end:next_end]) / (next_end - end)
+            avg_y = sum(ys[end:next_end]) / (next_end - end)
+        else:
+            avg_x, avg_y = xs[length - 1], ys[length - 1]
+        ax, ay = xs[a], ys[a]
+        a = max(
+            range(begin, end),
+            key=lambda j: abs(
+                (ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay)
+            ),
+        )
+        indices.append(a)
+    indices.append(length - 1)
+    return indices
+
+
+@dataclass(slots=True)
+class RatingSeries:
+    """玩家每盘游戏之后的段位、分数和 R 值，按游戏时间顺序排列"""
+
+    timestamps: array = field(default_factory=lambda: array("d"))
+    """游戏时间，见 timestamp"""
+
+    current_dan: array = field(default_factory=lambda: array("b"))
+    """游戏之后的段位"""
+
+    current_pt: array = field(default_factory=lambda: array("l"))
+    """游戏之后的分数"""
+
+    r_value: array = field(default_factory=lambda: array("d"))
+    """游戏之后的 R 值"""
+
+    order: array = field(default_factory=lambda: array("b"))
+    """在这盘游戏中的顺位"""
+
+    @classmethod
+    def from_history(cls, player: PlayerData) -> RatingSeries:
+        """根据玩家的游戏记录生成：每盘游戏之后的状态即为下一盘游戏中玩家的快照"""
+        series = cls()
+        history = player.game_history
+        for i, game in enumerate(history):
+            if i + 1 < len(history):
+                following = history[i + 1].players
+                after = following[following.index(player)]
+            else:
+                after = player
+            series.append(
+                game.date,
+                after.current_dan,
+                after.current_pt,
+                after.r_value,
+                game.ordered_player_ids.index(player.player_id),
+            )
+        return series
+
+    def append(
+        self,
+        date: datetime,
+        current_dan: int,
+        current_pt: int,
+        r_value: float,
+        order: int,
+    ) -> None:
+        """在最后添加一盘游戏
+
+        时间最后写入：其他线程按 len(timestamps) 读取时，其余数组一定已经写入"""
+        self.current_dan.append(current_dan)
+        self.current_pt.append(current_pt)
+        self.r_value.append(r_value)
+        self.order.append(order)
+        self.timestamps.append(timestamp(date))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def count_before(self, date: datetime) -> int:
+        """date 之前（不包含）进行的游戏数量"""
+        return bisect.bisect_left(self.timestamps, timestamp(date))
+
+    def order_count(self, n_games: int) -> List[int]:
+        """前 n_games 盘游戏中获得相应顺位的次数"""
+        order = self.order[:n_games]
+        return [order.count(i) for i in range(4)]
+
+    def sample(self, indices: Sequence[int]) -> Dict[str, list]:
+        """按列返回选中的游戏之后的积分，game_index 为游戏在玩家记录中的序号"""
+        return {
+            "game_index": list(indices),
+            "date": [from_timestamp(self.timestamps[i]).isoformat() for i in indices],
+            "current_dan": [self.current_dan[i] for i in indices],
+            "current_pt": [self.current_pt[i] for i in indices],
+            "r_value": [self.r_value[i] for i in indices],
+        }
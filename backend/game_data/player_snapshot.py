@@ -4,7 +4,7 @@ from typing import Any, List
 from .io import Deserializable
 
 
-@dataclass
+@dataclass(slots=True)
 class PlayerSnapshot(Deserializable):
     """一个玩家在进行某一局游戏时的状态（保存为游戏的一部分，应当包含游戏计算分数所需的所有信息）"""
 
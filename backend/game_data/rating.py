@@ -0,0 +1,685 @@
+"""批量重新计算积分
+
+将游戏整理为按列存储的 NumPy 数组：与玩家状态无关的部分（顺位、局数修正值、
+役满次数等）对所有游戏向量化计算；段位、分数和 R 值依赖之前的每一盘游戏，
+只能按顺序逐盘计算，这一部分在扁平的整数/浮点数列表上进行，不创建任何对象。
+
+计算结果与逐盘调用 GameData.update 和 PlayerData.add_game 完全一致，
+耗时见 benchmark/rating.py"""
+from __future__ import annotations
+
+import gc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+from .game.game_data import PT_DELTA, R_DELTA, GameData
+from .game_preview import GamePreview
+from .player.player_data import (
+    DAN_INITIAL_PT,
+    DAN_THRESHOLD,
+    N_DAN,
+    NEW_PLAYER_PT,
+    NEW_PLAYER_R,
+    PlayerData,
+)
+
+
+CHECKPOINT_INTERVAL = 1000
+"""每隔多少盘游戏记录一次所有玩家的积分状态"""
+
+
+def _yakuman(game: GameData) -> List[int]:
+    """每个座位和出的役满倍数（与 GameData.update 的规则相同）"""
+    if game.yakuman_count is not None:
+        return game.yakuman_count
+    counts = [0, 0, 0, 0]
+    for round_ in game.rounds:
+        for win in round_.wins:
+            if win.yakuman > 0:
+                counts[win.winner] += win.yakuman
+    return counts
+
+
+@contextmanager
+def _gc_paused():
+    """暂停垃圾回收：逐盘计算时会创建大量临时对象，而这些对象都不会形成循环引用，
+    在数据库很大时反复触发的完整回收会占用大部分时间"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+@dataclass
+class RatingColumns:
+    """按列存储的游戏数据，每盘游戏一行（按座位顺序），按计算顺序排列"""
+
+    player_ids: List[str]
+    """玩家 ID，seats 中保存的是在这个列表中的位置"""
+
+    game_ids: List[str]
+    """每一行对应的游戏 ID"""
+
+    seats: np.ndarray
+    """每个座位的玩家序号，形状为 (游戏数, 4)"""
+
+    points: np.ndarray
+    """每个座位的点数"""
+
+    yakuman: np.ndarray
+    """每个座位和出的役满倍数"""
+
+    pt_multiplier: np.ndarray
+    """每盘游戏的分数乘数"""
+
+    r_multiplier: np.ndarray
+    """每盘游戏的 R 值乘数"""
+
+    @classmethod
+    def from_games(
+        cls, games: Sequence[GameData], player_ids: Iterable[str]
+    ) -> RatingColumns:
+        """按照给定的顺序读取游戏"""
+        player_ids = list(player_ids)
+        index = {player_id: i for i, player_id in enumerate(player_ids)}
+        n = len(games)
+        seats = np.fromiter(
+            (index[p.player_id] for game in games for p in game.players),
+            dtype=np.int64,
+            count=4 * n,
+        )
+        points = np.fromiter(
+            (x for game in games for x in game.player_points),
+            dtype=np.int64,
+            count=4 * n,
+        )
+        yakuman = np.fromiter(
+            (x for game in games for x in _yakuman(game)), dtype=np.int64, count=4 * n
+        )
+        return cls(
+            player_ids=player_ids,
+            game_ids=[game.game_id for game in games],
+            seats=seats.reshape(n, 4),
+            points=points.reshape(n, 4),
+            yakuman=yakuman.reshape(n, 4),
+            pt_multiplier=np.fromiter(
+                (game.game_type.pt_multiplier for game in games),
+                dtype=np.float64,
+                count=n,
+            ),
+            r_multiplier=np.fromiter(
+                (game.game_type.r_multiplier for game in games),
+                dtype=np.float64,
+                count=n,
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.game_ids)
+
+
+@dataclass
+class RatingState:
+    """所有玩家在某一时刻的积分状态，按玩家序号存储"""
+
+    current_dan: List[int]
+    """当前的段位"""
+
+    current_pt: List[int]
+    """当前的分数"""
+
+    highest_dan: List[int]
+    """最高达到的段位"""
+
+    highest_dan_pt: List[int]
+    """最高段位下最高分数"""
+
+    r_value: List[float]
+    """R 值"""
+
+    game_count: np.ndarray
+    """进行的游戏局数"""
+
+    order_count: np.ndarray
+    """获得相应顺位的次数，形状为 (玩家数, 4)"""
+
+    @classmethod
+    def new(cls, n_players: int) -> RatingState:
+        """所有玩家都是新玩家时的状态"""
+        return cls(
+            current_dan=[0] * n_players,
+            current_pt=[NEW_PLAYER_PT] * n_players,
+            highest_dan=[0] * n_players,
+            highest_dan_pt=[NEW_PLAYER_PT] * n_players,
+            r_value=[NEW_PLAYER_R] * n_players,
+            game_count=np.zeros(n_players, dtype=np.int64),
+            order_count=np.zeros((n_players, 4), dtype=np.int64),
+        )
+
+    @classmethod
+    def from_players(cls, players: Sequence[PlayerData]) -> RatingState:
+        """玩家当前的状态"""
+        return cls(
+            current_dan=[p.current_dan for p in players],
+            current_pt=[p.current_pt for p in players],
+            highest_dan=[p.highest_dan for p in players],
+            highest_dan_pt=[p.highest_dan_pt for p in players],
+            r_value=[p.r_value for p in players],
+            game_count=np.array([p.game_count for p in players], dtype=np.int64),
+            order_count=np.array(
+                [p.order_count for p in players], dtype=np.int64
+            ).reshape(-1, 4),
+        )
+
+    def extended(self, n_players: int) -> RatingState:
+        """之后创建的玩家以新玩家的状态加入"""
+        new = RatingState.new(n_players - len(self.current_dan))
+        return RatingState(
+            current_dan=self.current_dan + new.current_dan,
+            current_pt=self.current_pt + new.current_pt,
+            highest_dan=self.highest_dan + new.highest_dan,
+            highest_dan_pt=self.highest_dan_pt + new.highest_dan_pt,
+            r_value=self.r_value + new.r_value,
+            game_count=np.concatenate([self.game_count, new.game_count]),
+            order_count=np.concatenate([self.order_count, new.order_count]),
+        )
+
+    def copy(self) -> RatingState:
+        return RatingState(
+            current_dan=self.current_dan.copy(),
+            current_pt=self.current_pt.copy(),
+            highest_dan=self.highest_dan.copy(),
+            highest_dan_pt=self.highest_dan_pt.copy(),
+            r_value=self.r_value.copy(),
+            game_count=self.game_count.copy(),
+            order_count=self.order_count.copy(),
+        )
+
+    def apply_to(self, player: PlayerData, i: int) -> bool:
+        """将第 i 个玩家的状态写入 PlayerData（不改变游戏记录），返回是否有变化"""
+        before = (
+            player.current_dan,
+            player.current_pt,
+            player.highest_dan,
+            player.highest_dan_pt,
+            player.r_value,
+            player.game_count,
+            player.order_count,
+        )
+        player.current_dan = self.current_dan[i]
+        player.current_pt = self.current_pt[i]
+        player.highest_dan = self.highest_dan[i]
+        player.highest_dan_pt = self.highest_dan_pt[i]
+        player.r_value = self.r_value[i]
+        player.threshold_pt = DAN_THRESHOLD[player.current_dan]
+        player.game_count = int(self.game_count[i])
+        player.order_count = self.order_count[i].tolist()
+        return before != (
+            player.current_dan,
+            player.current_pt,
+            player.highest_dan,
+            player.highest_dan_pt,
+            player.r_value,
+            player.game_count,
+            player.order_count,
+        )
+
+
+@dataclass
+class RatingResult:
+    """重新计算的结果，除 state 外均按照 (游戏数, 4) 的座位顺序排列"""
+
+    pt_delta: np.ndarray
+    """玩家获得的分数"""
+
+    r_delta: np.ndarray
+    """玩家获得的 R"""
+
+    rank: np.ndarray
+    """每个座位的顺位"""
+
+    current_dan: List[int]
+    """游戏开始时玩家的段位，按照 4 * 游戏序号 + 顺位 排列"""
+
+    current_pt: List[int]
+    """游戏开始时玩家的分数，排列同上"""
+
+    r_value: List[float]
+    """游戏开始时玩家的 R 值，排列同上"""
+
+    game_count: np.ndarray
+    """游戏开始时玩家进行的游戏局数"""
+
+    order_count: np.ndarray
+    """游戏开始时玩家获得相应顺位的次数，形状为 (游戏数, 4, 4)"""
+
+    state: RatingState
+    """所有游戏结束后的状态"""
+
+    def write_back(self, games: Sequence[GameData]) -> List[str]:
+        """将结果写入游戏（玩家快照、分数和 R 的变化），返回有变化的游戏 ID
+
+        直接修改原有的对象，游戏摘要和玩家的游戏记录仍然引用相同的对象"""
+        changed = []
+        with _gc_paused():
+            pt_delta = self.pt_delta.tolist()
+            r_delta = self.r_delta.tolist()
+            game_count = self.game_count.tolist()
+            order_count = self.order_count.tolist()
+            ranks = self.rank.tolist()
+            for g, game in enumerate(games):
+                rank = ranks[g]
+                same = game.pt_delta == pt_delta[g] and game.r_delta == r_delta[g]
+                for seat, snapshot in enumerate(game.players):
+                    k = 4 * g + rank[seat]
+                    values = (
+                        self.current_dan[k],
+                        self.current_pt[k],
+                        self.r_value[k],
+                        game_count[g][seat],
+                        order_count[g][seat],
+                    )
+                    if same and values == (
+                        snapshot.current_dan,
+                        snapshot.current_pt,
+                        snapshot.r_value,
+                        snapshot.game_count,
+                        snapshot.order_count,
+                    ):
+                        continue
+                    same = False
+                    (
+                        snapshot.current_dan,
+                        snapshot.current_pt,
+                        snapshot.r_value,
+                        snapshot.game_count,
+                        snapshot.order_count,
+                    ) = values
+                    snapshot.threshold_pt = DAN_THRESHOLD[snapshot.current_dan]
+                if not same:
+                    game.pt_delta[:] = pt_delta[g]
+                    game.r_delta[:] = r_delta[g]
+                    changed.append(game.game_id)
+        return changed
+
+
+def _running_counts(
+    columns: RatingColumns, rank: np.ndarray, state: RatingState
+) -> tuple[np.ndarray, np.ndarray]:
+    """每个玩家在每盘游戏开始时的游戏局数和顺位次数"""
+    n = len(columns)
+    flat = columns.seats.ravel()
+    # 按玩家分组（组内保持游戏顺序），组内的序号即为之前进行的局数
+    by_player = np.argsort(flat, kind="stable")
+    grouped = flat[by_player]
+    starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+    sizes = np.diff(np.r_[starts, len(flat)])
+    group_start = np.repeat(starts, sizes)
+    game_count = np.empty_like(flat)
+    game_count[by_player] = np.arange(len(flat)) - group_start
+    one_hot = rank.ravel()[by_player, None] == np.arange(4)
+    seen = np.cumsum(one_hot, axis=0, dtype=np.int32)
+    seen -= one_hot
+    order_count = np.empty((len(flat), 4), dtype=np.int64)
+    order_count[by_player] = seen - seen[group_start]
+    return (
+        game_count.reshape(n, 4) + state.game_count[columns.seats],
+        order_count.reshape(n, 4, 4) + state.order_count[columns.seats],
+    )
+
+
+def _game_kinds(columns: RatingColumns, order: np.ndarray) -> np.ndarray:
+    """每盘游戏的种类：分数的变化只由种类和四名玩家的段位决定，有役满的游戏为 -1
+
+    种类由按顺位排列的点数的正负和分数乘数组成（被飞加分只取决于点数的正负）"""
+    rows = np.arange(len(columns))[:, None]
+    points = columns.points[rows, order]
+    signs = ((points > 0) + 2 * (points < 0)) @ np.array([1, 4, 16, 64])
+    multipliers, type_index = np.unique(columns.pt_multiplier, return_inverse=True)
+    kinds = signs * len(multipliers) + type_index
+    kinds[(columns.yakuman != 0).any(axis=1)] = -1
+    return kinds
+
+
+def _replay(
+    columns: RatingColumns, order: np.ndarray, factor: np.ndarray, final: RatingState
+) -> tuple[tuple[list, list, list], List[int], List[float]]:
+    """逐盘计算分数和 R 的变化，并更新 final 中的段位、分数和 R 值
+
+    返回游戏开始时玩家的段位、分数和 R 值，以及分数和 R 的变化（均按照顺位排列）
+
+    这是唯一逐盘进行的部分，按列同时遍历扁平的列表（不需要计算下标）；
+    分数的变化按游戏种类和段位缓存，只有第一次遇到时才按规则计算"""
+    n = len(columns)
+    rows = np.arange(n)[:, None]
+    # 以下列表均按照每盘游戏的顺位排列
+    points = columns.points[rows, order].ravel().tolist()
+    yakuman = columns.yakuman[rows, order].ravel().tolist()
+    pt_multiplier = columns.pt_multiplier.tolist()
+    per_game = zip(
+        *columns.seats[rows, order].T.tolist(),
+        # 桌平均 R 按座位顺序求和
+        *columns.seats.T.tolist(),
+        *factor[rows, order].T.tolist(),
+        _game_kinds(columns, order).tolist(),
+        columns.r_multiplier.tolist(),
+    )
+
+    dan = final.current_dan
+    pt = final.current_pt
+    highest_dan = final.highest_dan
+    highest_pt = final.highest_dan_pt
+    r_value = final.r_value
+    pt_out = []
+    r_out = []
+    dan_before = []
+    pt_before = []
+    r_before = []
+    pt0, pt1, pt2, pt3 = PT_DELTA
+    r0, r1, r2, r3 = R_DELTA
+    top_dan = N_DAN - 1
+
+    def pt_deltas(g: int, dans: tuple) -> tuple:
+        """第 g 盘游戏中每名玩家获得的分数（与 GameData.update 的规则相同）"""
+        i = 4 * g
+
+        def bonus(k: int) -> int:
+            """低于 5 段的玩家在基础得分之外的加分"""
+            d = dans[k]
+            x = 90 * yakuman[i + k]
+            # 有玩家被飞，则比其段位低的玩家 +45pt（最后一名的点数最低）
+            if points[i + k] > 0 and points[i + 3] < 0:
+                if d < max(dans[j] for j in range(4) if points[i + j] < 0):
+                    x += 45
+            # 顺位每比段位高 >=2 的玩家高一位，+15pt
+            for delta in range(1, 4 - k):
+                if dans[k + delta] - d >= 2:
+                    x += 15 * delta
+            return x
+
+        da, db, dc, de = dans
+        xa, xb, xc, xe = pt0[da], pt1[db], pt2[dc], pt3[de]
+        if da < 5:
+            xa += bonus(0)
+        if db < 5:
+            xb += bonus(1)
+        if dc < 5:
+            xc += bonus(2)
+        if de < 5:
+            xe += bonus(3)
+        m = pt_multiplier[g]
+        return round(xa * m), round(xb * m), round(xc * m), round(xe * m)
+
+    def update_dan(p: int, d: int, current: int):
+        """与 PlayerData.update_dan 相同的升段、降段规则（分数不在 [0, 升段分数) 内时）"""
+        threshold = DAN_THRESHOLD[d]
+        if current >= threshold:
+            if d < top_dan:
+                d += 1
+                if highest_dan[p] < d:
+                    highest_dan[p] = d
+                    highest_pt[p] = DAN_INITIAL_PT[d]
+                current = DAN_INITIAL_PT[d]
+                dan[p] = d
+            else:
+                current = threshold
+        elif current < 0:
+            if d > 0:
+                d -= 1
+                current = DAN_INITIAL_PT[d]
+                dan[p] = d
+            else:
+                current = 0
+        pt[p] = current
+
+    cached_deltas = {}
+    for g, (a, b, c, e, s0, s1, s2, s3, fa, fb, fc, fe, kind, m) in enumerate(per_game):
+        dans = da, db, dc, de = dan[a], dan[b], dan[c], dan[e]
+        pa, pb, pc, pe = pt[a], pt[b], pt[c], pt[e]
+        ra, rb, rc, re = r_value[a], r_value[b], r_value[c], r_value[e]
+        dan_before += dans
+        pt_before += pa, pb, pc, pe
+        r_before += ra, rb, rc, re
+
+        if kind < 0:
+            deltas = pt_deltas(g, dans)
+        else:
+            try:
+                deltas = cached_deltas[kind][dans]
+            except KeyError:
+                deltas = pt_deltas(g, dans)
+                cached_deltas.setdefault(kind, {})[dans] = deltas
+        pt_out += deltas
+
+        # 桌平均R < 1500时，桌平均R视为1500
+        average_r = (r_value[s0] + r_value[s1] + r_value[s2] + r_value[s3]) / 4
+        if average_r < 1500:
+            average_r = 1500
+        # 与 round(x, 3) 相同：x * 1000 的误差远小于 1e-4，离 .5 足够远时
+        # 舍入方向与精确值相同，k / 1000 即为最接近的浮点数；否则调用 round(x, 3)
+        x = (r0 + (average_r - ra) / 40) * fa * m
+        t = x * 1000
+        k = round(t)
+        qa = k / 1000 if -0.4999 < t - k < 0.4999 else round(x, 3)
+        x = (r1 + (average_r - rb) / 40) * fb * m
+        t = x * 1000
+        k = round(t)
+        qb = k / 1000 if -0.4999 < t - k < 0.4999 else round(x, 3)
+        x = (r2 + (average_r - rc) / 40) * fc * m
+        t = x * 1000
+        k = round(t)
+        qc = k / 1000 if -0.4999 < t - k < 0.4999 else round(x, 3)
+        x = (r3 + (average_r - re) / 40) * fe * m
+        t = x * 1000
+        k = round(t)
+        qe = k / 1000 if -0.4999 < t - k < 0.4999 else round(x, 3)
+        r_out += qa, qb, qc, qe
+        r_value[a] = ra + qa
+        r_value[b] = rb + qb
+        r_value[c] = rc + qc
+        r_value[e] = re + qe
+
+        # 大多数游戏不升段、不降段，只需要更新分数和最高分数
+        xa, xb, xc, xe = deltas
+        x = pa + xa
+        if 0 <= x < DAN_THRESHOLD[da]:
+            pt[a] = x
+            if x > highest_pt[a] and da == highest_dan[a]:
+                highest_pt[a] = x
+        else:
+            update_dan(a, da, x)
+        x = pb + xb
+        if 0 <= x < DAN_THRESHOLD[db]:
+            pt[b] = x
+            if x > highest_pt[b] and db == highest_dan[b]:
+                highest_pt[b] = x
+        else:
+            update_dan(b, db, x)
+        x = pc + xc
+        if 0 <= x < DAN_THRESHOLD[dc]:
+            pt[c] = x
+            if x > highest_pt[c] and dc == highest_dan[c]:
+                highest_pt[c] = x
+        else:
+            update_dan(c, dc, x)
+        x = pe + xe
+        if 0 <= x < DAN_THRESHOLD[de]:
+            pt[e] = x
+            if x > highest_pt[e] and de == highest_dan[e]:
+                highest_pt[e] = x
+        else:
+            update_dan(e, de, x)
+
+    return (dan_before, pt_before, r_before), pt_out, r_out
+
+
+def compute_ratings(columns: RatingColumns, state: RatingState = None) -> RatingResult:
+    """从给定的状态（默认全部为新玩家）开始，按顺序计算所有游戏的积分"""
+    if state is None:
+        state = RatingState.new(len(columns.player_ids))
+    n = len(columns)
+    rows = np.arange(n)[:, None]
+    # 按点数从高到低的座位顺序（点数相同时座位靠前的在前，与 sorted 相同）
+    order = np.argsort(-columns.points, axis=1, kind="stable")
+    rank = np.empty_like(order)
+    rank[rows, order] = np.arange(4)
+    game_count, order_count = _running_counts(columns, rank, state)
+    # 修正值 = (1 - 局数 * 0.002), 400局以上为0.2
+    factor = np.maximum(0.2, 1 - game_count / 500)
+
+    final = state.copy()
+    with _gc_paused():
+        before, pt_out, r_out = _replay(columns, order, factor, final)
+
+    # 将按顺位排列的结果放回座位顺序
+    pt_delta = np.empty((n, 4), dtype=np.int64)
+    pt_delta[rows, order] = np.array(pt_out, dtype=np.int64).reshape(n, 4)
+    r_delta = np.empty((n, 4))
+    r_delta[rows, order] = np.array(r_out).reshape(n, 4)
+    np.add.at(final.game_count, columns.seats.ravel(), 1)
+    np.add.at(final.order_count, (columns.seats[rows, order], np.arange(4)), 1)
+    return RatingResult(
+        pt_delta=pt_delta,
+        r_delta=r_delta,
+        rank=rank,
+        current_dan=before[0],
+        current_pt=before[1],
+        r_value=before[2],
+        game_count=game_count,
+        order_count=order_count,
+        state=final,
+    )
+
+
+@dataclass
+class RatingCheckpoints:
+    """按时间顺序，每 CHECKPOINT_INTERVAL 盘游戏之前所有玩家的积分状态
+
+    修改历史游戏后，只需从之前最近的检查点开始重新计算"""
+
+    states: List[RatingState]
+    """states[k] 为第 k * CHECKPOINT_INTERVAL 盘游戏之前的状态"""
+
+    @classmethod
+    def new(cls) -> RatingCheckpoints:
+        """只有初始状态（所有玩家均为新玩家）的检查点"""
+        return cls([RatingState.new(0)])
+
+    def fill(self, history: Sequence[GamePreview], players: Sequence[PlayerData]):
+        """从最后一个检查点开始，由保存的每盘游戏的结果记录之后缺少的检查点，不重新计算积分
+
+        游戏开始时的段位、分数和 R 值取自游戏中的玩家快照，游戏之后的状态由保存的
+        分数和 R 的变化按 PlayerData.add_game 的规则得出（与逐盘录入时的结果相同）；
+        history 为按时间排列的所有游戏，players 为所有玩家（按创建顺序）"""
+        k = len(self.states) - 1
+        start = k * CHECKPOINT_INTERVAL
+        state = self.states[k].extended(len(players))
+        index = {player.player_id: i for i, player in enumerate(players)}
+        dan = state.current_dan
+        pt = state.current_pt
+        highest_dan = state.highest_dan
+        highest_pt = state.highest_dan_pt
+        r_value = state.r_value
+        game_count = state.game_count.tolist()
+        order_count = state.order_count.ravel().tolist()
+        top_dan = N_DAN - 1
+
+        def record():
+            self.states.append(
+                RatingState(
+                    current_dan=dan.copy(),
+                    current_pt=pt.copy(),
+                    highest_dan=highest_dan.copy(),
+                    highest_dan_pt=highest_pt.copy(),
+                    r_value=r_value.copy(),
+                    game_count=np.array(game_count, dtype=np.int64),
+                    order_count=np.array(order_count, dtype=np.int64).reshape(-1, 4),
+                )
+            )
+
+        with _gc_paused():
+            for g in range(start, len(history)):
+                if g > start and g % CHECKPOINT_INTERVAL == 0:
+                    record()
+                game = history[g]
+                for snapshot, delta, r_delta in zip(
+                    game.players, game.pt_delta, game.r_delta
+                ):
+                    p = index[snapshot.player_id]
+                    d = snapshot.current_dan
+                    r_value[p] = snapshot.r_value + r_delta
+                    game_count[p] += 1
+                    # 与 PlayerData.update_dan 相同的升段、降段规则
+                    current = snapshot.current_pt + delta
+                    threshold = DAN_THRESHOLD[d]
+                    if current >= threshold:
+                        if d < top_dan:
+                            d += 1
+                            if highest_dan[p] < d:
+                                highest_dan[p] = d
+                                highest_pt[p] = DAN_INITIAL_PT[d]
+                            current = DAN_INITIAL_PT[d]
+                        else:
+                            current = threshold
+                    elif current < 0:
+                        if d > 0:
+                            d -= 1
+                            current = DAN_INITIAL_PT[d]
+                        else:
+                            current = 0
+                    elif d == highest_dan[p] and current > highest_pt[p]:
+                        highest_pt[p] = current
+                    dan[p] = d
+                    pt[p] = current
+                for order, player_id in enumerate(game.ordered_player_ids):
+                    order_count[index[player_id] * 4 + order] += 1
+        if len(history) > start and len(history) % CHECKPOINT_INTERVAL == 0:
+            record()
+
+    def restart_index(self, index: int) -> int:
+        """重新计算第 index 盘及之后的游戏时，实际开始计算的位置"""
+        k = min(index // CHECKPOINT_INTERVAL, len(self.states) - 1)
+        return k * CHECKPOINT_INTERVAL
+
+    def replay(
+        self, games: Sequence[GameData], start: int, players: Sequence[PlayerData]
+    ) -> tuple[List[str], List[PlayerData]]:
+        """从第 start 盘游戏（应当由 restart_index 得出）开始重新计算积分，并更新检查点
+
+        games 为从 start 开始按时间排列的所有游戏，players 为所有玩家（按创建顺序）；
+        返回有变化的游戏 ID 和玩家"""
+        k = start // CHECKPOINT_INTERVAL
+        del self.states[k + 1 :]
+        state = self.states[k].extended(len(players))
+        player_ids = [p.player_id for p in players]
+        changed_games = []
+        for begin in range(0, len(games), CHECKPOINT_INTERVAL):
+            chunk = games[begin : begin + CHECKPOINT_INTERVAL]
+            result = compute_ratings(RatingColumns.from_games(chunk, player_ids), state)
+            changed_games += result.write_back(chunk)
+            state = result.state
+            if len(chunk) == CHECKPOINT_INTERVAL:
+                self.states.append(state)
+        changed_players = [p for i, p in enumerate(players) if state.apply_to(p, i)]
+        return changed_games, changed_players
+
+    def invalidate(self, index: int) -> None:
+        """第 index 盘（按时间顺序）及之后的游戏被其他进程修改，删除之后的检查点
+
+        之后的检查点在下次重新计算积分时重新记录"""
+        del self.states[index // CHECKPOINT_INTERVAL + 1 :]
+
+    def missing(self, n_games: int) -> bool:
+        """共有 n_games 盘游戏时，是否有应当记录、但还没有记录的检查点"""
+        return n_games >= len(self.states) * CHECKPOINT_INTERVAL
+
+    def record(self, n_games: int, players: Sequence[PlayerData]) -> None:
+        """按时间顺序在最后添加游戏之后调用，游戏数量达到检查点时记录玩家当前的状态"""
+        if n_games == len(self.states) * CHECKPOINT_INTERVAL:
+            self.states.append(RatingState.from_players(players))
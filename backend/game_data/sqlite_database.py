@@ -0,0 +1,190 @@
+"""SQLite 存储引擎的连接和表结构"""
+from __future__ import annotations
+
+import fcntl
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+STORAGE_ENGINE = os.getenv("WDK_STORAGE_ENGINE", "journal")
+"""数据库存储方式：journal（gzip 快照 + 追加日志）或 sqlite"""
+
+SQLITE_PATH = os.getenv("WDK_SQLITE_PATH", "league.sqlite")
+"""SQLite 数据库文件地址（游戏和玩家共用）"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    external_id TEXT,
+    game_date TEXT NOT NULL,
+    game_type TEXT NOT NULL,
+    preview TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_external_id ON games (external_id);
+CREATE INDEX IF NOT EXISTS games_game_date ON games (game_date);
+
+CREATE TABLE IF NOT EXISTS game_results (
+    game_id TEXT NOT NULL REFERENCES games (game_id),
+    seat INTEGER NOT NULL,
+    player_id TEXT NOT NULL,
+    player_points INTEGER NOT NULL,
+    pt_delta INTEGER NOT NULL,
+    r_delta REAL NOT NULL,
+    history_index INTEGER,
+    PRIMARY KEY (game_id, seat)
+);
+CREATE INDEX IF NOT EXISTS game_results_player_id ON game_results (player_id);
+
+CREATE TABLE IF NOT EXISTS rounds (
+    game_id TEXT NOT NULL REFERENCES games (game_id),
+    round_index INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (game_id, round_index)
+);
+
+CREATE TABLE IF NOT EXISTS players (
+    player_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    item_id TEXT NOT NULL
+);
+"""
+"""表结构：games 保存不含牌局细节的游戏，rounds 保存每局的完整数据，
+game_results 保存每个座位的结果（history_index 为该游戏在玩家记录中的位置），
+players 保存不含游戏记录的玩家数据，
+changes 按顺序记录每次写入的游戏和玩家（kind 为 game 或 player），供其他进程同步"""
+
+CHANGE_RETENTION = 100000
+"""changes 中保留的最近记录数量，落后更多的进程需要重新读取整个数据库"""
+
+SQL_VARIABLE_LIMIT = 500
+"""一条语句中绑定的参数数量上限"""
+
+
+def chunks(items: Iterable[str]) -> Iterator[List[str]]:
+    """将参数分为不超过 SQL_VARIABLE_LIMIT 个的多组"""
+    items = list(items)
+    for i in range(0, len(items), SQL_VARIABLE_LIMIT):
+        yield items[i : i + SQL_VARIABLE_LIMIT]
+
+
+def record_changes(db: sqlite3.Connection, kind: str, item_ids: Iterable[str]):
+    """在 changes 中记录写入的游戏或玩家（与写入在同一个事务中）"""
+    db.executemany(
+        "INSERT INTO changes (kind, item_id) VALUES (?, ?)",
+        ((kind, item_id) for item_id in item_ids),
+    )
+    db.execute(
+        "DELETE FROM changes WHERE version <= "
+        "(SELECT MAX(version) FROM changes) - ?",
+        (CHANGE_RETENTION,),
+    )
+
+
+class SqliteConnection:
+    """共享的 SQLite 连接，所有读写都需要持有锁"""
+
+    _connections: Dict[str, SqliteConnection] = {}
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(_SCHEMA)
+        self.inherited: List[sqlite3.Connection] = []
+
+    def reopen(self):
+        """fork 之后子进程不能继续使用父进程的连接，重新连接
+
+        父进程的连接不能在子进程中关闭（会影响父进程的文件锁），只保留引用"""
+        self.inherited.append(self.connection)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+
+    @classmethod
+    def open(cls, path: str) -> SqliteConnection:
+        """同一文件只打开一次连接"""
+        if path not in cls._connections:
+            cls._connections[path] = cls(path)
+        return cls._connections[path]
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """在锁内执行，正常结束时提交，出错时回滚"""
+        with self.lock, self.connection:
+            yield self.connection
+
+
+def _reopen_after_fork():
+    for connection in SqliteConnection._connections.values():
+        connection.reopen()
+
+
+os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+class ChangeFeed:
+    """同一主机上的多个进程共用 SQLite 数据库时，读取其他进程写入的变化
+
+    写入前持有文件锁（保证同时只有一个进程写入），并先读取其他进程的写入"""
+
+    def __init__(self, connection: SqliteConnection):
+        self.connection = connection
+        self.lock_path = f"{connection.path}.lock"
+        # 在读取数据库之前记录版本：之后的变化即使已经读取，再读取一次也不影响结果
+        self.version = self.latest_version()
+
+    def latest_version(self) -> int:
+        with self.connection.transaction() as db:
+            row = db.execute("SELECT COALESCE(MAX(version), 0) FROM changes").fetchone()
+        return row[0]
+
+    def read_changes(self) -> Optional[Tuple[List[str], List[str]]]:
+        """读取上次之后写入的 (游戏 ID, 玩家 ID)，按第一次写入的顺序排列
+        （同一时间的游戏按写入顺序排列，与写入的进程一致）
+
+        需要的记录已被清理时返回 None（需要重新读取整个数据库）"""
+        with self.connection.transaction() as db:
+            oldest = db.execute("SELECT MIN(version) FROM changes").fetchone()[0]
+            rows = db.execute(
+                "SELECT version, kind, item_id FROM changes WHERE version > ? "
+                "ORDER BY version",
+                (self.version,),
+            ).fetchall()
+        if oldest is not None and oldest > self.version + 1:
+            self.version = rows[-1][0]
+            return None
+        game_ids: Dict[str, None] = {}
+        player_ids: Dict[str, None] = {}
+        for version, kind, item_id in rows:
+            (game_ids if kind == "game" else player_ids)[item_id] = None
+            self.version = version
+        return list(game_ids), list(player_ids)
+
+    @contextmanager
+    def locked(self, exclusive: bool) -> Iterator[None]:
+        """持有文件锁：写入时为排他锁，读取变化时为共享锁（不会读到写入了一半的变化）
+
+        持有排他锁时调用者需要先读取其他进程的写入，结束时跳过自己写入的变化"""
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if exclusive:
+                    self.version = self.latest_version()
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+change_feed: Optional[ChangeFeed] = None
+"""使用 SQLite 存储时的变化记录，使用日志存储时为 None（只支持单进程）"""
+if STORAGE_ENGINE == "sqlite":
+    change_feed = ChangeFeed(SqliteConnection.open(SQLITE_PATH))
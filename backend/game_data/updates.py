@@ -0,0 +1,173 @@
+"""数据变化的推送：写入线程发布快照后，将新增的游戏和玩家的新快照广播给所有订阅者"""
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import threading
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+
+from .game_preview import GamePreview
+from .io import Deserializable
+from .player_snapshot import PlayerSnapshot
+
+GameUpdate = Tuple[int, GamePreview, List[PlayerSnapshot]]
+"""追加一盘游戏后的 (数据版本, 游戏摘要, 四名玩家的新快照)"""
+
+UPDATE_LIMIT = 64
+"""一次发布中追加的游戏超过这个数量时，只通知订阅者重新读取全部数据"""
+
+RECENT_EVENTS = 256
+"""保留最近的事件数量，重新连接的订阅者可以补收断开期间的事件"""
+
+SUBSCRIPTION_BUFFER = 256
+"""每个订阅者最多积压的事件数量，超过时清空并只通知重新读取"""
+
+SUBSCRIBER_LIMIT = int(os.getenv("WDK_STREAM_LIMIT", "8"))
+"""同时订阅的连接数量上限（每个连接占用一个请求线程）"""
+
+
+def format_event(version_id: str, event: str, data: dict) -> bytes:
+    """编码为一条 Server-Sent Events 消息，id 为数据版本 ID"""
+    return (
+        f"id: {version_id}\nevent: {event}\n"
+        f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    ).encode()
+
+
+def refresh_event(version_id: str) -> bytes:
+    """通知订阅者数据有其他变化（例如重新计算了积分），需要重新读取"""
+    return format_event(version_id, "refresh", {"version": version_id})
+
+
+class Subscription:
+    """一个订阅者等待发送的事件"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.events: Deque[bytes] = deque()
+
+    def push(self, events: List[bytes], version_id: str) -> None:
+        """加入事件，积压过多时改为一个 refresh 事件"""
+        with self.condition:
+            if len(self.events) + len(events) > SUBSCRIPTION_BUFFER:
+                self.events.clear()
+                events = [refresh_event(version_id)]
+            self.events.extend(events)
+            self.condition.notify()
+
+    def wait(self, timeout: float) -> List[bytes]:
+        """取出所有等待发送的事件，没有事件时最多等待 timeout 秒"""
+        with self.condition:
+            if not self.events:
+                self.condition.wait(timeout)
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+
+class UpdateFeed:
+    """向订阅者广播数据变化，只由写入线程发布
+
+    追加到最后的游戏发布为 game 事件，其他变化发布为 refresh 事件
+
+    数据版本只在本进程中递增（重新启动后从 0 开始，多个工作进程各不相同），
+    对外使用的版本 ID 为 "<进程标识>-<数据版本>"，其他进程的版本 ID 不能补发事件"""
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self.lock = threading.Lock()
+        self.subscriptions: Set[Subscription] = set()
+        self.version = 0
+        # 最近的 (数据版本, 事件)，及其之前已经不能补发的最后一个版本
+        self.recent: Deque[Tuple[int, bytes]] = deque()
+        self.recent_since = 0
+
+    def renew_epoch(self) -> None:
+        """fork 之后的子进程使用新的进程标识"""
+        self.epoch = secrets.token_hex(4)
+
+    def version_id(self, version: int) -> str:
+        """本进程中数据版本对外使用的 ID"""
+        return f"{self.epoch}-{version}"
+
+    def parse_version_id(self, version_id: str) -> int:
+        """解析版本 ID，格式错误时抛出 ValueError
+
+        其他进程（或重新启动之前）的版本 ID 返回 -1，订阅时只能通知重新读取"""
+        epoch, separator, version = version_id.rpartition("-")
+        version = int(version)
+        if not separator or version < 0:
+            raise ValueError(version_id)
+        return version if epoch == self.epoch else -1
+
+    def reset(self, version: int) -> None:
+        """从这个版本开始发布（之前的变化不能补发）"""
+        with self.lock:
+            self.version = version
+            self.recent.clear()
+            self.recent_since = version
+
+    def publish(self, version: int, updates: Optional[List[GameUpdate]]) -> None:
+        """发布 version 版本的快照，updates 为之前的版本之后追加的游戏
+        （为 None 时有其他变化）"""
+        if version == self.version:
+            return
+        if updates:
+            events = [
+                (
+                    game_version,
+                    format_event(
+                        self.version_id(game_version),
+                        "game",
+                        {
+                            "version": self.version_id(game_version),
+                            "game": preview.serialize(exclude_non_repr=False),
+                            "players": Deserializable.serialize_object(
+                                snapshots, exclude_non_repr=False
+                            ),
+                        },
+                    ),
+                )
+                for game_version, preview, snapshots in updates
+            ]
+        else:
+            events = [(version, refresh_event(self.version_id(version)))]
+        with self.lock:
+            self.version = version
+            self.recent.extend(events)
+            while len(self.recent) > RECENT_EVENTS:
+                self.recent_since = self.recent.popleft()[0]
+            for subscription in self.subscriptions:
+                subscription.push(
+                    [event for _, event in events], self.version_id(version)
+                )
+
+    def subscribe(self, last_version: Optional[int] = None) -> Optional[Subscription]:
+        """开始订阅，订阅者过多时返回 None
+
+        提供订阅者已有数据的版本（由 parse_version_id 得出）时，
+        先补发之后的事件（不能补发时为 refresh 事件）"""
+        subscription = Subscription()
+        with self.lock:
+            if len(self.subscriptions) >= SUBSCRIBER_LIMIT:
+                return None
+            if last_version is not None and last_version != self.version:
+                if self.recent_since <= last_version < self.version:
+                    missed = [e for v, e in self.recent if v > last_version]
+                else:
+                    missed = [refresh_event(self.version_id(self.version))]
+                subscription.push(missed, self.version_id(self.version))
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+
+update_feed = UpdateFeed()
+"""全局数据变化推送"""
+
+os.register_at_fork(after_in_child=update_feed.renew_epoch)
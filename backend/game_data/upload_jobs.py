@@ -0,0 +1,185 @@
+"""异步上传任务：上传的数据先写入 spool 目录并立即返回任务 ID，由写入线程在后台录入"""
+from __future__ import annotations
+
+import json
+import os
+import queue
+import re
+import secrets
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .controller import GameDataController
+from .ingest import RAW_DIRECTORIES, parse_tenhou_json, tenhou_parse_id
+from .manifest import raw_file_manifest
+from .writer import GameWriter, game_writer
+
+SPOOL_DIRECTORY = "data/spool"
+"""上传任务目录：<job_id>.json 为等待录入的数据，<job_id>.result.json 为录入结果"""
+
+UPLOAD_SUCCESS = "上传成功"
+UPLOAD_EXISTS = "游戏数据已存在"
+UPLOAD_FAILED = "解析失败"
+UPLOAD_SAVE_FAILED = "保存失败"
+
+_JOB_ID_PATTERN = re.compile(r"[0-9]{20}-[0-9a-f]{8}")
+"""任务 ID：提交时间（按字符串排序即为提交顺序）和随机后缀"""
+
+
+def _write_durably(path: str, data: bytes) -> None:
+    """先写入临时文件并同步到磁盘再替换，返回时文件一定完整"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def ingest_tenhou_upload(
+    controller: GameDataController, payload: Dict[str, str]
+) -> Dict[str, str]:
+    """录入上传的天凤牌谱 {key: game_json}，返回每个 key 的结果
+
+    新的牌谱先保存到天凤牌谱目录（无法保存时不录入），录入后记入清单，
+    下次启动时不需要重新解析"""
+    result = {}
+    file_ids = {}
+    with controller.bulk_ingest():
+        for key, game_json in payload.items():
+            try:
+                game_obj = json.loads(game_json)
+                external_id = tenhou_parse_id(game_obj)
+                if external_id in controller.game_database.external_id_map:
+                    result[key] = UPLOAD_EXISTS
+                    continue
+                game_payload = parse_tenhou_json(game_obj)
+                path = os.path.join(
+                    RAW_DIRECTORIES["tenhou"], f"upload-{external_id}.json"
+                )
+                os.makedirs(RAW_DIRECTORIES["tenhou"], exist_ok=True)
+                with open(path, "w") as f:
+                    f.write(game_json)
+                try:
+                    controller.apply_payload(game_payload)
+                except BaseException:
+                    # 没有录入的牌谱不能留在目录中（否则会被当作新的牌谱文件录入）
+                    os.remove(path)
+                    raise
+                file_ids[path] = external_id
+                result[key] = UPLOAD_SUCCESS
+            except (TypeError, KeyError, ValueError, IndexError, AttributeError) as e:
+                # 包括 JSON 格式错误（json.JSONDecodeError 是 ValueError）和日期格式错误
+                print(f"录入上传的牌谱 {key} 失败：{e!r}", file=sys.stderr)
+                result[key] = UPLOAD_FAILED
+            except OSError as e:
+                print(f"保存上传的牌谱 {key} 失败：{e}", file=sys.stderr)
+                result[key] = UPLOAD_SAVE_FAILED
+    controller.save()
+    if file_ids:
+        raw_file_manifest.update(file_ids, controller.game_database.external_id_map)
+        raw_file_manifest.save()
+    return result
+
+
+class UploadJobs:
+    """上传任务队列：任务数据保存在 spool 目录中，进程退出后重新启动时继续录入"""
+
+    def __init__(self, directory: str, writer: GameWriter):
+        self.directory = directory
+        self.writer = writer
+
+    def payload_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def result_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.result.json")
+
+    def submit(self, data: bytes) -> str:
+        """保存上传的数据（JSON 对象 {key: game_json}，由调用者检查）并加入写入队列，
+        返回任务 ID
+
+        写入队列已满时删除数据并抛出 queue.Full"""
+        os.makedirs(self.directory, exist_ok=True)
+        job_id = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{secrets.token_hex(4)}"
+        path = self.payload_path(job_id)
+        _write_durably(path, data)
+        try:
+            self.enqueue([job_id])
+        except queue.Full:
+            os.remove(path)
+            raise
+        return job_id
+
+    def enqueue(self, job_ids: List[str]) -> None:
+        """在写入线程中按顺序处理这些任务，写入队列已满时抛出 queue.Full"""
+
+        def process_all(controller: GameDataController):
+            for job_id in job_ids:
+                try:
+                    self.process(controller, job_id)
+                except Exception as e:
+                    # 无法保存结果（例如磁盘已满），数据仍保留在 spool 目录中，下次启动时重试
+                    print(f"录入上传任务 {job_id} 失败：{e}", file=sys.stderr)
+
+        self.writer.submit(process_all)
+
+    def process(self, controller: GameDataController, job_id: str) -> None:
+        """录入一个任务的数据，保存结果后删除数据（只在写入线程中调用）
+
+        录入出错时也保存结果（所有 key 均为解析失败），任务不会一直等待或在每次启动时重试"""
+        path = self.payload_path(job_id)
+        try:
+            with open(path, encoding="utf-8") as file:
+                payload = json.load(file)
+        except FileNotFoundError:
+            # 已经由共用 spool 目录的其他进程录入
+            return
+        except ValueError as e:
+            print(f"上传任务 {job_id} 的数据无法读取：{e}", file=sys.stderr)
+            payload = {}
+        try:
+            result = ingest_tenhou_upload(controller, payload)
+        except Exception as e:
+            print(f"录入上传任务 {job_id} 失败：{e!r}", file=sys.stderr)
+            result = {key: UPLOAD_FAILED for key in payload}
+        _write_durably(
+            self.result_path(job_id), json.dumps(result, ensure_ascii=False).encode()
+        )
+        os.remove(path)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """任务状态：{"status": "pending"} 或 {"status": "done", "result": {key: 结果}}
+
+        任务不存在时返回 None"""
+        if not _JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        try:
+            with open(self.result_path(job_id), encoding="utf-8") as file:
+                return {"status": "done", "result": json.load(file)}
+        except FileNotFoundError:
+            pass
+        if os.path.exists(self.payload_path(job_id)):
+            return {"status": "pending"}
+        return None
+
+    def recover(self) -> None:
+        """按提交顺序继续录入上次退出时尚未完成的任务"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        job_ids = sorted(
+            name[: -len(".json")]
+            for name in names
+            if name.endswith(".json")
+            and _JOB_ID_PATTERN.fullmatch(name[: -len(".json")])
+        )
+        if job_ids:
+            print(f"继续录入 {len(job_ids)} 个上传任务", file=sys.stderr)
+            self.enqueue(job_ids)
+
+
+upload_jobs = UploadJobs(SPOOL_DIRECTORY, game_writer)
+"""全局上传任务队列"""
@@ -0,0 +1,126 @@
+"""监视牌谱目录：运行期间放入的牌谱文件在后台解析，由写入线程录入，不需要重启"""
+from __future__ import annotations
+
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from .controller import GameDataController
+from .ingest import RAW_DIRECTORIES, parse_raw_files
+from .manifest import RawFileManifest, raw_file_manifest
+from .writer import GameWriter, game_writer
+
+WATCH_INTERVAL = float(os.getenv("WDK_WATCH_INTERVAL", "5"))
+"""检查牌谱目录的间隔（秒），为 0 时不监视"""
+
+
+class RawFileWatcher:
+    """定期检查牌谱目录，录入新增的文件
+
+    只有修改时间变化的目录才重新列出文件，只有新出现的文件需要读取状态；
+    文件的大小和修改时间在两次检查之间没有变化（已经写完）后才读取，
+    在本线程中解析，然后交给写入线程按照游戏时间顺序录入；
+    录入后文件记入清单，之后不再读取（无法读取的文件在变化后重新读取）"""
+
+    def __init__(self, manifest: RawFileManifest, writer: GameWriter, interval: float):
+        self.manifest = manifest
+        self.writer = writer
+        self.interval = interval
+        self.thread: Optional[threading.Thread] = None
+        self.start_lock = threading.Lock()
+        # 每个目录上次列出文件时的 (修改时间, 文件名)
+        self.listed: Dict[str, Tuple[int, Set[str]]] = {}
+        # 新出现、尚未录入的文件：(来源, 上次检查时的状态)
+        self.waiting: Dict[str, Tuple[str, Optional[os.stat_result]]] = {}
+
+    def start(self):
+        """启动线程（只在处理请求的进程中调用，uWSGI 中为 fork 之后的工作进程）"""
+        if self.interval <= 0:
+            return
+        with self.start_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="raw-file-watcher", daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"录入新的牌谱文件失败：{e}", file=sys.stderr)
+
+    def scan(self) -> List[Tuple[str, str, os.stat_result]]:
+        """找出已经写完、需要读取的新文件 (地址, 来源, 状态)"""
+        for source, directory in RAW_DIRECTORIES.items():
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            listed = self.listed.get(directory)
+            if listed is not None and listed[0] == mtime_ns:
+                continue
+            names = set(os.listdir(directory))
+            for name in names - (listed[1] if listed is not None else set()):
+                self.waiting[os.path.join(directory, name)] = (source, None)
+            self.listed[directory] = (mtime_ns, names)
+
+        ready = []
+        for path, (source, last) in list(self.waiting.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.waiting[path]
+                continue
+            record = self.manifest.unchanged_record(path, stat)
+            if record is not None:
+                # 无法读取的文件（可能读取时还没有写完）继续等待，变化后重新读取
+                if record.external_id is None:
+                    self.waiting[path] = (source, stat)
+                else:
+                    del self.waiting[path]
+            elif (
+                last is not None
+                and last.st_size == stat.st_size
+                and last.st_mtime_ns == stat.st_mtime_ns
+            ):
+                ready.append((path, source, stat))
+            else:
+                # 新出现或者仍在写入，下次检查时再读取
+                self.waiting[path] = (source, stat)
+        return ready
+
+    def poll(self) -> None:
+        """检查一次，并等待新文件录入完成"""
+        ready = self.scan()
+        if not ready:
+            return
+        files = [(path, source) for path, source, _ in ready]
+        stats = {path: stat for path, _, stat in ready}
+        # 后台线程中不能安全地 fork，只在本进程中解析
+        payloads, file_ids = parse_raw_files(
+            files, self.writer.controller.game_database.external_id_map, processes=1
+        )
+
+        def ingest(controller: GameDataController) -> None:
+            controller.apply_payloads(payloads)
+            controller.save()
+            self.manifest.pending.update(stats)
+            self.manifest.update(file_ids, controller.game_database.external_id_map)
+            self.manifest.save()
+
+        print(f"录入 {len(files)} 个新的牌谱文件", file=sys.stderr)
+        try:
+            self.writer.submit(ingest).result()
+        except queue.Full:
+            # 文件仍在等待中，下次检查时重试
+            pass
+
+
+raw_file_watcher = RawFileWatcher(raw_file_manifest, game_writer, WATCH_INTERVAL)
+"""全局牌谱目录监视线程"""
@@ -0,0 +1,186 @@
+"""写入线程：所有修改游戏和玩家数据的操作按顺序在同一个线程中执行
+
+读取请求只使用写入线程发布的不可变快照，不需要等待积分计算；
+多个进程共用 SQLite 数据库时，写入前持有文件锁，空闲时定期读取其他进程保存的变化"""
+from __future__ import annotations
+
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from .controller import GameDataController, game_controller
+from .game.game_database import history_position, history_range
+from .game_preview import GamePreview
+from .io import ListPrefix
+from .player.player_data import PlayerData
+from .player.player_database import leader_board_as_of
+from .player_snapshot import PlayerSnapshot
+from .sqlite_database import change_feed
+from .updates import UpdateFeed, update_feed
+
+WRITE_QUEUE_SIZE = int(os.getenv("WDK_WRITE_QUEUE_SIZE", "64"))
+"""写入队列的最大长度，队列已满时拒绝新的写入"""
+
+PUBLISH_INTERVAL = 16
+"""队列一直不空时，最多执行这么多个任务后发布一次快照"""
+
+SYNC_INTERVAL = float(os.getenv("WDK_SYNC_INTERVAL", "1"))
+"""多进程共用 SQLite 数据库时，空闲的写入线程读取其他进程变化的间隔（秒）"""
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class DataSnapshot:
+    """某一时刻的排行榜、玩家和游戏历史，发布后不再修改（其中的对象与数据库共享）
+
+    追溯计算积分时游戏摘要会被原地修改，这时读取可能看到部分更新的摘要，
+    计算结束后发布的快照版本不同，缓存的响应会重新生成"""
+
+    version: int
+    """数据版本，见 GameDataController.version"""
+
+    leader_board: Sequence[PlayerSnapshot]
+    """按照名次排序的玩家快照（数据库每次生成新的列表，不会原地修改）"""
+
+    game_history: Sequence[GamePreview]
+    """按时间顺序排列的游戏记录"""
+
+    game_history_by_type: Dict[str, Sequence[GamePreview]]
+    """按游戏类型名称分组、按时间顺序排列的游戏记录"""
+
+    previews: Dict[str, GamePreview]
+    """每盘游戏的摘要（与数据库共享，只用于按 ID 查找，可能包含之后添加的游戏）"""
+
+    players: Dict[str, PlayerData]
+    """每个玩家的只读副本（按创建顺序），见 PlayerData.view
+
+    积分序列在写入线程中只会在末尾追加；副本没有积分序列时在第一次读取时生成"""
+
+    @classmethod
+    def capture(cls, controller: GameDataController) -> DataSnapshot:
+        """记录当前的数据：游戏记录只在末尾追加，只记录其长度（见 ListPrefix），
+        只复制上次之后有变化的玩家，不随游戏数量增长"""
+        game_database = controller.game_database
+        return cls(
+            version=controller.version,
+            leader_board=controller.player_database.leader_board,
+            game_history=ListPrefix(game_database.game_history),
+            game_history_by_type={
+                game_type: ListPrefix(history)
+                for game_type, history in game_database.game_history_by_type.items()
+            },
+            previews=game_database.previews,
+            players=controller.player_database.player_views(),
+        )
+
+    def query_history(
+        self,
+        game_type: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Tuple[Sequence[GamePreview], int, int]:
+        """同 GameDatabase.query_history"""
+        if game_type is None:
+            history = self.game_history
+        else:
+            history = self.game_history_by_type.get(game_type, ())
+        return history, *history_range(history, start, end)
+
+    def history_index(self, history: Sequence[GamePreview], game_id: str) -> int:
+        """同 GameDatabase.history_index，游戏已被删除时抛出 KeyError"""
+        return history_position(history, self.previews[game_id].date, game_id)
+
+    def leader_board_as_of(self, date: datetime) -> List[PlayerSnapshot]:
+        """date 之前（不包含）进行过游戏的玩家当时的快照，按照当时的名次排序"""
+        return leader_board_as_of(self.players.values(), date)
+
+
+class GameWriter:
+    """唯一修改数据的线程，按加入队列的顺序执行写入任务（任务需要在结束前保存数据）
+
+    队列空闲（或连续执行 PUBLISH_INTERVAL 个任务）后发布新的快照并推送变化，
+    然后才完成这些任务的 Future，因此提交者之后的读取能看到自己的写入"""
+
+    def __init__(self, controller: GameDataController, feed: UpdateFeed):
+        self.controller = controller
+        self.feed = feed
+        self.tasks: queue.Queue = queue.Queue(WRITE_QUEUE_SIZE)
+        self.thread: Optional[threading.Thread] = None
+        self.start_lock = threading.Lock()
+        self.published = DataSnapshot.capture(controller)
+        # 启动时录入的游戏不需要推送
+        controller.take_updates()
+        feed.reset(self.published.version)
+
+    def submit(self, task: Callable[[GameDataController], T]) -> Future[T]:
+        """将写入任务加入队列，队列已满时抛出 queue.Full"""
+        self.start()
+        future: Future[T] = Future()
+        self.tasks.put_nowait((task, future))
+        return future
+
+    @property
+    def snapshot(self) -> DataSnapshot:
+        """最新发布的快照，读取时直接使用（替换引用是原子操作）
+
+        多进程共用数据库时，第一次读取即启动线程，以便定期读取其他进程的变化"""
+        if change_feed is not None:
+            self.start()
+        return self.published
+
+    def start(self):
+        """第一次使用时启动线程（fork 之后的子进程中会重新启动）"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.start_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="game-writer", daemon=True
+                )
+                self.thread.start()
+
+    def publish(self):
+        """发布当前数据的快照，并向订阅者推送之后的变化"""
+        self.published = DataSnapshot.capture(self.controller)
+        self.feed.publish(self.published.version, self.controller.take_updates())
+
+    def run(self):
+        finished: List[Tuple[Future, bool, object]] = []
+        timeout = None if change_feed is None else SYNC_INTERVAL
+        while True:
+            try:
+                task, future = self.tasks.get(timeout=timeout)
+            except queue.Empty:
+                # 空闲时读取其他进程保存的变化
+                try:
+                    if self.controller.poll_changes():
+                        self.publish()
+                except Exception as e:
+                    print(f"读取其他进程的变化失败：{e}", file=sys.stderr)
+                continue
+            if future.set_running_or_notify_cancel():
+                try:
+                    with self.controller.exclusive():
+                        finished.append((future, True, task(self.controller)))
+                except Exception as e:
+                    finished.append((future, False, e))
+            if self.tasks.empty() or len(finished) >= PUBLISH_INTERVAL:
+                try:
+                    self.publish()
+                finally:
+                    for future, ok, value in finished:
+                        if ok:
+                            future.set_result(value)
+                        else:
+                            future.set_exception(value)
+                    finished = []
+
+
+game_writer = GameWriter(game_controller, update_feed)
+"""全局写入线程"""
@@ -5,6 +5,7 @@ from pprint import pprint
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 from api import *
+from game_data import raw_file_watcher, upload_jobs
 from data.keys import KEY_HASHED
 from hashlib import sha3_256
 
@@ -14,18 +15,38 @@ IS_DEVELOPMENT_MODE = os.getenv("FLASK_ENV") == "development"
 """开发环境"""
 
 if IS_DEVELOPMENT_MODE:
-    CORS(app)
+    CORS(app, expose_headers=["X-Total-Count", "X-Next-Cursor", "X-Data-Version"])
 
 
 # 访问路径
 app.register_blueprint(access_blueprint, url_prefix="/api/access")
 app.register_blueprint(query_blueprint, url_prefix="/api/query")
 app.register_blueprint(post_blueprint, url_prefix="/api/post")
+app.register_blueprint(stream_blueprint, url_prefix="/api/stream")
 
 # 错误处理
 app.register_error_handler(InvalidIdException, invalid_id_handler)
 
 
+def start_background_tasks():
+    """在处理请求的进程中启动后台任务
+
+    uWSGI 的主进程导入应用后 fork 出工作进程，主进程不处理请求，后台任务只在工作进程中启动"""
+    # 继续录入上次退出时尚未完成的上传
+    upload_jobs.recover()
+    # 监视牌谱目录，录入运行期间放入的文件
+    raw_file_watcher.start()
+
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    # 不在 uWSGI 中运行（例如开发服务器），直接启动
+    start_background_tasks()
+else:
+    postfork(start_background_tasks)
+
+
 @app.before_request
 def check_key():
     """检查密钥，如不符合则拒绝访问"""
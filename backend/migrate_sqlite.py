@@ -0,0 +1,36 @@
+"""将 gzip 快照 + 日志格式的数据库迁移到 SQLite
+
+用法：python migrate_sqlite.py [SQLite 文件地址]
+
+需要在默认存储方式下运行（不设置 WDK_STORAGE_ENGINE=sqlite），
+迁移完成后设置 WDK_STORAGE_ENGINE=sqlite 启动服务即可"""
+import sys
+
+from game_data import game_database, player_database
+from game_data.game.game_storage import SqliteGameStorage
+from game_data.player.player_storage import SqlitePlayerStorage
+from game_data.sqlite_database import SQLITE_PATH, STORAGE_ENGINE
+
+if STORAGE_ENGINE == "sqlite":
+    sys.exit("当前已经使用 SQLite 存储，请在默认存储方式下运行迁移")
+
+path = sys.argv[1] if len(sys.argv) > 1 else SQLITE_PATH
+game_storage = SqliteGameStorage(path)
+player_storage = SqlitePlayerStorage(path)
+if game_storage.load_games() or player_storage.load_players():
+    sys.exit(f"{path} 中已有数据，请先删除")
+
+# 先写入游戏，再写入玩家（玩家的游戏记录依赖 game_results 表）
+# 内存中的游戏不含牌局细节，逐盘从细节目录读取完整的游戏后写入
+for game_id, game in game_database.all_game_data.items():
+    full_game = game_database.storage.load_game_detail(game_id)
+    if full_game is not None:
+        game_database.all_game_data[game_id] = full_game
+    game_storage.save_games(game_database, [game_id])
+player_storage.save_players(
+    player_database, [(p, 0) for p in player_database.all_player_data.values()]
+)
+print(
+    f"已迁移 {len(game_database.all_game_data)} 盘游戏、"
+    f"{len(player_database.all_player_data)} 名玩家至 {path}"
+)
@@ -0,0 +1,18 @@
+"""按照时间顺序重新计算所有游戏的积分和所有玩家的数据，并保存
+
+用法：python recompute_ratings.py
+
+修改积分规则（例如 PT_DELTA、GameType 的乘数）之后运行，运行前请停止服务并备份数据；
+旧版本中游戏不按时间顺序录入时计算的积分也只在运行这个脚本时修正"""
+import time
+
+from game_data import game_controller, game_database, player_database
+
+start = time.perf_counter()
+game_controller.recompute_ratings()
+elapsed = time.perf_counter() - start
+game_controller.save()
+print(
+    f"已重新计算 {len(game_database.all_game_data)} 盘游戏、"
+    f"{len(player_database.all_player_data)} 名玩家的积分（用时 {elapsed:.2f}s）"
+)